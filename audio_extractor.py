@@ -1,7 +1,22 @@
 import os
 import sys
-from moviepy.editor import VideoFileClip
 import argparse
+import threading
+import subprocess
+from ffmpeg_utils import find_ffmpeg, probe_audio_codec, run_ffmpeg
+from metrics import METRICS
+
+# 目标格式 -> (可直接复制的源编码, 需要转码时的ffmpeg编码参数)
+AUDIO_CODECS = {
+    'mp3': (('mp3',), ['-c:a', 'libmp3lame', '-b:a', '36k']),
+    'aac': (('aac',), ['-c:a', 'aac', '-b:a', '36k']),
+    # CNTV的音轨为AAC，提取为m4a时直接复制，不经过有损转码
+    'm4a': (('aac',), ['-c:a', 'aac', '-b:a', '36k']),
+    # 语音识别预处理的中间格式：无损、16kHz单声道，之后只经过一次有损编码
+    'flac': (('flac',), ['-c:a', 'flac', '-ac', '1', '-ar', '16000']),
+    'ogg': (('vorbis', 'opus'), ['-c:a', 'libopus', '-b:a', '36k']),
+    'wav': (('pcm_s16le',), ['-c:a', 'pcm_s16le']),
+}
 
 def extract_audio_from_video(video_path, audio_path=None, audio_format='mp3'):
     """
@@ -15,6 +30,11 @@ def extract_audio_from_video(video_path, audio_path=None, audio_format='mp3'):
     Returns:
         bool: 提取是否成功
     """
+    with METRICS.stage('extract'):
+        return _extract_audio_from_video(video_path, audio_path, audio_format)
+
+
+def _extract_audio_from_video(video_path, audio_path, audio_format):
     try:
         # 检查输入文件是否存在
         if not os.path.exists(video_path):
@@ -26,34 +46,26 @@ def extract_audio_from_video(video_path, audio_path=None, audio_format='mp3'):
             base_name = os.path.splitext(video_path)[0]
             audio_path = f"{base_name}.{audio_format}"
         
-        print(f"正在从视频文件提取音频...")
+        print("正在从视频文件提取音频...")
         print(f"输入文件: {video_path}")
         print(f"输出文件: {audio_path}")
         
-        # 加载视频文件
-        video = VideoFileClip(video_path)
-        
-        # 提取音频
-        audio = video.audio
-        
-        if audio is None:
-            print("错误: 视频文件没有音频轨道")
-            video.close()
+        ffmpeg = find_ffmpeg()
+        if ffmpeg:
+            success = _extract_with_ffmpeg(video_path, audio_path, audio_format, ffmpeg)
+        else:
+            print("未找到ffmpeg，使用moviepy提取")
+            success = _extract_with_moviepy(video_path, audio_path)
+        if not success:
             return False
         
-        # 保存音频文件
-        audio.write_audiofile(audio_path, logger="bar",bitrate="36k")
-        
-        # 关闭文件
-        audio.close()
-        video.close()
-        
-        print(f"✅ 音频提取成功！")
+        print("✅ 音频提取成功！")
         print(f"输出文件: {audio_path}")
         
         # 显示文件大小信息
         if os.path.exists(audio_path):
             file_size = os.path.getsize(audio_path)
+            METRICS.add_bytes('extract', file_size)
             file_size_mb = file_size / (1024 * 1024)
             print(f"音频文件大小: {file_size_mb:.2f} MB")
         
@@ -63,12 +75,168 @@ def extract_audio_from_video(video_path, audio_path=None, audio_format='mp3'):
         print(f"❌ 音频提取失败: {str(e)}")
         return False
 
+def _extract_with_ffmpeg(video_path, audio_path, audio_format, ffmpeg):
+    """
+    直接调用ffmpeg提取音频，不经过Python解码
+
+    源音轨编码与目标格式一致时使用 -c:a copy 直接解复用，否则单次转码。
+    """
+    copyable, encode_args = AUDIO_CODECS.get(audio_format, AUDIO_CODECS['mp3'])
+    codec = probe_audio_codec(video_path)
+    if codec is None and find_ffmpeg("ffprobe"):
+        print("错误: 视频文件没有音频轨道")
+        return False
+    if codec in copyable:
+        print(f"音轨编码为 {codec}，直接复制")
+        if run_ffmpeg(['-i', video_path, '-vn', '-map', '0:a:0', '-c:a', 'copy', audio_path], ffmpeg=ffmpeg):
+            return True
+        print("直接复制失败，改为转码")
+    return run_ffmpeg(['-i', video_path, '-vn', '-map', '0:a:0'] + encode_args + [audio_path], ffmpeg=ffmpeg)
+
+
+def _extract_with_moviepy(video_path, audio_path):
+    """备用方案：用moviepy解码并重新编码音频"""
+    try:
+        from moviepy.editor import VideoFileClip
+    except ImportError:
+        print("错误: 未找到ffmpeg，也未安装 moviepy")
+        return False
+
+    # 加载视频文件
+    video = VideoFileClip(video_path)
+    
+    # 提取音频
+    audio = video.audio
+    
+    if audio is None:
+        print("错误: 视频文件没有音频轨道")
+        video.close()
+        return False
+    
+    # 保存音频文件
+    audio.write_audiofile(audio_path, logger="bar",bitrate="36k")
+    
+    # 关闭文件
+    audio.close()
+    video.close()
+    return True
+
+class IncrementalAudioExtractor:
+    """
+    从按顺序到达的MPEG-TS字节流中增量提取音频
+
+    write() 收到的ts数据经stdin送入常驻的ffmpeg进程，ffmpeg按 window_seconds
+    把音轨切成独立的音频窗口；每完成一个窗口就回调 on_window(path, start, end)，
+    其中 start/end 为窗口在节目中的时间（秒，以第一个窗口为0）。
+    可作为 M3U8Downloader.segment_sink 使用，实现边下载边提取。
+    ffmpeg出错时只把自身标记为失败，不影响下载。
+    """
+
+    def __init__(self, output_dir, window_seconds=180, on_window=None, audio_format='mp3'):
+        """
+        Args:
+            output_dir: 音频窗口输出目录
+            window_seconds: 每个窗口的时长（秒）
+            on_window: 窗口完成回调 on_window(path, start, end)
+            audio_format: 窗口的音频格式
+        """
+        self.output_dir = output_dir
+        self.window_seconds = window_seconds
+        self.on_window = on_window
+        self.audio_format = audio_format
+        self.failed = False
+        self.windows = []
+        self._process = None
+        self._list_path = os.path.join(output_dir, "windows.csv")
+        self._base = None
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动ffmpeg，没有ffmpeg时返回False"""
+        ffmpeg = find_ffmpeg()
+        if not ffmpeg:
+            return False
+        os.makedirs(self.output_dir, exist_ok=True)
+        _, encode_args = AUDIO_CODECS.get(self.audio_format, AUDIO_CODECS['mp3'])
+        self._log = open(os.path.join(self.output_dir, "ffmpeg.log"), 'wb')
+        self._process = subprocess.Popen(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+             '-f', 'mpegts', '-i', 'pipe:0', '-vn', '-map', '0:a:0'] + encode_args + [
+             '-f', 'segment', '-segment_time', str(self.window_seconds), '-reset_timestamps', '1',
+             '-segment_list', self._list_path, '-segment_list_type', 'csv',
+             os.path.join(self.output_dir, f"window_%04d.{self.audio_format}")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._log
+        )
+        self._watcher.start()
+        return True
+
+    def write(self, data):
+        if self.failed or self._process is None:
+            return
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            print(f"增量音频提取失败: {e}")
+            self.failed = True
+
+    def finish(self):
+        """输入结束，等待ffmpeg写完最后一个窗口。返回是否成功"""
+        if self._process is None:
+            return False
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        returncode = self._process.wait()
+        self._stop.set()
+        self._watcher.join()
+        self._poll()
+        self._log.close()
+        if returncode != 0:
+            print(f"增量音频提取失败，ffmpeg退出码 {returncode}，详见 {self._log.name}")
+            self.failed = True
+        return not self.failed
+
+    def abort(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        self.failed = True
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(0.5):
+            self._poll()
+
+    def _poll(self):
+        """读取ffmpeg的分段列表，回调新完成的窗口"""
+        with self._lock:
+            try:
+                with open(self._list_path, 'r', encoding='utf-8') as fp:
+                    lines = fp.read().split('\n')[:-1]
+            except OSError:
+                return
+            for line in lines[len(self.windows):]:
+                name, start, end = line.rsplit(',', 2)
+                start, end = float(start), float(end)
+                if self._base is None:
+                    self._base = start
+                window = (os.path.join(self.output_dir, name), start - self._base, end - self._base)
+                self.windows.append(window)
+                if self.on_window:
+                    self.on_window(*window)
+
+
 def main():
     """主函数，处理命令行参数"""
     parser = argparse.ArgumentParser(description='从视频文件中提取音频')
     parser.add_argument('video_path', help='输入视频文件路径')
     parser.add_argument('-o', '--output', help='输出音频文件路径')
-    parser.add_argument('-f', '--format', default='mp3', choices=['mp3', 'wav', 'aac', 'ogg'], 
+    parser.add_argument('-f', '--format', default='mp3', choices=['mp3', 'm4a', 'wav', 'aac', 'ogg'], 
                        help='音频格式 (默认: mp3)')
     
     args = parser.parse_args()
@@ -0,0 +1,325 @@
+import os
+import json
+import bisect
+import argparse
+import importlib.util
+import subprocess
+
+from ffmpeg_utils import find_ffmpeg, run_ffmpeg
+from metrics import METRICS
+
+SAMPLE_RATE = 16000
+# 语音识别用的编码：16kHz单声道，Opus按语音模式低码率编码，FLAC无损
+ASR_CODECS = {
+    'opus': ('.ogg', ['-c:a', 'libopus', '-b:a', '16k', '-application', 'voip']),
+    'flac': ('.flac', ['-c:a', 'flac', '-compression_level', '8']),
+}
+
+
+class OffsetMap:
+    """
+    裁剪后音频时间与原节目时间的对应
+
+    spans 是保留下来的原音频区间 [(start, end), ...]（采样点，升序不重叠），
+    依次拼接成裁剪后的音频。
+    """
+
+    def __init__(self, spans, sample_rate=SAMPLE_RATE):
+        self.spans = [(int(start), int(end)) for start, end in spans]
+        self.sample_rate = sample_rate
+        # 每个保留区间在裁剪后音频中的起点
+        self._trimmed_starts = []
+        position = 0
+        for start, end in self.spans:
+            self._trimmed_starts.append(position)
+            position += end - start
+        self.trimmed_samples = position
+
+    @property
+    def trimmed_seconds(self):
+        return self.trimmed_samples / self.sample_rate
+
+    def to_original(self, seconds, end=False):
+        """
+        把裁剪后音频中的时间换算为原节目时间
+
+        Args:
+            seconds: 裁剪后音频中的时间（秒）
+            end: 是否为区间终点；恰好落在两个保留区间交界处时，终点归前一个区间，起点归后一个区间
+        """
+        if not self.spans:
+            return seconds
+        sample = seconds * self.sample_rate
+        if end:
+            index = bisect.bisect_left(self._trimmed_starts, sample) - 1
+        else:
+            index = bisect.bisect_right(self._trimmed_starts, sample) - 1
+        index = min(max(index, 0), len(self.spans) - 1)
+        start, end_sample = self.spans[index]
+        original = start + sample - self._trimmed_starts[index]
+        return min(max(original, start), end_sample) / self.sample_rate
+
+    def remap(self, segments):
+        """把转写结果（含words）的时间戳换算回原节目时间"""
+        remapped = []
+        for segment in segments:
+            segment = dict(segment)
+            segment['start'] = self.to_original(segment['start'])
+            segment['end'] = self.to_original(segment['end'], end=True)
+            if isinstance(segment.get('words'), list):
+                segment['words'] = [
+                    dict(word, start=self.to_original(word['start']), end=self.to_original(word['end'], end=True))
+                    if 'start' in word and 'end' in word else word
+                    for word in segment['words']
+                ]
+            remapped.append(segment)
+        return remapped
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({'sample_rate': self.sample_rate, 'spans': self.spans}, fp)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as fp:
+            data = json.load(fp)
+        return cls(data['spans'], data['sample_rate'])
+
+    @classmethod
+    def for_audio(cls, audio_path):
+        """读取 prepare_audio() 写在音频旁边的对应表；没有时返回None"""
+        path = offsets_path(audio_path)
+        return cls.load(path) if os.path.exists(path) else None
+
+
+def offsets_path(audio_path):
+    return audio_path + '.offsets.json'
+
+
+def frame_energy_db(samples, frame_samples, block_frames=8192):
+    """
+    每帧的能量（dBFS），按块向量化计算，避免整段转成浮点数组
+
+    Args:
+        samples: int16单声道采样
+        frame_samples: 每帧采样数，末尾不足一帧的部分忽略
+    """
+    import numpy as np
+
+    frames = len(samples) // frame_samples
+    energy = np.empty(frames, dtype=np.float64)
+    framed = samples[:frames * frame_samples].reshape(frames, frame_samples)
+    for first in range(0, frames, block_frames):
+        block = framed[first:first + block_frames].astype(np.float32) / 32768.0
+        energy[first:first + block_frames] = np.einsum('ij,ij->i', block, block) / frame_samples
+    return 10 * np.log10(energy + 1e-10)
+
+
+def _runs(mask):
+    """布尔数组中True的连续段 [(start, end), ...]"""
+    import numpy as np
+
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+
+def detect_speech(samples, sample_rate=SAMPLE_RATE, frame_ms=30, margin_db=12, floor_db=-55,
+                  min_silence=0.8, pad=0.2):
+    """
+    基于帧能量的语音检测，返回需要保留的区间
+
+    阈值取噪声底（第10百分位帧能量）加 margin_db，但不低于 floor_db，也不高于响亮部分（第90百分位）
+    以下15dB，整段都是语音时不会误切。低于阈值且持续 min_silence 秒以上的区间才会被切掉，
+    切口两侧各保留 pad 秒静音，句子之间的停顿与词首词尾不受影响。
+
+    Args:
+        samples: int16单声道采样
+        sample_rate: 采样率
+        frame_ms: 帧长（毫秒）
+        margin_db: 阈值高出噪声底的分贝数
+        floor_db: 阈值下限（dBFS）
+        min_silence: 最短切除时长（秒）
+        pad: 切口两侧保留的静音（秒）
+    Returns:
+        list: 保留区间 [(start, end), ...]，单位为采样点
+    """
+    import numpy as np
+
+    total = len(samples)
+    frame_samples = max(1, int(sample_rate * frame_ms / 1000))
+    energy = frame_energy_db(samples, frame_samples)
+    if len(energy) == 0:
+        return [(0, total)] if total else []
+    noise, loud = np.percentile(energy, [10, 90])
+    threshold = min(max(noise + margin_db, floor_db), loud - 15)
+
+    pad_frames = int(round(pad * sample_rate / frame_samples))
+    min_frames = max(int(round(min_silence * sample_rate / frame_samples)), 2 * pad_frames + 1)
+    cuts = []
+    for start, end in _runs(energy <= threshold):
+        # 开头和结尾的静音只在靠近语音的一侧保留pad
+        head = 0 if start == 0 else pad_frames
+        tail = 0 if end == len(energy) else pad_frames
+        if end - start >= min_frames and end - start > head + tail:
+            cuts.append(((start + head) * frame_samples, (end - tail) * frame_samples))
+    if cuts and cuts[-1][1] == len(energy) * frame_samples:
+        # 末尾不足一帧的采样随最后的静音一起切掉
+        cuts[-1] = (cuts[-1][0], total)
+
+    spans = []
+    position = 0
+    for start, end in cuts:
+        if start > position:
+            spans.append((position, start))
+        position = end
+    if position < total:
+        spans.append((position, total))
+    return spans
+
+
+def decode_pcm(path, sample_rate=SAMPLE_RATE, ffmpeg=None):
+    """
+    用ffmpeg把音频/视频解码为单声道int16采样
+
+    Returns:
+        numpy.ndarray: 采样；失败时返回None
+    """
+    import numpy as np
+
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        print("错误: 未找到ffmpeg")
+        return None
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', path,
+         '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        print(f"ffmpeg解码失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return None
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def encode_pcm(samples, output_path, codec='opus', sample_rate=SAMPLE_RATE, ffmpeg=None):
+    """把单声道int16采样编码为语音识别用的音频文件"""
+    _, encode_args = ASR_CODECS[codec]
+    return run_ffmpeg(['-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-']
+                      + encode_args + [output_path], ffmpeg=ffmpeg, input_data=samples.tobytes())
+
+
+def trim_silence(samples, sample_rate=SAMPLE_RATE, **vad_args):
+    """
+    切掉非语音区间
+
+    Returns:
+        tuple: (裁剪后的采样, OffsetMap)
+    """
+    import numpy as np
+
+    spans = detect_speech(samples, sample_rate, **vad_args)
+    if not spans:
+        return samples[:0], OffsetMap([], sample_rate)
+    trimmed = np.concatenate([samples[start:end] for start, end in spans])
+    return trimmed, OffsetMap(spans, sample_rate)
+
+
+def prepare_audio(input_path, output_path=None, codec='opus', trim=True, **vad_args):
+    """
+    生成语音识别用的音频：16kHz单声道、语音编码，切掉静音与长停顿
+
+    时间对应表写在 <output_path>.offsets.json，转写完成后用它把时间戳换算回原节目时间。
+
+    Args:
+        input_path: 输入音频或视频
+        output_path: 输出路径，默认与输入同名、扩展名为 .asr.ogg / .asr.flac
+        codec: 'opus' 或 'flac'
+        trim: 是否切除非语音区间
+        vad_args: 传给 detect_speech() 的参数
+    Returns:
+        str: 输出路径；失败时返回None
+    """
+    with METRICS.stage('prepare'):
+        return _prepare_audio(input_path, output_path, codec, trim, vad_args)
+
+
+def _prepare_audio(input_path, output_path, codec, trim, vad_args):
+    if codec not in ASR_CODECS:
+        print(f"错误: 不支持的编码 '{codec}'")
+        return None
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + '.asr' + ASR_CODECS[codec][0]
+
+    samples = decode_pcm(input_path)
+    if samples is None or len(samples) == 0:
+        return None
+    if trim:
+        trimmed, offset_map = trim_silence(samples, SAMPLE_RATE, **vad_args)
+    else:
+        trimmed, offset_map = samples, OffsetMap([(0, len(samples))], SAMPLE_RATE)
+    if len(trimmed) == 0:
+        print("没有检测到语音")
+        return None
+    if not encode_pcm(trimmed, output_path, codec):
+        return None
+    offset_map.save(offsets_path(output_path))
+
+    original_seconds = len(samples) / SAMPLE_RATE
+    size = os.path.getsize(output_path)
+    METRICS.add_bytes('prepare', size)
+    METRICS.observe('asr_audio_seconds', offset_map.trimmed_seconds)
+    METRICS.observe('asr_trimmed_seconds', original_seconds - offset_map.trimmed_seconds)
+    print(f"语音识别音频: {original_seconds:.0f}s → {offset_map.trimmed_seconds:.0f}s "
+          f"({len(offset_map.spans)} 段), {size / 1024 / 1024:.2f} MB")
+    return output_path
+
+
+def require_numpy():
+    """
+    确认已安装 numpy
+
+    缺少 numpy 属于环境问题，抛出 RuntimeError 让本次运行失败，而不是每期都静默上传原音频
+    """
+    if importlib.util.find_spec('numpy') is None:
+        raise RuntimeError("音频预处理需要安装 numpy (pip install -r requirements.txt)")
+
+
+def prepare_for_asr(audio_path, codec='opus'):
+    """
+    prepare_audio() 的容错版本：codec为 'off' 或预处理失败时返回原音频路径；缺少 numpy 时抛出 RuntimeError
+    """
+    if codec == 'off':
+        return audio_path
+    require_numpy()
+    try:
+        prepared = prepare_audio(audio_path, codec=codec)
+    except Exception as e:
+        print(f"音频预处理出错: {e}")
+        prepared = None
+    if prepared is None:
+        print("音频预处理失败，上传原音频")
+        return audio_path
+    return prepared
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成语音识别用的音频（16kHz单声道，切除静音）')
+    parser.add_argument('input', help='输入音频或视频文件')
+    parser.add_argument('-o', '--output', help='输出路径 (默认: <输入>.asr.ogg)')
+    parser.add_argument('--codec', default='opus', choices=list(ASR_CODECS), help='编码 (默认: opus)')
+    parser.add_argument('--no-trim', action='store_true', help='不切除非语音区间')
+    parser.add_argument('--min-silence', type=float, default=0.8, help='最短切除时长，秒 (默认: 0.8)')
+    args = parser.parse_args()
+
+    output = prepare_audio(args.input, args.output, args.codec, trim=not args.no_trim,
+                           min_silence=args.min_silence)
+    if output:
+        print(f"✅ 输出文件: {output}")
+        print(f"时间对应表: {offsets_path(output)}")
+
+
+if __name__ == "__main__":
+    main()
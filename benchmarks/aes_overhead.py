@@ -0,0 +1,152 @@
+"""
+AES-128 加密HLS的下载开销
+
+启动两个合成HLS服务（见 hls_server.py），片段内容相同，其中一个以 AES-128 加密并提供密钥。
+交替下载多轮，比较明文与加密两种情况 MB/秒 的中位数，并确认解密后的输出与明文下载逐字节一致、
+密钥在每次任务中只请求一次。需要安装 cryptography，不需要外网。
+服务运行在子进程中，不与下载器争抢GIL。解密在下载线程中按64KB块进行，单线程约2GB/s，
+每MB/s下载速度约占单核0.05%的CPU：受带宽限制时（--bandwidth-mb）开销只有几个百分点；
+不限速时下载器本身跑满CPU，解密与多一次的内存复制会直接体现为吞吐下降（本地回环实测6%~19%）。
+吞吐开销超过 --max-overhead 时以非零状态退出：默认限速时为5%，不限速时为25%。
+
+用法: python benchmarks/aes_overhead.py [--rounds 3] [--workers 16] [--segments 200] [--bandwidth-mb 40] [--max-overhead 5]
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import statistics
+import contextlib
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from hls_crypto import SegmentDecryptor, crypto_available, encrypt_segment  # noqa: E402
+from hls_server import add_arguments, from_arguments  # noqa: E402
+
+
+def download(url, workers, stream):
+    """下载一次，返回 (是否成功, 秒数, 字节数, 输出sha256)"""
+    from m3u8_downloader import M3U8Downloader
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        downloader = M3U8Downloader(max_workers=workers, stream=stream, container='ts')
+        started = time.monotonic()
+        with contextlib.redirect_stdout(sys.stderr):
+            ok = downloader.download_m3u8(url, output_dir, 'bench')
+        seconds = time.monotonic() - started
+        if not ok:
+            return False, seconds, 0, None
+        digest = hashlib.sha256()
+        with open(downloader.output_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return True, seconds, os.path.getsize(downloader.output_path), digest.hexdigest()
+
+
+def serve(args, encrypt, conn):
+    """子进程：启动合成HLS服务，发回媒体播放列表地址；收到停止信号后发回密钥请求次数"""
+    args.encrypt = encrypt
+    service = from_arguments(args, seed=0)
+    service.start()
+    conn.send(service.media_url)
+    conn.recv()
+    conn.send(service.key_requests)
+    service.stop()
+
+
+def start_server(args, encrypt):
+    """在子进程中启动服务，返回 (进程, 连接, 媒体播放列表地址)"""
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(args, encrypt, child_conn), daemon=True)
+    process.start()
+    return process, parent_conn, parent_conn.recv()
+
+
+def stop_server(process, conn):
+    """停止子进程中的服务，返回密钥请求次数"""
+    conn.send(None)
+    key_requests = conn.recv()
+    process.join()
+    return key_requests
+
+
+def decrypt_throughput(size=32 * 1024 * 1024, chunk_size=64 * 1024):
+    """单线程按64KB块流式解密的吞吐（MB/s）"""
+    key, iv = os.urandom(16), os.urandom(16)
+    data = encrypt_segment(os.urandom(size), key, iv)
+    started = time.perf_counter()
+    decryptor = SegmentDecryptor(key, iv)
+    for i in range(0, len(data), chunk_size):
+        decryptor.update(data[i:i + chunk_size])
+    decryptor.finalize()
+    return size / 1024 / 1024 / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AES-128 加密HLS的下载开销')
+    parser.add_argument('--rounds', type=int, default=3, help='交替下载轮数 (默认: 3)')
+    parser.add_argument('--workers', type=int, default=16, help='max_workers (默认: 16)')
+    parser.add_argument('--mode', default='stream', choices=['stream', 'file'], help='组装模式 (默认: stream)')
+    parser.add_argument('--max-overhead', type=float, default=None,
+                        help='允许的吞吐开销，百分比 (默认: 限速时5，不限速时25)')
+    add_arguments(parser)
+    parser.set_defaults(latency=0.0, jitter=0.0)
+    args = parser.parse_args()
+
+    if not crypto_available():
+        print("需要安装 cryptography (pip install cryptography)")
+        sys.exit(1)
+
+    servers = {'明文': start_server(args, False), '加密': start_server(args, True)}
+
+    decrypt_speed = decrypt_throughput()
+    print(f"单线程解密吞吐: {decrypt_speed:.0f} MB/s")
+    print(f"合成HLS: {args.segments} 个片段 × {args.segment_kb} KB, workers={args.workers}, 模式 {args.mode}")
+    speeds = {'明文': [], '加密': []}
+    digests = {'明文': set(), '加密': set()}
+    failed = False
+    for round_index in range(args.rounds):
+        for name, (_, _, media_url) in servers.items():
+            ok, seconds, size, digest = download(media_url, args.workers, args.mode == 'stream')
+            if not ok:
+                print(f"第 {round_index + 1} 轮 {name} 下载失败")
+                failed = True
+                continue
+            speeds[name].append(size / 1024 / 1024 / seconds)
+            digests[name].add(digest)
+            print(f"第 {round_index + 1} 轮 {name}: {seconds:.2f}s {speeds[name][-1]:.1f} MB/s")
+    plain_process, plain_conn, _ = servers['明文']
+    stop_server(plain_process, plain_conn)
+    encrypted_process, encrypted_conn, _ = servers['加密']
+    key_requests = stop_server(encrypted_process, encrypted_conn)
+
+    if failed or not speeds['明文'] or not speeds['加密']:
+        sys.exit(1)
+    plain_speed = statistics.median(speeds['明文'])
+    encrypted_speed = statistics.median(speeds['加密'])
+    overhead = (1 - encrypted_speed / plain_speed) * 100
+    max_overhead = args.max_overhead if args.max_overhead is not None else (5 if args.bandwidth_mb else 25)
+    print(f"吞吐中位数: 明文 {plain_speed:.1f} MB/s, 加密 {encrypted_speed:.1f} MB/s, "
+          f"开销 {overhead:.1f}%（上限 {max_overhead:.0f}%）")
+    print(f"解密占用CPU: 约单核的 {plain_speed / decrypt_speed * 100:.1f}%（按明文速度计）")
+    print(f"密钥请求次数: {key_requests}（{args.rounds} 次任务）")
+
+    if len(digests['明文'] | digests['加密']) != 1:
+        print("❌ 解密后的输出与明文不一致")
+        sys.exit(1)
+    if key_requests != args.rounds:
+        print("❌ 密钥没有在任务内复用")
+        sys.exit(1)
+    if overhead > max_overhead:
+        print("❌ 解密开销超出上限")
+        sys.exit(1)
+    print("✅ 解密输出与明文一致，开销在上限以内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+语音识别音频预处理（audio_prep.py）的效果与时间轴精度
+
+合成一段已知语音位置的节目音频：类语音信号（谐波+音节包络）之间穿插短停顿与长静音，
+开头结尾留空白。经 detect_speech 切除静音后：
+  - 报告计费音频时长与上传字节（原流程为整段36kbps mp3再base64，现为切除后的16kbps opus）
+  - 在裁剪后音频中逐采样定位每段语音，用 OffsetMap 换算回原时间，必须与合成时的真实位置一致，
+    生成的SRT与按真实时间生成的SRT逐字相同
+上传字节由ffmpeg实际编码测量，并跑一遍完整的 prepare_audio()；没有ffmpeg或编码失败时以非零状态退出。
+不需要外网。
+
+用法: python benchmarks/asr_audio.py [--minutes 45] [--long-gap-rate 0.3]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from audio_prep import SAMPLE_RATE, OffsetMap, decode_pcm, offsets_path, prepare_audio, trim_silence  # noqa: E402
+from ffmpeg_utils import find_ffmpeg, run_ffmpeg  # noqa: E402
+from transcriber import convert_words_to_srt  # noqa: E402
+
+
+def utterance(rng, seconds):
+    """类语音信号：基频缓慢变化的谐波，乘以约4Hz的音节包络"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f0 = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.2, 0.6) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 9))
+    envelope = np.abs(np.sin(2 * np.pi * rng.uniform(3, 5) * t)) ** 0.5
+    level = 10 ** (rng.uniform(-30, -12) / 20)
+    signal = voice / np.max(np.abs(voice)) * envelope * level + rng.normal(0, 0.003, len(t))
+    return signal
+
+
+def make_program(rng, minutes, long_gap_rate):
+    """
+    Returns:
+        tuple: (int16采样, [(语音起点, 语音终点), ...] 单位采样点)
+    """
+    noise_level = 10 ** (-65 / 20)
+    parts = [rng.normal(0, noise_level, int(3 * SAMPLE_RATE))]
+    position = len(parts[0])
+    truth = []
+    while position < minutes * 60 * SAMPLE_RATE:
+        speech = utterance(rng, rng.uniform(2, 12))
+        truth.append((position, position + len(speech)))
+        parts.append(speech)
+        position += len(speech)
+        gap = rng.uniform(1.5, 6) if rng.random() < long_gap_rate else rng.uniform(0.2, 0.6)
+        parts.append(rng.normal(0, noise_level, int(gap * SAMPLE_RATE)))
+        position += len(parts[-1])
+    parts.append(rng.normal(0, noise_level, int(5 * SAMPLE_RATE)))
+    samples = np.clip(np.concatenate(parts) * 32767, -32768, 32767).astype(np.int16)
+    return samples, truth
+
+
+def locate(trimmed, samples, start, probe=64):
+    """在裁剪后的音频中逐采样查找原音频 start 处开始的一段，返回位置或None"""
+    needle = samples[start:start + probe]
+    # 裁剪只会把采样往前移，移动量不超过切掉的总采样数
+    low = max(0, start - (len(samples) - len(trimmed)))
+    for candidate in np.flatnonzero(trimmed[low:start + 1] == needle[0]) + low:
+        if np.array_equal(trimmed[candidate:candidate + probe], needle):
+            return int(candidate)
+    return None
+
+
+def base64_size(size):
+    return (size + 2) // 3 * 4
+
+
+def encoded_size(samples, codec_args, suffix):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'audio' + suffix)
+        if not run_ffmpeg(['-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', '-'] + codec_args + [path],
+                          input_data=samples.tobytes()):
+            return None
+        return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='语音识别音频预处理的效果与时间轴精度')
+    parser.add_argument('--minutes', type=float, default=45, help='合成节目时长，分钟 (默认: 45)')
+    parser.add_argument('--long-gap-rate', type=float, default=0.3, help='语音之间为长静音的比例 (默认: 0.3)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    samples, truth = make_program(rng, args.minutes, args.long_gap_rate)
+    original_seconds = len(samples) / SAMPLE_RATE
+    speech_seconds = sum(end - start for start, end in truth) / SAMPLE_RATE
+
+    started = time.perf_counter()
+    trimmed, offset_map = trim_silence(samples)
+    vad_seconds = time.perf_counter() - started
+    print(f"合成节目 {original_seconds:.0f}s，其中语音 {speech_seconds:.0f}s（{len(truth)} 段）")
+    print(f"语音检测+裁剪耗时 {vad_seconds * 1000:.0f} ms，保留 {len(offset_map.spans)} 段")
+    print(f"计费音频时长: {original_seconds:.0f}s → {offset_map.trimmed_seconds:.0f}s "
+          f"(-{(1 - offset_map.trimmed_seconds / original_seconds) * 100:.1f}%)")
+
+    # 时间轴：每段语音在裁剪后音频中完整保留，换算回原时间后与真实位置逐采样一致
+    failed = False
+    expected, actual = [], []
+    for index, (start, end) in enumerate(truth):
+        position = locate(trimmed, samples, start)
+        if position is None or not np.array_equal(trimmed[position:position + end - start], samples[start:end]):
+            print(f"❌ 第 {index} 段语音没有完整保留")
+            failed = True
+            continue
+        segment = {'start': position / SAMPLE_RATE, 'end': (position + end - start) / SAMPLE_RATE,
+                   'text': f"第{index}段"}
+        actual.append(offset_map.remap([segment])[0])
+        expected.append({'start': start / SAMPLE_RATE, 'end': end / SAMPLE_RATE, 'text': segment['text']})
+    error = max(max(abs(a['start'] - e['start']), abs(a['end'] - e['end'])) for a, e in zip(expected, actual))
+    print(f"时间戳最大误差: {error * 1000:.3f} ms")
+    if convert_words_to_srt(actual) != convert_words_to_srt(expected):
+        print("❌ 换算后的SRT与真实时间不一致")
+        failed = True
+
+    # 上传字节：原流程整段 36kbps mp3 + base64；现为裁剪后 16kbps opus + base64
+    if not find_ffmpeg():
+        print("❌ 未找到ffmpeg，无法测量上传字节与完整的 prepare_audio()")
+        sys.exit(1)
+    baseline = encoded_size(samples, ['-c:a', 'libmp3lame', '-b:a', '36k'], '.mp3')
+    prepared = encoded_size(trimmed, ['-c:a', 'libopus', '-b:a', '16k', '-application', 'voip'], '.ogg')
+    if not baseline or not prepared:
+        print("❌ 编码失败，无法测量上传字节")
+        failed = True
+    else:
+        print(f"上传字节（含base64）: {base64_size(baseline) / 1024 / 1024:.2f} MB → "
+              f"{base64_size(prepared) / 1024 / 1024:.2f} MB (-{(1 - prepared / baseline) * 100:.1f}%)")
+
+    # 完整流程：编码为wav输入，prepare_audio 解码、裁剪、编码并写出对应表
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, 'program.wav')
+        output = None
+        if run_ffmpeg(['-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', '-', source_path],
+                      input_data=samples.tobytes()):
+            output = prepare_audio(source_path, os.path.join(tmp, 'program.asr.flac'), codec='flac')
+        if output is None:
+            print("❌ prepare_audio 失败")
+            failed = True
+        else:
+            decoded = decode_pcm(output)
+            saved = OffsetMap.load(offsets_path(output))
+            if not np.array_equal(decoded, trimmed) or saved.spans != offset_map.spans:
+                print("❌ prepare_audio 的输出与直接裁剪不一致")
+                failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ 语音完整保留，SRT时间轴与原节目一致")
+
+
+if __name__ == "__main__":
+    main()
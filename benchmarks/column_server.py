@@ -0,0 +1,115 @@
+"""
+本地栏目列表接口（getVideoListByColumn）
+
+返回与CNTV相同格式的JSONP（lanmu_0({...})），支持 ETag / If-None-Match 条件请求；
+可以在运行中发布新的一期，或在一段时间内返回500模拟接口故障。配合
+python main.py --watch --list-url http://127.0.0.1:8001/list 测试监听模式。
+
+用法: python benchmarks/column_server.py [--port 8001] [--episodes 3] [--publish-after 60]
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ColumnServer:
+    def __init__(self, episodes=3, port=0):
+        """
+        Args:
+            episodes: 初始的期数
+            port: 监听端口，0为随机
+        """
+        self.port = port
+        self.episodes = []
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.fail_until = 0
+        self.published_at = None
+        self._lock = threading.Lock()
+        self.server = None
+        for number in range(episodes):
+            self.publish(f"guid{number:04d}", f"《新闻周刊》 2025{number + 1:04d}")
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/list"
+
+    def publish(self, guid, title):
+        """发布新的一期（排在列表最前）"""
+        with self._lock:
+            self.episodes.insert(0, {'guid': guid, 'title': title, 'time': time.strftime('%Y-%m-%d %H:%M:%S')})
+            self.published_at = time.monotonic()
+
+    def fail_for(self, seconds):
+        """接下来seconds秒内所有请求返回500"""
+        self.fail_until = time.monotonic() + seconds
+
+    def _etag(self):
+        return f'"{len(self.episodes)}-{self.episodes[0]["guid"]}"'
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with service._lock:
+                    service.requests += 1
+                    if time.monotonic() < service.fail_until:
+                        service.errors += 1
+                        self.send_response(500)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    etag = service._etag()
+                    if self.headers.get('If-None-Match') == etag:
+                        service.not_modified += 1
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+                    data = {'data': {'list': list(service.episodes), 'total': len(service.episodes)}}
+                body = f"lanmu_0({json.dumps(data, ensure_ascii=False)});".encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/javascript; charset=utf-8')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地栏目列表接口')
+    parser.add_argument('--port', type=int, default=8001, help='端口 (默认: 8001)')
+    parser.add_argument('--episodes', type=int, default=3, help='初始期数 (默认: 3)')
+    parser.add_argument('--publish-after', type=float, default=60, help='多少秒后发布新的一期，0为不发布 (默认: 60)')
+    args = parser.parse_args()
+
+    service = ColumnServer(args.episodes, args.port).start()
+    print(f"栏目列表: {service.url}")
+    try:
+        if args.publish_after:
+            time.sleep(args.publish_after)
+            service.publish("guid-new", "《新闻周刊》 20251231")
+            print("已发布新的一期: guid-new")
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
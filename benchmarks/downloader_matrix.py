@@ -0,0 +1,147 @@
+"""
+M3U8Downloader 离线吞吐基准
+
+启动合成HLS服务（见 hls_server.py），按 max_workers × timeout × retry_times × 模式 的组合
+逐个运行 M3U8Downloader.download_m3u8。每个组合在独立子进程中运行，
+峰值RSS互不影响。报告 片段/秒、MB/秒、峰值RSS、合并/封装耗时与片段延迟分位数，
+结果写入JSON文件便于不同提交之间对比。不需要外网。
+
+用法:
+  python benchmarks/downloader_matrix.py --workers 4,16,48 --timeouts 10 --retries 3 \\
+      --modes stream,file --segments 200 --segment-kb 512 --failure-rate 0.01 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from hls_server import add_arguments, from_arguments  # noqa: E402
+
+
+def run_one(config):
+    """在当前进程中运行一个组合，返回结果dict（子进程入口）"""
+    import contextlib
+    from m3u8_downloader import M3U8Downloader
+    from metrics import METRICS
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        downloader = M3U8Downloader(
+            max_workers=config['max_workers'],
+            timeout=config['timeout'],
+            retry_times=config['retry_times'],
+            stream=config['mode'] == 'stream',
+            engine=config['engine'],
+            adaptive=config['adaptive'],
+            container=config['container']
+        )
+        started = time.monotonic()
+        # 下载器的逐步输出不进入结果，只保留在stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            ok = downloader.download_m3u8(config['url'], output_dir, 'bench')
+        seconds = time.monotonic() - started
+        size = os.path.getsize(downloader.output_path) if ok and downloader.output_path else 0
+
+    report = METRICS.report()
+    latency = report['histograms'].get('segment_latency_seconds', {})
+    stages = report['stages']
+    segments = latency.get('count', 0)
+    return {
+        'ok': bool(ok),
+        'seconds': round(seconds, 3),
+        'segments': segments,
+        'bytes': size,
+        'segments_per_sec': round(segments / seconds, 2) if seconds else None,
+        'mb_per_sec': round(stages.get('download', {}).get('bytes', 0) / 1024 / 1024 / seconds, 2)
+        if seconds else None,
+        'merge_seconds': round(sum(stages.get(name, {}).get('seconds', 0.0) for name in ('merge', 'remux')), 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'latency_p50': latency.get('p50'),
+        'latency_p95': latency.get('p95'),
+        'latency_p99': latency.get('p99'),
+        'retries': report['counters'].get('segment_retries', 0),
+        'failures': report['counters'].get('segment_failures', 0),
+    }
+
+
+def parse_list(text, cast):
+    return [cast(item) for item in text.split(',') if item.strip()]
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        print(json.dumps(run_one(json.loads(sys.argv[2]))))
+        return
+
+    parser = argparse.ArgumentParser(description='M3U8Downloader 离线吞吐基准')
+    parser.add_argument('--workers', default='4,16,48', help='max_workers 取值，逗号分隔 (默认: 4,16,48)')
+    parser.add_argument('--timeouts', default='10', help='timeout 取值，秒 (默认: 10)')
+    parser.add_argument('--retries', default='3', help='retry_times 取值 (默认: 3)')
+    parser.add_argument('--modes', default='stream,file', help='stream 流式组装 / file 临时文件合并 (默认: 两者)')
+    parser.add_argument('--engine', default='thread', choices=['thread', 'async'], help='下载引擎 (默认: thread)')
+    parser.add_argument('--adaptive', action='store_true', help='启用自适应并发')
+    parser.add_argument('--container', default='ts', choices=['ts', 'mp4'], help='输出封装 (默认: ts，不需要ffmpeg)')
+    parser.add_argument('--output', default='downloader_bench.json', help='结果JSON路径 (默认: downloader_bench.json)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    service = from_arguments(args, seed=0)
+    service.start()
+    configs = [
+        {'max_workers': workers, 'timeout': timeout, 'retry_times': retries, 'mode': mode,
+         'engine': args.engine, 'adaptive': args.adaptive, 'container': args.container,
+         'url': service.media_url}
+        for workers, timeout, retries, mode in itertools.product(
+            parse_list(args.workers, int), parse_list(args.timeouts, float),
+            parse_list(args.retries, int), parse_list(args.modes, str))
+    ]
+
+    print(f"合成HLS: {args.segments} 个片段 × {args.segment_kb} KB, 延迟 {args.latency}s ± {args.jitter}s, "
+          f"失败率 {args.failure_rate}, 带宽上限 {args.bandwidth_mb or '不限'} MB/s")
+    print(f"{'workers':>7} {'timeout':>7} {'retries':>7} {'mode':>6} {'ok':>3} {'seg/s':>8} {'MB/s':>8} "
+          f"{'RSS MB':>8} {'merge s':>8} {'p95 s':>7}")
+    results = []
+    for config in configs:
+        process = subprocess.run([sys.executable, __file__, '--child', json.dumps(config)],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            tail = process.stderr.decode('utf-8', errors='replace').strip().splitlines()[-5:]
+            result = {'ok': False, 'error': "\n".join(tail)}
+        else:
+            result = json.loads(process.stdout.decode('utf-8').strip().splitlines()[-1])
+        result.update({key: config[key] for key in ('max_workers', 'timeout', 'retry_times', 'mode')})
+        results.append(result)
+        print(f"{config['max_workers']:>7} {config['timeout']:>7} {config['retry_times']:>7} {config['mode']:>6} "
+              f"{'✅' if result['ok'] else '❌':>3} {result.get('segments_per_sec') or 0:>8.1f} "
+              f"{result.get('mb_per_sec') or 0:>8.2f} {result.get('peak_rss_mb') or 0:>8.1f} "
+              f"{result.get('merge_seconds') or 0:>8.3f} {result.get('latency_p95') or 0:>7.3f}")
+    service.stop()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'server': {
+                'segments': args.segments, 'segment_kb': args.segment_kb, 'latency': args.latency,
+                'jitter': args.jitter, 'failure_rate': args.failure_rate, 'bandwidth_mb': args.bandwidth_mb
+            },
+            'engine': args.engine,
+            'adaptive': args.adaptive,
+            'container': args.container,
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
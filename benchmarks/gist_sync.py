@@ -0,0 +1,147 @@
+"""
+gist状态同步的增量性验证
+
+启动一个模拟 GitHub gist API 的本地服务（GET/HEAD 支持 ETag/304，PATCH 合并文件、null删除文件；
+与GitHub一样，PATCH响应的ETag与GET不同），用 GistSync 同步一个包含数千期记录的 state.db，检查：
+  1. 状态未变化时保存不发出任何请求
+  2. 新增少量记录后只上传变化的分片
+  3. 保存后本地库与gist都未变化时恢复得到304，不下载内容
+  4. 全新目录恢复出的数据库与原库记录一致
+任何一项不满足时以非零状态退出。不需要外网。
+
+用法: python benchmarks/gist_sync.py [--episodes 5000]
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gist import GistSync  # noqa: E402
+from state_ledger import StateLedger  # noqa: E402
+
+
+class GistHandler(BaseHTTPRequestHandler):
+    files = {}
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _etag(self, representation='get'):
+        data = json.dumps(GistHandler.files, sort_keys=True) + representation
+        return '"' + hashlib.sha256(data.encode()).hexdigest() + '"'
+
+    def _send(self, status, body=b'', representation='get'):
+        self.send_response(status)
+        self.send_header('ETag', self._etag(representation))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        GistHandler.requests_seen.append('GET')
+        if self.headers.get('If-None-Match') == self._etag():
+            self._send(304)
+            return
+        files = {name: {'filename': name, 'content': content, 'truncated': False}
+                 for name, content in GistHandler.files.items()}
+        self._send(200, json.dumps({'files': files}).encode())
+
+    def do_HEAD(self):
+        GistHandler.requests_seen.append('HEAD')
+        self.send_response(200)
+        self.send_header('ETag', self._etag())
+        self.end_headers()
+
+    def do_PATCH(self):
+        GistHandler.requests_seen.append('PATCH')
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        for name, entry in body['files'].items():
+            if entry is None:
+                GistHandler.files.pop(name, None)
+            else:
+                GistHandler.files[name] = entry['content']
+        self._send(200, b'{}', representation='patch')
+
+
+def fill(db_path, start, count):
+    ledger = StateLedger(db_path)
+    for i in range(start, start + count):
+        guid = hashlib.md5(str(i).encode()).hexdigest()
+        ledger.record(guid, 'listed', title=f"《新闻周刊》 {i}")
+        ledger.record(guid, 'transcribed', artifact=f"sub_output/{i}.srt", size=40000, sha256=guid * 2,
+                      duration=600.0)
+    ledger.close()
+
+
+def dump_rows(db_path):
+    """各表按主键排序的全部记录"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return {table: conn.execute(f"SELECT * FROM {table} ORDER BY {order}").fetchall()
+                for table, order in (('episodes', 'guid'), ('stages', 'guid, stage'), ('meta', 'key'))}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gist状态同步增量性验证')
+    parser.add_argument('--episodes', type=int, default=5000, help='状态库中的期数 (默认: 5000)')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GistHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}"
+
+    failed = False
+
+    def check(name, ok, detail=""):
+        nonlocal failed
+        print(f"{'✅' if ok else '❌'} {name} {detail}")
+        failed = failed or not ok
+
+    with tempfile.TemporaryDirectory() as workdir, tempfile.TemporaryDirectory() as freshdir:
+        db_path = os.path.join(workdir, 'state.db')
+        sidecar_path = os.path.join(workdir, 'state.db.sync.json')
+        fill(db_path, 0, args.episodes)
+        print(f"state.db: {os.path.getsize(db_path)} bytes, {args.episodes} 期")
+
+        sync = GistSync('test', 'token', api_url, db_path, sidecar_path)
+        check("首次保存", sync.save(), f"上传 {sync.bytes_sent} bytes")
+        full_upload = sync.bytes_sent
+
+        GistHandler.requests_seen.clear()
+        sync.save()
+        check("未变化时保存不发请求", not GistHandler.requests_seen, f"{GistHandler.requests_seen}")
+
+        fill(db_path, args.episodes, 3)
+        sync = GistSync('test', 'token', api_url, db_path, sidecar_path)
+        sync.save()
+        check("增量保存只上传变化的分片", sync.bytes_sent < full_upload / 2,
+              f"上传 {sync.bytes_sent} bytes（全量 {full_upload} bytes）")
+
+        GistHandler.requests_seen.clear()
+        sync = GistSync('test', 'token', api_url, db_path, sidecar_path)
+        sync.restore()
+        check("未变化时恢复得到304", sync.bytes_received == 0, f"下载 {sync.bytes_received} bytes")
+
+        fresh_db = os.path.join(freshdir, 'state.db')
+        sync = GistSync('test', 'token', api_url, fresh_db, os.path.join(freshdir, 'state.db.sync.json'))
+        restored = sync.restore()
+        check("全新目录恢复一致", restored and dump_rows(fresh_db) == dump_rows(db_path),
+              f"下载 {sync.bytes_received} bytes")
+
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+合成HLS测试服务器
+
+在本地提供主播放列表、媒体播放列表和合成的MPEG-TS片段，可配置片段数、片段大小、
+响应延迟与抖动、失败率和总带宽上限，用于在没有外网的机器上测量下载器。
+片段由合法的188字节TS包组成（0x47同步字节、递增的连续计数器）。
+
+路径:
+  /master.m3u8        主播放列表（low / high 两个档位，指向同一组片段）
+  /low/index.m3u8     媒体播放列表
+  /low/seg00012.ts    第12个片段
+  /key.bin            AES-128密钥（--encrypt 时，片段以媒体序列号为IV加密）
+
+用法: python benchmarks/hls_server.py [--port 8000] [--segments 200] [--segment-kb 512] ...
+"""
+import time
+import random
+import argparse
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TS_PACKET_SIZE = 188
+
+
+def make_segment(index, size):
+    """生成第index个片段：size向下取整到188字节的整数倍"""
+    packets = []
+    payload = bytes([index % 256]) * (TS_PACKET_SIZE - 4)
+    for k in range(max(1, size // TS_PACKET_SIZE)):
+        # sync byte, PID 0x0100, payload only + continuity counter
+        packets.append(bytes([0x47, 0x01, 0x00, 0x10 | (k % 16)]) + payload)
+    return b"".join(packets)
+
+
+class Bandwidth:
+    """所有连接共享的带宽上限（令牌桶），None为不限速"""
+
+    def __init__(self, bytes_per_sec):
+        self.rate = bytes_per_sec
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, size):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class SyntheticHLS:
+    """
+    合成HLS服务
+
+    Args:
+        segments: 片段数
+        segment_size: 每个片段的字节数
+        latency: 每个片段响应前的固定延迟（秒）
+        jitter: 额外的随机延迟上限（秒）
+        tail_rate: 片段请求变成慢请求（长尾）的概率
+        tail_latency: 慢请求额外的延迟（秒）
+        failure_rate: 片段请求返回500的概率
+        bandwidth: 总带宽上限（字节/秒），None为不限速
+        duration: 每个片段的时长（秒），写入EXTINF
+        encrypt: 以 AES-128 加密片段并在播放列表中写入 EXT-X-KEY（需安装 cryptography）
+    """
+
+    def __init__(self, segments=100, segment_size=512 * 1024, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 bandwidth=None, duration=10.0, seed=None, encrypt=False, tail_rate=0.0, tail_latency=0.0):
+        self.segments = segments
+        self.segment_size = segment_size
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.bandwidth = Bandwidth(bandwidth)
+        self.duration = duration
+        self.random = random.Random(seed)
+        self.key = bytes(self.random.getrandbits(8) for _ in range(16)) if encrypt else None
+        self.key_requests = 0
+        self.requests = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def master_playlist(self):
+        return ("#EXTM3U\n"
+                "#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=460800,RESOLUTION=480x270\n"
+                "/low/index.m3u8\n"
+                "#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=2048000,RESOLUTION=1280x720\n"
+                "/high/index.m3u8\n")
+
+    def media_playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{int(self.duration + 0.999)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0"]
+        if self.key:
+            lines.append('#EXT-X-KEY:METHOD=AES-128,URI="/key.bin"')
+        for i in range(self.segments):
+            lines.append(f"#EXTINF:{self.duration:.3f},")
+            lines.append(f"seg{i:05d}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, index):
+        with self._lock:
+            if index not in self._cache:
+                data = make_segment(index, self.segment_size)
+                if self.key:
+                    from hls_crypto import encrypt_segment
+                    # 没有显式IV：以媒体序列号作为IV
+                    data = encrypt_segment(data, self.key, index.to_bytes(16, 'big'))
+                self._cache[index] = data
+            return self._cache[index]
+
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程中启动，返回基础URL"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                # 客户端放弃对冲落败的请求或关闭空闲连接时会重置连接
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass
+
+            def do_GET(self):
+                service.handle(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def master_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/master.m3u8"
+
+    @property
+    def media_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/low/index.m3u8"
+
+    def handle(self, request):
+        path = request.path.split('?', 1)[0]
+        if path == '/master.m3u8':
+            return self._send(request, 200, self.master_playlist().encode(), 'application/vnd.apple.mpegurl')
+        if path.endswith('/index.m3u8'):
+            return self._send(request, 200, self.media_playlist().encode(), 'application/vnd.apple.mpegurl')
+        if path == '/key.bin' and self.key:
+            with self._lock:
+                self.key_requests += 1
+            return self._send(request, 200, self.key, 'application/octet-stream')
+        name = path.rsplit('/', 1)[-1]
+        if not (name.startswith('seg') and name.endswith('.ts')):
+            return self._send(request, 404, b'not found')
+        try:
+            index = int(name[3:-3])
+        except ValueError:
+            return self._send(request, 404, b'not found')
+        if not 0 <= index < self.segments:
+            return self._send(request, 404, b'not found')
+
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            if self.tail_rate and self.random.random() < self.tail_rate:
+                delay += self.tail_latency
+            fail = self.failure_rate and self.random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self._send(request, 500, b'synthetic failure')
+        self._send(request, 200, self.segment(index), 'video/mp2t')
+
+    def _send(self, request, status, body, content_type='text/plain'):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        try:
+            # 按64KB分块发送，使带宽上限对并发连接公平生效
+            for i in range(0, len(body), 64 * 1024):
+                chunk = body[i:i + 64 * 1024]
+                self.bandwidth.wait(len(chunk))
+                request.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        with self._lock:
+            self.bytes_sent += len(body)
+
+
+def add_arguments(parser):
+    parser.add_argument('--segments', type=int, default=200, help='片段数 (默认: 200)')
+    parser.add_argument('--segment-kb', type=int, default=512, help='片段大小，KB (默认: 512)')
+    parser.add_argument('--latency', type=float, default=0.02, help='片段响应延迟，秒 (默认: 0.02)')
+    parser.add_argument('--jitter', type=float, default=0.03, help='随机附加延迟上限，秒 (默认: 0.03)')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='慢请求（长尾）概率 (默认: 0)')
+    parser.add_argument('--tail-latency', type=float, default=1.0, help='慢请求的额外延迟，秒 (默认: 1.0)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='片段请求失败概率 (默认: 0)')
+    parser.add_argument('--bandwidth-mb', type=float, default=None, help='总带宽上限，MB/s (默认: 不限)')
+    parser.add_argument('--encrypt', action='store_true', help='AES-128加密片段 (需安装 cryptography)')
+
+
+def from_arguments(args, seed=None):
+    return SyntheticHLS(
+        segments=args.segments,
+        segment_size=args.segment_kb * 1024,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        tail_rate=args.tail_rate,
+        tail_latency=args.tail_latency,
+        bandwidth=args.bandwidth_mb * 1024 * 1024 if args.bandwidth_mb else None,
+        seed=seed,
+        encrypt=args.encrypt
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成HLS测试服务器')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口 (默认: 8000)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    service = from_arguments(args)
+    service.start(port=args.port)
+    print(f"主播放列表: {service.master_url}")
+    print(f"媒体播放列表: {service.media_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
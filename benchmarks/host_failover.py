@@ -0,0 +1,97 @@
+"""
+镜像主机选择、故障切换与对冲请求的效果
+
+启动几个内容相同、注入延迟不同的合成HLS服务（见 hls_server.py）：播放列表所在的默认主机
+有长尾慢请求和偶发500，一个镜像更快，一个镜像很慢。依次比较:
+  baseline   只用默认主机（原有行为）
+  failover   探测排序 + 出错换主机，不对冲
+  hedged     再加上超过p95耗时后的对冲请求
+  single     开启对冲但只有默认主机（不应发出任何对冲请求）
+报告总耗时、片段耗时 p50/p99、对冲与换主机次数。不需要外网。
+
+用法: python benchmarks/host_failover.py [--segments 200] [--segment-kb 256] [--workers 8] [--engine thread]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from hls_server import SyntheticHLS  # noqa: E402
+
+
+def run(url, hosts, hedge, args):
+    from m3u8_downloader import M3U8Downloader
+    from metrics import METRICS
+
+    METRICS.reset()
+    with tempfile.TemporaryDirectory() as output_dir:
+        downloader = M3U8Downloader(max_workers=args.workers, engine=args.engine, container='ts',
+                                    hosts=hosts, hedge=hedge)
+        started = time.monotonic()
+        with contextlib.redirect_stdout(sys.stderr):
+            ok = downloader.download_m3u8(url, output_dir, 'bench')
+        seconds = time.monotonic() - started
+    latency = METRICS.report()['histograms'].get('segment_latency_seconds', {})
+    counters = METRICS.report()['counters']
+    report = downloader.host_report or {}
+    return {
+        'ok': ok,
+        'seconds': seconds,
+        'p50': latency.get('p50') or 0,
+        'p99': latency.get('p99') or 0,
+        'hedged': report.get('hedged', 0),
+        'hedge_wins': report.get('hedge_wins', 0),
+        'failovers': report.get('failovers', 0),
+        'retries': counters.get('segment_retries', 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='镜像主机选择、故障切换与对冲请求的效果')
+    parser.add_argument('--segments', type=int, default=200, help='片段数 (默认: 200)')
+    parser.add_argument('--segment-kb', type=int, default=256, help='片段大小，KB (默认: 256)')
+    parser.add_argument('--workers', type=int, default=8, help='max_workers (默认: 8)')
+    parser.add_argument('--engine', default='thread', choices=['thread', 'async'], help='下载引擎 (默认: thread)')
+    args = parser.parse_args()
+
+    common = {'segments': args.segments, 'segment_size': args.segment_kb * 1024, 'seed': 0}
+    default = SyntheticHLS(latency=0.05, jitter=0.02, tail_rate=0.05, tail_latency=1.5, failure_rate=0.02,
+                           **common)
+    fast = SyntheticHLS(latency=0.02, jitter=0.02, tail_rate=0.03, tail_latency=1.5, **common)
+    slow = SyntheticHLS(latency=0.3, jitter=0.05, **common)
+    for service in (default, fast, slow):
+        service.start()
+    mirrors = [f"127.0.0.1:{service.server.server_port}" for service in (slow, fast)]
+
+    print("默认主机: 延迟 0.05s, 5% 慢请求 +1.5s, 2% 失败; 镜像: 快 0.02s (3% 慢请求) / 慢 0.3s")
+    print(f"{'mode':>9} {'ok':>3} {'total s':>8} {'p50 s':>7} {'p99 s':>7} {'hedged':>7} {'wins':>5} "
+          f"{'failover':>8} {'retries':>7}")
+    results = {}
+    for name, hosts, hedge in (('baseline', None, False), ('failover', mirrors, False), ('hedged', mirrors, True),
+                               ('single', [], True)):
+        result = results[name] = run(default.media_url, hosts, hedge, args)
+        print(f"{name:>9} {'✅' if result['ok'] else '❌':>3} {result['seconds']:>8.2f} {result['p50']:>7.3f} "
+              f"{result['p99']:>7.3f} {result['hedged']:>7} {result['hedge_wins']:>5} {result['failovers']:>8} "
+              f"{result['retries']:>7}")
+    for service in (default, fast, slow):
+        service.stop()
+
+    baseline, hedged = results['baseline'], results['hedged']
+    if not all(result['ok'] for result in results.values()):
+        print("❌ 有下载失败")
+        sys.exit(1)
+    if results['single']['hedged']:
+        print(f"❌ 只有一个主机时发出了 {results['single']['hedged']} 次对冲请求")
+        sys.exit(1)
+    print(f"总耗时 {baseline['seconds']:.2f}s → {hedged['seconds']:.2f}s, "
+          f"p99 {baseline['p99']:.3f}s → {hedged['p99']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
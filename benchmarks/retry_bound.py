@@ -0,0 +1,84 @@
+"""
+ASR重试策略的有界性验证
+
+启动一个始终返回 503/429 的本地桩服务，模拟 Cloudflare 接口持续出错，
+用 WhisperClient 的重试策略连续转写多个分段，检查：
+  1. 单个分段的总耗时不超过 RetryPolicy 的 deadline（加一次请求的余量）
+  2. 熔断器打开后，后续分段立即失败，不再发出请求
+任何一项不满足时以非零状态退出。不需要外网。
+
+用法: python benchmarks/retry_bound.py [--deadline 5] [--chunks 6]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retry_policy import RetryPolicy, CircuitBreaker  # noqa: E402
+from transcriber import WhisperClient  # noqa: E402
+
+
+class FailingHandler(BaseHTTPRequestHandler):
+    requests_seen = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        FailingHandler.requests_seen += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if FailingHandler.requests_seen % 2:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+        else:
+            self.send_response(503)
+        body = b'{"success": false}'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ASR重试策略有界性验证')
+    parser.add_argument('--deadline', type=float, default=5, help='单个分段的时间预算 (默认: 5秒)')
+    parser.add_argument('--chunks', type=int, default=6, help='连续转写的分段数 (默认: 6)')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FailingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    breaker = CircuitBreaker(failure_threshold=6, reset_timeout=60)
+    client = WhisperClient(retry_policy=RetryPolicy(
+        max_attempts=10, base_delay=0.2, max_delay=2, deadline=args.deadline, breaker=breaker
+    ))
+    client.url = f"http://127.0.0.1:{server.server_port}/ai/run"
+
+    failed = False
+    started = time.monotonic()
+    for i in range(args.chunks):
+        chunk_started = time.monotonic()
+        before = FailingHandler.requests_seen
+        result = client.transcribe(b'\0' * 1024, f"chunk {i}")
+        elapsed = time.monotonic() - chunk_started
+        sent = FailingHandler.requests_seen - before
+        print(f"分段 {i}: 结果={result}, 请求数={sent}, 耗时={elapsed:.2f}s, 熔断器={breaker.state}")
+        if result is not None or elapsed > args.deadline + 1:
+            failed = True
+        if i > 0 and breaker.state == "open" and sent > 1:
+            failed = True
+    total = time.monotonic() - started
+    print(f"总耗时: {total:.2f}s, 服务端共收到 {FailingHandler.requests_seen} 个请求")
+    server.shutdown()
+
+    if failed:
+        print("❌ 持续失败时重试耗时或请求数超出预期")
+        sys.exit(1)
+    print("✅ 持续失败时总耗时有界，熔断生效")
+
+
+if __name__ == '__main__':
+    main()
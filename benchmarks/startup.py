@@ -0,0 +1,113 @@
+"""
+空跑路径启动基准
+
+测量真实的空跑调用：python main.py 解析参数、打开状态账本、创建 CntvClient、请求一次栏目列表，
+发现最新一期已发布后退出。栏目列表由本地接口提供（见 column_server.py），账本与缓存写在临时目录，
+最新一期预先记为已发布。用 python -X importtime 运行多次取中位数；进程总耗时超过预算、
+没有走到"已获取过，跳过"、或加载了重量级模块时以非零状态退出。不需要外网。
+
+用法: python benchmarks/startup.py [--budget-ms 400] [--runs 5]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from column_server import ColumnServer  # noqa: E402
+
+# 空跑路径不允许出现的模块
+HEAVY_MODULES = {
+    'moviepy', 'numpy', 'imageio', 'imageio_ffmpeg', 'proglog', 'aiohttp',
+    'm3u8_downloader', 'audio_extractor', 'hls_parser', 'transcriber', 'audio_prep',
+}
+
+
+def measure_once(list_url, workdir, state_db):
+    """
+    运行一次空跑的 main.py
+
+    Returns:
+        (import_ms, wall_s, heavy): 顶层导入的累计耗时（毫秒）、进程总耗时、加载的重量级模块
+    """
+    env = {key: value for key, value in os.environ.items() if key != 'FORCE_RUN'}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.join(ROOT, 'main.py'),
+         '--list-url', list_url, '--state-db', state_db, '--metrics-dir', os.path.join(workdir, 'metrics')],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    wall = time.perf_counter() - started
+    output = result.stdout.decode('utf-8', errors='replace')
+    if result.returncode != 0 or "已获取过，跳过" not in output:
+        raise RuntimeError(f"main.py 没有走空跑路径 (退出码 {result.returncode}):\n{output[-2000:]}\n"
+                           f"{result.stderr.decode('utf-8', errors='replace')[-2000:]}")
+
+    import_us = 0
+    heavy = set()
+    for line in result.stderr.decode('utf-8', errors='replace').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.strip().split('.')[0] in HEAVY_MODULES:
+            heavy.add(name.strip().split('.')[0])
+        if not name.startswith('  '):
+            # 顶层导入（缩进1格），累计耗时已包含其依赖
+            import_us += int(parts[1])
+    return import_us / 1000, wall, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py 空跑路径启动基准')
+    parser.add_argument('--budget-ms', type=float, default=400, help='空跑进程总耗时预算 (默认: 400ms)')
+    parser.add_argument('--runs', type=int, default=5, help='运行次数 (默认: 5)')
+    args = parser.parse_args()
+
+    service = ColumnServer(episodes=3).start()
+    import_times, wall_times, heavy = [], [], set()
+    with tempfile.TemporaryDirectory() as workdir:
+        from state_ledger import StateLedger
+
+        state_db = os.path.join(workdir, 'state.db')
+        ledger = StateLedger(state_db)
+        ledger.record(service.episodes[0]['guid'], 'released')
+        ledger.close()
+        for _ in range(args.runs):
+            import_ms, wall, loaded = measure_once(service.url, workdir, state_db)
+            import_times.append(import_ms)
+            wall_times.append(wall)
+            heavy |= loaded
+    service.stop()
+
+    import_ms = statistics.median(import_times)
+    wall_ms = statistics.median(wall_times) * 1000
+    print(f"导入耗时: {import_ms:.1f} ms (中位数)")
+    print(f"空跑进程总耗时: {wall_ms:.1f} ms (中位数，预算 {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if heavy:
+        print(f"❌ 空跑路径加载了重量级模块: {', '.join(sorted(heavy))}")
+        failed = True
+    if wall_ms > args.budget_ms:
+        print("❌ 空跑耗时超出预算")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ 启动耗时符合预算")
+
+
+if __name__ == '__main__':
+    main()
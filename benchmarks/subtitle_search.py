@@ -0,0 +1,107 @@
+"""
+字幕全文索引的建索引与查询耗时
+
+生成多年份的合成字幕（每周一期，每期若干条字幕，文本由常用词随机组成），逐期增量加入
+SubtitleIndex，报告每期的索引耗时；再对常见词、少见词、多词与单字查询测量耗时分位数，
+并检查结果与逐条线性扫描一致。不需要外网。
+
+用法: python benchmarks/subtitle_search.py [--years 10] [--cues 600] [--queries 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from subtitle_index import SubtitleIndex, normalize, _TOKEN_RE  # noqa: E402
+
+COMMON = ["中国", "记者", "今天", "我们", "发展", "经济", "社会", "国家", "工作", "问题", "时间", "人们", "城市",
+          "政府", "企业", "生活", "世界", "新闻", "周刊", "这个", "已经", "一个", "他们", "表示", "目前"]
+RARE = ["人工智能", "量子计算", "碳达峰", "乡村振兴", "航天员", "冬奥会", "高铁", "芯片", "无人机", "大熊猫",
+        "黄河", "长江", "考古", "稀土", "疫苗", "台风", "地震", "暴雨", "机器人", "新能源"]
+
+
+def make_episode(rng, cues):
+    segments = []
+    start = 0.0
+    for _ in range(cues):
+        words = [rng.choice(COMMON) for _ in range(rng.randint(4, 9))]
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(len(words)), rng.choice(RARE))
+        duration = rng.uniform(2, 6)
+        segments.append({'start': start, 'end': start + duration, 'text': "".join(words)})
+        start += duration
+    return segments
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='字幕全文索引的建索引与查询耗时')
+    parser.add_argument('--years', type=int, default=10, help='年数，每周一期 (默认: 10)')
+    parser.add_argument('--cues', type=int, default=600, help='每期字幕条数 (默认: 600)')
+    parser.add_argument('--queries', type=int, default=200, help='每类查询次数 (默认: 200)')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    episodes = args.years * 52
+    corpus = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SubtitleIndex(os.path.join(tmp, 'subtitle_index.db'))
+        add_times = []
+        for number in range(episodes):
+            guid = f"guid{number:05d}"
+            corpus[guid] = make_episode(rng, args.cues)
+            started = time.perf_counter()
+            index.add_episode(guid, corpus[guid], title=f"第{number}期")
+            add_times.append(time.perf_counter() - started)
+        stats = index.stats()
+        size = os.path.getsize(os.path.join(tmp, 'subtitle_index.db'))
+        print(f"{stats['episodes']} 期 / {stats['cues']} 条字幕 / {stats['terms']} 个词项, "
+              f"索引 {size / 1024 / 1024:.1f} MB")
+        print(f"每期增量索引: p50 {percentile(add_times, 0.5) * 1000:.0f} ms, "
+              f"p99 {percentile(add_times, 0.99) * 1000:.0f} ms")
+
+        started = time.perf_counter()
+        index.add_episode("guid00000", corpus["guid00000"], title="第0期")
+        print(f"重新索引一期: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        kinds = {
+            '少见词': lambda: rng.choice(RARE),
+            '常见词': lambda: rng.choice(COMMON),
+            '少见+常见': lambda: rng.choice(RARE) + " " + rng.choice(COMMON),
+            '单字': lambda: rng.choice(RARE)[0],
+        }
+        failed = False
+        for name, make_query in kinds.items():
+            times = []
+            for _ in range(args.queries):
+                query = make_query()
+                started = time.perf_counter()
+                index.search(query, limit=20)
+                times.append(time.perf_counter() - started)
+            print(f"{name:8} p50 {percentile(times, 0.5) * 1000:6.1f} ms  p99 {percentile(times, 0.99) * 1000:6.1f} ms")
+
+        # 正确性：少见词的命中条数与线性扫描一致
+        for word in RARE[:5]:
+            expected = sum(word in "".join(_TOKEN_RE.findall(normalize(segment['text'])))
+                           for segments in corpus.values() for segment in segments)
+            actual = len(index.search(word, limit=10 ** 6))
+            if actual != expected:
+                print(f"❌ {word}: 索引 {actual} 条，线性扫描 {expected} 条")
+                failed = True
+        index.close()
+    if failed:
+        sys.exit(1)
+    print("✅ 查询结果与线性扫描一致")
+
+
+if __name__ == "__main__":
+    main()
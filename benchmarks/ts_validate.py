@@ -0,0 +1,72 @@
+"""
+TS片段校验的正确性与吞吐
+
+构造正常片段、截断片段、HTML错误页、同步字节损坏和连续计数器跳变的片段，
+检查 TSValidator 的判断；再测量校验吞吐（MB/s），与下载速度对比确认开销可以忽略。
+安装numpy时连续计数器检查走向量化路径，否则逐包检查，两种路径都会报告。
+
+用法: python benchmarks/ts_validate.py [--segment-kb 1024] [--rounds 50]
+"""
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import ts_validator  # noqa: E402
+from ts_validator import TSValidator, validate_segment  # noqa: E402
+from hls_server import make_segment  # noqa: E402
+
+
+def feed_in_chunks(data, chunk_size=64 * 1024):
+    validator = TSValidator()
+    for i in range(0, len(data), chunk_size):
+        validator.feed(data[i:i + chunk_size])
+    return validator.finish()
+
+
+def throughput(data, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        feed_in_chunks(data)
+    return len(data) * rounds / (time.perf_counter() - started) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TS片段校验的正确性与吞吐')
+    parser.add_argument('--segment-kb', type=int, default=1024, help='片段大小，KB (默认: 1024)')
+    parser.add_argument('--rounds', type=int, default=50, help='吞吐测试轮数 (默认: 50)')
+    args = parser.parse_args()
+
+    good = make_segment(7, args.segment_kb * 1024)
+    corrupted = bytearray(good)
+    corrupted[188 * 100] = 0x00
+    skipped = good[:188 * 50] + good[188 * 51:]
+    cases = [
+        ("正常片段", good, None),
+        ("截断片段", good[:-100], True),
+        ("HTML错误页", b"<html><body>502 Bad Gateway</body></html>" * 10, True),
+        ("同步字节损坏", bytes(corrupted), True),
+        ("丢失一个包（连续计数器跳变）", skipped, False),
+    ]
+    failed = False
+    for name, data, expected in cases:
+        error = feed_in_chunks(data)
+        actual = None if error is None else error.fatal
+        ok = actual == expected and (validate_segment(data) is None) == (expected is None)
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {name}: {error or '通过'}")
+
+    paths = [("numpy", ts_validator.np)] if ts_validator.np is not None else []
+    paths.append(("逐包", None))
+    for label, module in paths:
+        ts_validator.np = module
+        print(f"校验吞吐（{label}）: {throughput(good, args.rounds):.0f} MB/s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
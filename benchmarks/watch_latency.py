@@ -0,0 +1,101 @@
+"""
+监听模式（main.py --watch）的发现延迟、条件请求与出错退避
+
+启动本地栏目列表接口（见 column_server.py），先让接口故障一段时间，再在随机时刻发布新的一期，
+用 run_watch() 监听（处理函数只记录时间，不下载）。报告：
+  - 从发布到开始处理的延迟（应不超过一个轮询间隔），对比原cron每小时一次的平均等待
+  - 请求数、304条件请求数，故障期间的请求数（应按指数退避而不是每个间隔都请求）
+  - 同一期只处理一次
+不需要外网。
+
+用法: python benchmarks/watch_latency.py [--poll 1] [--outage 10] [--publish-after 20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timezone, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from column_server import ColumnServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='监听模式的发现延迟、条件请求与出错退避')
+    parser.add_argument('--poll', type=float, default=1, help='发布窗口内的轮询间隔，秒 (默认: 1)')
+    parser.add_argument('--outage', type=float, default=10, help='开始时接口故障的秒数 (默认: 10)')
+    parser.add_argument('--publish-after', type=float, default=20, help='大约多少秒后发布新的一期 (默认: 20)')
+    args = parser.parse_args()
+
+    service = ColumnServer(episodes=3).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 账本、栏目缓存与status.txt都写在临时目录
+        os.chdir(tmp)
+        import main as watcher
+        from state_ledger import StateLedger
+        from retry_policy import RetryPolicy
+
+        watcher.cntv.list_url = service.url
+        # 接口故障由监听循环退避，不在单次请求内重试
+        watcher.cntv.retry_policy = RetryPolicy(max_attempts=1, name="api")
+        ledger = StateLedger(os.path.join(tmp, 'state.db'))
+        ledger.record(service.episodes[0]['guid'], 'released')
+
+        now = datetime.now(timezone.utc)
+        window = f"{(now - timedelta(hours=1)):%H:%M}-{(now + timedelta(hours=1)):%H:%M}"
+        schedule = watcher.PollSchedule(window, interval=args.poll, sparse_interval=900, max_backoff=60)
+
+        processed = []
+        stop = threading.Event()
+
+        def process(video_guid, output_dir, variant_policy, pipelined=False, ledger=None):
+            processed.append((video_guid, time.monotonic()))
+            # 处理完后再观察几轮，确认不会重复处理
+            threading.Timer(args.poll * 3, stop.set).start()
+            return {'guid': video_guid, 'title': "《新闻周刊》 20251231", 'ok': True, 'timings': {}}
+
+        service.fail_for(args.outage)
+        outage_started = time.monotonic()
+        publish_at = args.publish_after + random.uniform(0, args.poll)
+        threading.Timer(publish_at, service.publish, ("guid-new", "《新闻周刊》 20251231")).start()
+        requests_at_outage_end = []
+        threading.Timer(args.outage, lambda: requests_at_outage_end.append(service.requests)).start()
+
+        # 发布命令成功后才记录 released
+        released = watcher.run_watch(ledger, "lowest", False, schedule, on_release="true", process=process, stop=stop)
+        ledger_ok = ledger.is_done("guid-new", 'released')
+        ledger.close()
+        os.chdir(BENCH_DIR)
+    service.stop()
+
+    outage_requests = requests_at_outage_end[0] if requests_at_outage_end else service.errors
+    print(f"接口故障 {args.outage:.0f}s 期间请求 {outage_requests} 次（固定间隔需要 {int(args.outage / args.poll)} 次）")
+    print(f"总请求 {service.requests} 次，其中 304 {service.not_modified} 次，500 {service.errors} 次")
+    failed = False
+    if len(processed) != 1 or released != 1 or not ledger_ok:
+        print(f"❌ 新一期处理了 {len(processed)} 次，发布 {released} 次")
+        sys.exit(1)
+    latency = processed[0][1] - service.published_at
+    print(f"发布到开始处理: {latency:.2f}s（轮询间隔 {args.poll:.0f}s；原cron每小时一次，平均等待约1800s）")
+    if latency > args.poll * 1.2 + 0.5:
+        print("❌ 发现延迟超过一个轮询间隔")
+        failed = True
+    if outage_requests >= args.outage / args.poll:
+        print("❌ 故障期间没有退避")
+        failed = True
+    if not service.not_modified:
+        print("❌ 没有使用条件请求")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f"✅ 新一期在一个轮询间隔内被处理，且只处理一次（从开始监听共 {time.monotonic() - outage_started:.0f}s）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+from retry_policy import RetryPolicy, RetryError
+from metrics import METRICS
+
+COLUMN_ID = 'TOPC1451559180488841'
+LIST_URL = "https://api.cntv.cn/NewVideo/getVideoListByColumn"
+INFO_URL = "https://vdn.apps.cntv.cn/api/getHttpVideoInfo.do"
+# 播放列表中的加密地址改写到这个CDN主机的非加密路径
+HLS_HOST = "hls.cntv.lxdns.com"
+
+
+def generate_vtoken(fingerprint: str) -> dict:
+    """
+    根据JavaScript代码逻辑生成vtoken。
+
+    Args:
+        fingerprint (str): 从浏览器cookie中获取的设备指纹 (Fingerprint)。
+                           通常是一个32位的十六进制字符串。
+
+    Returns:
+        dict: 包含时间戳、源字符串和最终生成的vtoken的字典。
+    """
+    timestamp_str = str(int(time.time()))
+
+    salt = "2049"
+    static_key = "47899B86370B879139C08EA3B5E88267"
+
+    source_string = timestamp_str + salt + static_key + fingerprint
+    md5_hash = hashlib.md5(source_string.encode('utf-8')).hexdigest()
+
+    vtoken = md5_hash.upper()
+
+    return {
+        "timestamp": timestamp_str,
+        "source_string_for_md5": source_string,
+        "vtoken": vtoken
+    }
+
+
+class CntvClient:
+    """
+    CNTV 栏目列表与视频信息接口的客户端
+
+    所有请求复用同一个keep-alive会话并设置连接/读取超时，每个响应只解析一次。
+    栏目列表按页缓存：TTL内直接返回缓存；过期后带 If-None-Match / If-Modified-Since
+    发条件请求，304时沿用缓存。缓存写入 cache_path，跨进程（多次cron运行）有效。
+    视频信息与主播放列表按GUID在进程内记忆，补全模式重复查询同一期不再发请求。
+    """
+
+    def __init__(self, column_id=COLUMN_ID, list_url=LIST_URL, info_url=INFO_URL, hls_host=HLS_HOST,
+                 timeout=(5, 30), list_ttl=300, cache_path="cntv_cache.json", retry_policy=None):
+        """
+        Args:
+            column_id: 栏目ID
+            list_url: 栏目列表接口地址（可指向本地测试服务）
+            info_url: 视频信息接口地址
+            hls_host: 改写后的HLS主机，None时保留播放列表中的原主机
+            timeout: (连接超时, 读超时)
+            list_ttl: 栏目列表缓存的有效期（秒），过期后发条件请求
+            cache_path: 栏目列表缓存文件，None时只在内存中缓存
+            retry_policy: 重试策略，默认指数退避+抖动，最多4次、总计不超过60秒
+        """
+        self.column_id = column_id
+        self.list_url = list_url
+        self.info_url = info_url
+        self.hls_host = hls_host
+        self.timeout = timeout
+        self.list_ttl = list_ttl
+        self.cache_path = cache_path
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=4, base_delay=1, max_delay=10, deadline=60,
+                                                        name="api")
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+            'Connection': 'keep-alive'
+        })
+        self.stats = {'requests': 0, 'not_modified': 0, 'cache_hits': 0}
+        self._lock = threading.Lock()
+        self._list_cache = self._load_cache()
+        self._video_info = {}
+        self._master = {}
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(self._list_cache, fp, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def _get(self, url, **kwargs):
+        with self._lock:
+            self.stats['requests'] += 1
+        started = time.monotonic()
+        try:
+            response = self.retry_policy.call(self.session.get, url, timeout=self.timeout, **kwargs)
+        finally:
+            METRICS.observe('api_request_seconds', time.monotonic() - started)
+        METRICS.add_bytes('api', len(response.content))
+        if response.status_code == 304:
+            METRICS.incr('api_not_modified')
+        return response
+
+    def column_page(self, page=1, page_size=20):
+        """
+        请求栏目列表的一页
+
+        Args:
+            page: 页码，从1开始
+            page_size: 每页条数
+        Returns:
+            dict: 接口返回的JSON；失败返回None
+        """
+        key = f"{self.column_id}:{page}:{page_size}"
+        with self._lock:
+            entry = self._list_cache.get(key)
+            if entry and time.time() - entry['fetched_at'] < self.list_ttl:
+                self.stats['cache_hits'] += 1
+                return entry['data']
+
+        params = {
+            'id': self.column_id,
+            'n': str(page_size),
+            'sort': 'desc',
+            'p': str(page),
+            'd': '',
+            'mode': '0',
+            'serviceId': 'tvcctv',
+            'callback': 'lanmu_0'
+        }
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = self._get(self.list_url, params=params, headers=headers)
+            if response.status_code == 304 and entry:
+                with self._lock:
+                    self.stats['not_modified'] += 1
+                    entry['fetched_at'] = time.time()
+                    self._save_cache()
+                return entry['data']
+            response.raise_for_status()
+
+            # 解析JSONP响应 - 提取JSON部分
+            # 响应格式: lanmu_0({...})
+            json_match = re.search(r'lanmu_0\((.*)\)', response.text, re.S)
+            if not json_match:
+                raise ValueError("无法解析JSONP响应")
+            data = json.loads(json_match.group(1))
+        except (requests.RequestException, RetryError) as e:
+            print(f"请求错误: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"JSON解析错误: {e}")
+            return None
+        except Exception as e:
+            print(f"其他错误: {e}")
+            return None
+
+        with self._lock:
+            self._list_cache[key] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'data': data
+            }
+            self._save_cache()
+        return data
+
+    def video_info(self, video_guid):
+        """
+        获取视频信息（同一GUID只请求一次）
+
+        Returns:
+            dict: 接口返回的JSON，含 title、tag、segments、manifest 等
+        """
+        with self._lock:
+            if video_guid in self._video_info:
+                self.stats['cache_hits'] += 1
+                return self._video_info[video_guid]
+        fingerprint = os.getenv("FINGERPRINT")
+        if not fingerprint:
+            fingerprint = "ABCD"
+        vtoken = generate_vtoken(fingerprint)
+        # https://vdn.apps.cntv.cn/api/getHttpVideoInfo.do?pid=98818820526f4fad8eb896022ad4b6b7&client=flash&im=0&tsp=1754358909&vn=2049&vc=7BA8ACCDA118481B230086E6730A49A6&uid=AB2BCC96F1DA979C99C5C4212F93172C&wlan=
+        params = {
+            'pid': video_guid,
+            'client': 'flash',
+            'im': '0',
+            'tsp': vtoken['timestamp'],
+            'vn': '2049',
+            'vc': vtoken['vtoken'],
+            'uid': fingerprint,
+            'wlan': ''
+        }
+        response = self._get(self.info_url, params=params)
+        response.raise_for_status()
+        info = response.json()
+        with self._lock:
+            self._video_info[video_guid] = info
+        return info
+
+    def master_playlist(self, video_guid):
+        """
+        获取并解析视频的主播放列表（同一GUID只请求一次）
+
+        Returns:
+            MasterPlaylist
+        """
+        with self._lock:
+            if video_guid in self._master:
+                self.stats['cache_hits'] += 1
+                return self._master[video_guid]
+        from hls_parser import parse_master_playlist
+
+        target_url = self.video_info(video_guid)['manifest']['hls_enc_url']
+        response = self._get(target_url)
+        response.raise_for_status()
+        playlist = parse_master_playlist(response.text, target_url)
+        with self._lock:
+            self._master[video_guid] = playlist
+        return playlist
+
+    def mirror_hosts(self, video_guid, extra=()):
+        """
+        下载时可选的CDN主机：配置的镜像加上视频信息中各清单地址的主机
+
+        不一定每个主机都提供非加密路径，下载器探测时会把失败的主机排到最后。
+
+        Args:
+            extra: 额外配置的镜像主机
+        Returns:
+            list: 主机列表（去重，保持顺序）
+        """
+        from urllib.parse import urlparse
+
+        hosts = [host.strip() for host in extra if host.strip()]
+        manifest = self.video_info(video_guid).get('manifest', {})
+        for key in ('hls_url', 'hls_enc_url', 'hls_enc2_url'):
+            netloc = urlparse(manifest.get(key) or '').netloc
+            if netloc and netloc not in hosts:
+                hosts.append(netloc)
+        return hosts
+
+    def resolve(self, video_guid, variant_policy="lowest"):
+        """
+        获取视频信息并按策略选出要下载的媒体播放列表
+
+        Returns:
+            tuple: (播放列表URL, 标题, 分段列表, 标签)
+        """
+        from hls_parser import select_variant
+        from urllib.parse import urlparse
+
+        info = self.video_info(video_guid)
+        playlist = self.master_playlist(video_guid)
+        for variant in playlist.variants:
+            print(f"可用档位: {variant.bandwidth // 1000} kbps {variant.resolution} {variant.codecs}")
+        variant_url = urlparse(select_variant(playlist, variant_policy))
+        # https://hls.cntv.lxdns.com/asp/hls/450/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/450.m3u8
+        # 未确认CNTV的 /enc 档位是标准的 AES-128 HLS，仍改写为已在生产中验证的不加密地址；
+        # 下载器的AES-128解密用于其他标准加密的播放列表（命令行直接下载时）
+        if self.hls_host:
+            variant_url = variant_url._replace(scheme="https", netloc=self.hls_host,
+                                               path=variant_url.path.replace("/enc", ""))
+        return variant_url.geturl(), info['title'], info.get('segments', []), info['tag']
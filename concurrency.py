@@ -0,0 +1,181 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class AdaptiveLimiter:
+    """
+    AIMD自适应并发控制器
+
+    每个成功的请求使并发上限增加 1/limit（约每轮增加1），遇到错误、429或5xx时
+    乘性减小（每个RTT最多减一次）。每完成一轮（约limit个请求）统计一次吞吐与
+    平均延迟：如果提高并发后吞吐几乎不变而延迟明显上升，说明已越过拐点，
+    回退到上一轮的并发数。
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.5):
+        """
+        Args:
+            initial: 初始并发数
+            min_limit: 最小并发数
+            max_limit: 最大并发数
+            backoff: 出错时的乘性减小系数
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.successes = 0
+        self.errors = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+        # acquire_async() 的等待者 (事件循环, future)，名额释放时唤醒，不轮询
+        self._async_waiters = deque()
+        self._in_flight = 0
+        self._srtt = None
+        self._last_decrease = 0.0
+        self._history = []
+        self._prev = None
+        self._reset_window(time.monotonic())
+
+    def acquire(self):
+        """阻塞直到在途请求数低于当前上限"""
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def try_acquire(self):
+        with self._cond:
+            if self._in_flight >= int(self.limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    async def acquire_async(self):
+        """acquire() 的异步版本：名额不足时挂起，由 release()/上限提高时唤醒"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._in_flight < int(self.limit):
+                    self._in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._notify()
+
+    def _notify(self):
+        """调用方须持有锁：唤醒所有同步与异步等待者，由它们重新检查名额"""
+        self._cond.notify_all()
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def record(self, latency, size, status=None, error=False):
+        """
+        记录一次请求结果
+
+        Args:
+            latency: 请求耗时（秒）
+            size: 传输字节数
+            status: HTTP状态码（如有）
+            error: 是否失败（超时、连接错误等）
+        """
+        now = time.monotonic()
+        with self._cond:
+            if status is not None and status < 500 and status != 429:
+                # 404等客户端错误与拥塞无关
+                self.errors += 1
+                return
+            if error or status == 429 or (status is not None and status >= 500):
+                self.errors += 1
+                if status == 429 or (status is not None and status >= 500):
+                    self.throttled += 1
+                if now - self._last_decrease > (self._srtt or 0):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self._prev = None
+                    self._reset_window(now)
+                return
+
+            self.successes += 1
+            self._srtt = latency if self._srtt is None else 0.8 * self._srtt + 0.2 * latency
+            self._window_count += 1
+            self._window_bytes += size
+            self._window_latency += latency
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if self._window_count >= max(4, int(self._window_limit)):
+                self._close_window(now)
+            self._notify()
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_limit = int(self.limit)
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+
+    def _close_window(self, now):
+        elapsed = max(now - self._window_start, 1e-6)
+        throughput = self._window_bytes / elapsed
+        latency = self._window_latency / self._window_count
+        current = (self._window_limit, throughput, latency)
+        prev = self._prev
+        if prev and current[0] > prev[0] and throughput < prev[1] * 1.05 and latency > prev[2] * 1.2:
+            # 越过拐点：并发增加带来的只是排队延迟
+            self.limit = float(max(self.min_limit, prev[0]))
+            current = prev
+        self._history.append((self._window_limit, throughput))
+        self._prev = current
+        self._reset_window(now)
+
+    def summary(self):
+        """返回最终稳定的并发数与观测到的吞吐"""
+        with self._cond:
+            recent = sorted(limit for limit, _ in self._history[-5:])
+            settled = recent[len(recent) // 2] if recent else int(self.limit)
+            best = max((throughput for _, throughput in self._history), default=0.0)
+            return {
+                'concurrency': settled,
+                'peak_throughput_bps': best,
+                'successes': self.successes,
+                'errors': self.errors,
+                'throttled': self.throttled
+            }
+
+
+def _wake(waiter):
+    # 等待的任务可能已被取消
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class TokenBucket:
+    """令牌桶限速（字节/秒）"""
+
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate: 每秒允许的字节数
+            burst: 桶容量，默认等于一秒的流量
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        """扣除size个令牌，返回调用方需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= size
+            return max(0.0, -self._tokens / self.rate)
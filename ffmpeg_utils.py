@@ -0,0 +1,266 @@
+import os
+import re
+import csv
+import shutil
+import subprocess
+
+
+def find_ffmpeg(name="ffmpeg"):
+    """
+    查找ffmpeg/ffprobe可执行文件
+
+    优先使用环境变量 FFMPEG_BINARY / FFPROBE_BINARY，其次在PATH中查找。
+    找不到时返回None。
+    """
+    env = os.getenv(f"{name.upper()}_BINARY")
+    if env and os.path.exists(env):
+        return env
+    return shutil.which(name)
+
+
+def run_ffmpeg(args, ffmpeg=None, input_data=None):
+    """
+    运行ffmpeg
+
+    Args:
+        args: ffmpeg参数（不含可执行文件本身）
+        ffmpeg: ffmpeg路径，默认自动查找
+        input_data: 写入stdin的数据
+    Returns:
+        bool: 是否成功
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        print("错误: 未找到ffmpeg")
+        return False
+    command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y']
+    if input_data is None:
+        command.append('-nostdin')
+    result = subprocess.run(
+        command + list(args),
+        input=input_data,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        print(f"ffmpeg执行失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return False
+    return True
+
+
+def probe_audio_codec(path, ffprobe=None):
+    """
+    用ffprobe获取第一条音轨的编码名称
+
+    Returns:
+        str: 如 "aac"、"mp3"；没有音轨或没有ffprobe时返回None
+    """
+    ffprobe = ffprobe or find_ffmpeg("ffprobe")
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=codec_name', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    codec = result.stdout.decode('utf-8', errors='replace').strip()
+    return codec or None
+
+
+def remux_to_mp4(inputs, output_path, fragmented=False, ffmpeg=None):
+    """
+    将按顺序排列的MPEG-TS片段无损封装（-c copy）为MP4
+
+    Args:
+        inputs: ts文件路径列表（多个时使用concat demuxer）
+        output_path: 输出mp4路径
+        fragmented: True输出分片MP4（fMP4），否则输出moov前置的faststart MP4
+        ffmpeg: ffmpeg路径
+    Returns:
+        bool: 是否成功
+    """
+    part_path = output_path + '.part'
+    list_path = output_path + '.concat.txt'
+    if len(inputs) == 1:
+        input_args = ['-i', inputs[0]]
+    else:
+        with open(list_path, 'w', encoding='utf-8') as fp:
+            for ts_file in inputs:
+                escaped = os.path.abspath(ts_file).replace("'", "'\\''")
+                fp.write(f"file '{escaped}'\n")
+        input_args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+
+    movflags = '+frag_keyframe+empty_moov+default_base_moof' if fragmented else '+faststart'
+    try:
+        success = run_ffmpeg(input_args + [
+            '-map', '0:v?', '-map', '0:a?',
+            '-c', 'copy',
+            '-movflags', movflags,
+            '-f', 'mp4', part_path
+        ], ffmpeg=ffmpeg)
+        if success:
+            os.replace(part_path, output_path)
+        return success
+    finally:
+        for path in (part_path, list_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class RemuxPipe:
+    """
+    通过stdin把按顺序写入的MPEG-TS数据交给ffmpeg无损封装为MP4，边下载边封装
+
+    用法: start() 后反复 write()，全部写完调用 finish()；出错时调用 abort()。
+    """
+
+    def __init__(self, output_path, fragmented=False, ffmpeg=None):
+        """
+        Args:
+            output_path: 输出mp4路径（封装成功后由 .part 重命名）
+            fragmented: True输出分片MP4（fMP4），否则输出moov前置的faststart MP4
+            ffmpeg: ffmpeg路径
+        """
+        self.output_path = output_path
+        self.part_path = output_path + '.part'
+        self.fragmented = fragmented
+        self.ffmpeg = ffmpeg or find_ffmpeg()
+        self.process = None
+        self._stderr = None
+
+    def start(self):
+        if not self.ffmpeg:
+            print("错误: 未找到ffmpeg")
+            return False
+        import tempfile
+
+        movflags = '+frag_keyframe+empty_moov+default_base_moof' if self.fragmented else '+faststart'
+        # stderr写入临时文件，避免管道写满阻塞ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+             '-f', 'mpegts', '-i', 'pipe:0',
+             '-map', '0:v?', '-map', '0:a?',
+             '-c', 'copy',
+             '-movflags', movflags,
+             '-f', 'mp4', self.part_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr
+        )
+        return True
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def finish(self):
+        """关闭输入并等待ffmpeg结束，返回是否成功"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        returncode = self.process.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode('utf-8', errors='replace').strip()
+        self._stderr.close()
+        if returncode != 0:
+            print(f"ffmpeg执行失败: {error}")
+            self._remove_part()
+            return False
+        os.replace(self.part_path, self.output_path)
+        return True
+
+    def abort(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+            elif self.process.returncode != 0:
+                # ffmpeg先退出导致写入失败时，打印它的错误信息
+                self._stderr.seek(0)
+                print(f"ffmpeg执行失败: {self._stderr.read().decode('utf-8', errors='replace').strip()}")
+        if self._stderr is not None and not self._stderr.closed:
+            self._stderr.close()
+        self._remove_part()
+
+    def _remove_part(self):
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+def probe_duration(path, ffprobe=None):
+    """用ffprobe获取媒体时长（秒），失败时返回None"""
+    ffprobe = ffprobe or find_ffmpeg("ffprobe")
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_entries', 'format=duration',
+         '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        return float(result.stdout.decode('utf-8', errors='replace').strip())
+    except ValueError:
+        return None
+
+
+def detect_silences(path, noise_db=-35, min_duration=0.4, ffmpeg=None):
+    """
+    用ffmpeg的silencedetect滤镜查找静音区间
+
+    Returns:
+        list: [(start, end), ...]，单位秒
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        return []
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-nostdin', '-i', path,
+         '-af', f'silencedetect=noise={noise_db}dB:d={min_duration}', '-f', 'null', '-'],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    silences = []
+    start = None
+    for line in result.stderr.decode('utf-8', errors='replace').splitlines():
+        match = re.search(r'silence_start: (-?[\d.]+)', line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = re.search(r'silence_end: ([\d.]+)', line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def split_audio(path, cut_times, output_dir, ffmpeg=None):
+    """
+    在指定时间点把音频无损切分（-c copy）为多个文件
+
+    Args:
+        path: 输入音频
+        cut_times: 切分点列表（秒，升序）
+        output_dir: 输出目录
+    Returns:
+        list: [(chunk_path, start, end), ...]，start/end为切片在原音频中的实际时间；失败返回None
+    """
+    ext = os.path.splitext(path)[1] or '.mp3'
+    pattern = os.path.join(output_dir, f"chunk_%04d{ext}")
+    list_path = os.path.join(output_dir, "chunks.csv")
+    args = ['-i', path, '-map', '0:a:0', '-c', 'copy', '-f', 'segment',
+            '-reset_timestamps', '1', '-segment_list', list_path, '-segment_list_type', 'csv']
+    if cut_times:
+        args += ['-segment_times', ','.join(f"{t:.3f}" for t in cut_times)]
+    else:
+        args += ['-segment_time', '86400']
+    if not run_ffmpeg(args + [pattern], ffmpeg=ffmpeg):
+        return None
+    chunks = []
+    with open(list_path, 'r', encoding='utf-8') as fp:
+        for row in csv.reader(fp):
+            if len(row) >= 3:
+                chunks.append((os.path.join(output_dir, row[0]), float(row[1]), float(row[2])))
+    return chunks
@@ -1,6 +1,253 @@
+import os
+import json
+import zlib
+import base64
+import sqlite3
+import hashlib
 import requests
 import argparse
 
+STATE_DB = "state.db"
+# 记录上次同步结果的旁路文件：gist的ETag、整库哈希、各分片哈希
+SYNC_SIDECAR = "state.db.sync.json"
+MANIFEST_FILE = "state.manifest.json"
+MANIFEST_VERSION = 1
+# 按GUID的稳定哈希把各期记录分到固定数量的分片，新增或更新几期只改变对应的几个分片；
+# gist API最多列出300个文件，64个分片在上万期时单片压缩+base64后仍远小于1MB的截断阈值
+SHARD_COUNT = 64
+SHARD_PREFIX = f"{STATE_DB}.shard-"
+META_SHARD = f"{STATE_DB}.meta"
+# 按GUID分片的表与各自的排序主键；meta表单独一个分片
+SHARDED_TABLES = {"episodes": "guid", "stages": "guid, stage"}
+API_URL = "https://api.github.com"
+
+
+def shard_name(guid):
+    """GUID所在的分片，由GUID的哈希决定，与记录数量和插入顺序无关"""
+    bucket = int(hashlib.sha1(guid.encode("utf-8")).hexdigest()[:8], 16) % SHARD_COUNT
+    return f"{SHARD_PREFIX}{bucket:02d}"
+
+
+class GistSync:
+    """
+    state.db 与 gist 之间的增量同步
+
+    保存时：按表导出记录，同一GUID的记录放入同一个分片（见 shard_name），各分片按主键排序后
+    单独zlib压缩、base64编码；整体哈希与上次同步一致则不发任何请求，否则只PATCH内容有变化的分片和清单。
+    恢复时：本地库未改动时带 If-None-Match 请求，gist未变化（304）则不下载任何内容；
+    保存后另发一次HEAD请求记录gist的ETag（PATCH响应的ETag与GET不同，不能用于条件请求）。
+    """
+
+    def __init__(self, gist_id, token=None, api_url=API_URL, db_path=STATE_DB, sidecar_path=SYNC_SIDECAR):
+        """
+        Args:
+            gist_id: gist ID
+            token: GitHub token
+            api_url: GitHub API 地址，可指向本地测试服务
+            db_path: 状态库路径
+            sidecar_path: 同步记录路径
+        """
+        self.gist_url = f"{api_url.rstrip('/')}/gists/{gist_id}"
+        self.db_path = db_path
+        self.sidecar_path = sidecar_path
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        })
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def _load_sidecar(self):
+        try:
+            with open(self.sidecar_path, "r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_sidecar(self, sidecar):
+        tmp_path = self.sidecar_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(sidecar, fp)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def _dump_shards(self):
+        """
+        导出状态库的记录
+
+        Returns:
+            dict: {分片名: 分片内容(bytes)}，内容由按主键排序的记录确定，与数据库文件的页布局无关
+        """
+        from state_ledger import StateLedger
+        # 建表（旧库也补齐表结构），读取时包含WAL中的内容
+        StateLedger(self.db_path).close()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            shards = {}
+            for table, order in SHARDED_TABLES.items():
+                for row in conn.execute(f"SELECT * FROM {table} ORDER BY {order}"):
+                    shards.setdefault(shard_name(row[0]), {}).setdefault(table, []).append(list(row))
+            shards[META_SHARD] = {"meta": [list(row) for row in conn.execute("SELECT * FROM meta ORDER BY key")]}
+        finally:
+            conn.close()
+        return {name: json.dumps(tables, sort_keys=True, separators=(",", ":")).encode("utf-8")
+                for name, tables in shards.items()}
+
+    @staticmethod
+    def _digest(shards):
+        """整个状态的哈希：各分片名与分片哈希按名称排序后的哈希"""
+        return hashlib.sha256("".join(f"{name}:{sha}\n" for name, sha in sorted(shards.items()))
+                              .encode("utf-8")).hexdigest()
+
+    def _fetch_etag(self):
+        """HEAD请求gist，取得与GET响应一致的ETag；失败时返回None"""
+        try:
+            resp = self.session.head(self.gist_url)
+        except requests.RequestException:
+            return None
+        return resp.headers.get("ETag") if resp.ok else None
+
+    def save(self):
+        """
+        上传本地状态
+
+        Returns:
+            bool: 是否成功（无需上传也算成功）
+        """
+        if not os.path.exists(self.db_path):
+            print(f"{self.db_path} not found, nothing to save")
+            return True
+        contents = self._dump_shards()
+        shards = {name: hashlib.sha256(content).hexdigest() for name, content in contents.items()}
+        digest = self._digest(shards)
+        sidecar = self._load_sidecar()
+        if sidecar.get("sha256") == digest:
+            print("no need to update")
+            return True
+
+        synced = sidecar.get("shards", {})
+        files = {}
+        for name, content in contents.items():
+            if synced.get(name) != shards[name]:
+                files[name] = {"content": base64.b64encode(zlib.compress(content, 9)).decode("ascii")}
+        for name in synced:
+            if name not in shards:
+                files[name] = None
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "encoding": "zlib+base64",
+            "sha256": digest,
+            "shards": [{"name": name, "sha256": sha} for name, sha in sorted(shards.items())]
+        }
+        files[MANIFEST_FILE] = {"content": json.dumps(manifest)}
+
+        body = json.dumps({"files": files}).encode("utf-8")
+        resp = self.session.patch(self.gist_url, data=body, headers={"Content-Type": "application/json"})
+        self.bytes_sent += len(body)
+        if not resp.ok:
+            print("Error: ", resp.text)
+            return False
+        self._save_sidecar({"etag": self._fetch_etag(), "sha256": digest, "shards": shards})
+        uploaded = sum(1 for name, entry in files.items() if entry is not None and name != MANIFEST_FILE)
+        print(f"gist saved! {uploaded}/{len(shards)} shards uploaded ({len(body)} bytes)")
+        return True
+
+    def restore(self):
+        """
+        下载状态到本地
+
+        Returns:
+            bool: 是否成功（gist未变化也算成功）
+        """
+        sidecar = self._load_sidecar()
+        headers = {}
+        if sidecar.get("etag") and sidecar.get("sha256") and os.path.exists(self.db_path):
+            contents = self._dump_shards()
+            local_digest = self._digest({name: hashlib.sha256(content).hexdigest()
+                                         for name, content in contents.items()})
+            if local_digest == sidecar["sha256"]:
+                headers["If-None-Match"] = sidecar["etag"]
+        resp = self.session.get(self.gist_url, headers=headers)
+        if resp.status_code == 304:
+            print(f"{self.db_path} is up to date")
+            return True
+        if not resp.ok:
+            print("Error: ", resp.text)
+            return False
+        self.bytes_received += len(resp.content)
+        files = resp.json().get("files", {})
+        etag = resp.headers.get("ETag")
+
+        if MANIFEST_FILE in files:
+            return self._restore_records(files, json.loads(self._file_content(files[MANIFEST_FILE])), etag)
+        if "passed.json" in files:
+            # 更早的版本只同步了passed.json，由main.py首次运行时导入state.db
+            with open("passed.json", "w", encoding="utf-8") as fp:
+                fp.write(self._file_content(files["passed.json"]))
+            print("passed.json restored!")
+        else:
+            print("gist is empty, nothing to restore")
+        return True
+
+    def _restore_records(self, files, manifest, etag):
+        """校验各分片后由其中的记录重建状态库"""
+        from state_ledger import StateLedger
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            print(f"Error: unsupported manifest version {manifest.get('version')}")
+            return False
+        tables = {}
+        shards = {}
+        for shard in manifest["shards"]:
+            if shard["name"] not in files:
+                print(f"Error: shard {shard['name']} missing from gist")
+                return False
+            content = zlib.decompress(base64.b64decode(self._file_content(files[shard["name"]])))
+            if hashlib.sha256(content).hexdigest() != shard["sha256"]:
+                print(f"Error: shard {shard['name']} is corrupted")
+                return False
+            shards[shard["name"]] = shard["sha256"]
+            for table, rows in json.loads(content).items():
+                tables.setdefault(table, []).extend(rows)
+        if self._digest(shards) != manifest["sha256"]:
+            print("Error: restored state does not match manifest")
+            return False
+
+        tmp_path = self.db_path + ".tmp"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(tmp_path + suffix):
+                os.remove(tmp_path + suffix)
+        StateLedger(tmp_path).close()
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with conn:
+                for table, rows in tables.items():
+                    if rows:
+                        placeholders = ", ".join("?" * len(rows[0]))
+                        conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        for suffix in ("-wal", "-shm"):
+            for path in (tmp_path + suffix, self.db_path + suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+        os.replace(tmp_path, self.db_path)
+        self._save_sidecar({"etag": etag, "sha256": manifest["sha256"], "shards": shards})
+        print(f"{self.db_path} restored! ({sum(len(rows) for rows in tables.values())} records)")
+        return True
+
+    def _file_content(self, entry):
+        """gist API对超过1MB的文件只返回截断内容，此时改用raw_url下载"""
+        if entry.get("truncated") and entry.get("raw_url"):
+            resp = self.session.get(entry["raw_url"])
+            resp.raise_for_status()
+            self.bytes_received += len(resp.content)
+            return resp.text
+        return entry["content"]
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='restore or save gist')
@@ -8,33 +255,9 @@ if __name__ == '__main__':
     parser.add_argument('--save', default=False, action="store_true", help='is save?')
     parser.add_argument('--token', type=str, required=True, help='github token')
     parser.add_argument('--id', type=str, required=True, help='gist id')
-    parser.add_argument('--owner', type=str, required=True, help='gist owner')
+    parser.add_argument('--api-url', type=str, default=API_URL, help='GitHub API url')
     args = parser.parse_args()
-    
-    if args.save:
-        with open("passed.json", "r", encoding="utf-8") as fp:
-            passed = fp.read()
-            resp = requests.get(f'https://gist.githubusercontent.com/{args.owner}/{args.id}/raw/passed.json')
-            if passed == resp.text:
-                print("no need to update")
-                exit()
-            resp = requests.patch(f'https://api.github.com/gists/{args.id}', json={
-                "files": {
-                    "passed.json": { "content": passed }
-                }
-            }
-            , headers={
-                "Accept": "application/vnd.github+json",
-                "Authorization": f'Bearer {args.token}',
-                "X-GitHub-Api-Version": "2022-11-28"
-            })
-            if resp.ok:
-                print("gist saved!")
-            else:
-                print("Error: ", resp.text)
-    else:
-        resp = requests.get(f'https://gist.githubusercontent.com/{args.owner}/{args.id}/raw/passed.json')
-        with open("passed.json", "w", encoding="utf-8") as fp:
-            fp.write(resp.text)
-            print("passed.json restored!")
-    
\ No newline at end of file
+
+    sync = GistSync(args.id, args.token, args.api_url)
+    ok = sync.save() if args.save else sync.restore()
+    exit(0 if ok else 1)
@@ -0,0 +1,81 @@
+import threading
+
+try:
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+AES_BLOCK_SIZE = 16
+
+
+def crypto_available():
+    return Cipher is not None
+
+
+class KeyCache:
+    """
+    一次下载任务内的密钥缓存
+
+    同一个 EXT-X-KEY URI 只请求一次；并发的工作线程等待第一次请求的结果，
+    而不是各自重复请求密钥服务器。
+    """
+
+    def __init__(self, fetch):
+        """
+        Args:
+            fetch: fetch(uri) -> bytes，下载密钥的函数（通常复用下载器的会话与重试策略）
+        """
+        self.fetch = fetch
+        self.requests = 0
+        self._keys = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, uri):
+        with self._lock:
+            if uri in self._keys:
+                return self._keys[uri]
+            lock = self._locks.setdefault(uri, threading.Lock())
+        with lock:
+            with self._lock:
+                if uri in self._keys:
+                    return self._keys[uri]
+                self.requests += 1
+            key = self.fetch(uri)
+            if len(key) != AES_BLOCK_SIZE:
+                raise ValueError(f"AES-128密钥长度应为16字节，实际为 {len(key)} 字节: {uri}")
+            with self._lock:
+                self._keys[uri] = key
+            return key
+
+
+class SegmentDecryptor:
+    """
+    AES-128-CBC 流式解密一个片段
+
+    update() 接收任意长度的密文块，返回已能确定的明文；PKCS7填充在最后一个块里，
+    finalize() 去掉填充并返回剩余明文。解密由OpenSSL完成，不需要先收齐整个片段。
+    """
+
+    def __init__(self, key, iv):
+        if Cipher is None:
+            raise RuntimeError("解密HLS片段需要安装 cryptography (pip install cryptography)")
+        self._decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+        self._unpadder = padding.PKCS7(AES_BLOCK_SIZE * 8).unpadder()
+
+    def update(self, chunk):
+        return self._unpadder.update(self._decryptor.update(chunk))
+
+    def finalize(self):
+        return self._unpadder.update(self._decryptor.finalize()) + self._unpadder.finalize()
+
+
+def encrypt_segment(data, key, iv):
+    """AES-128-CBC + PKCS7 加密（测试服务器生成加密片段用）"""
+    if Cipher is None:
+        raise RuntimeError("需要安装 cryptography (pip install cryptography)")
+    padder = padding.PKCS7(AES_BLOCK_SIZE * 8).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    padded = padder.update(data) + padder.finalize()
+    return encryptor.update(padded) + encryptor.finalize()
@@ -0,0 +1,248 @@
+import re
+from urllib.parse import urljoin
+
+ATTRIBUTE_RE = re.compile(r'\s*([A-Z0-9-]+)=("[^"]*"|[^,]*)\s*,?')
+
+AUDIO_CODEC_PREFIXES = ('mp4a', 'ac-3', 'ec-3', 'opus', 'flac', 'mp3')
+
+
+def parse_attributes(text):
+    """
+    解析m3u8标签的属性列表
+
+    例: 'PROGRAM-ID=1, BANDWIDTH=460800, CODECS="avc1.4d401e,mp4a.40.2"'
+    -> {'PROGRAM-ID': '1', 'BANDWIDTH': '460800', 'CODECS': 'avc1.4d401e,mp4a.40.2'}
+    """
+    attrs = {}
+    for match in ATTRIBUTE_RE.finditer(text):
+        value = match.group(2).strip()
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        attrs[match.group(1)] = value
+    return attrs
+
+
+class Variant:
+    """#EXT-X-STREAM-INF 描述的一个码率档位"""
+
+    def __init__(self, uri, attrs):
+        self.uri = uri
+        self.attrs = attrs
+        self.bandwidth = int(attrs.get('BANDWIDTH', 0) or 0)
+        self.codecs = [c.strip() for c in attrs.get('CODECS', '').split(',') if c.strip()]
+        self.audio_group = attrs.get('AUDIO')
+        self.resolution = None
+        if 'RESOLUTION' in attrs and 'x' in attrs['RESOLUTION']:
+            width, height = attrs['RESOLUTION'].lower().split('x', 1)
+            self.resolution = (int(width), int(height))
+
+    @property
+    def audio_only(self):
+        """CODECS中只有音频编码"""
+        if self.codecs:
+            return all(c.lower().startswith(AUDIO_CODEC_PREFIXES) for c in self.codecs)
+        return False
+
+    def __repr__(self):
+        return f"Variant(bandwidth={self.bandwidth}, resolution={self.resolution}, uri={self.uri!r})"
+
+
+class Media:
+    """#EXT-X-MEDIA 描述的一个备选轨道（音频、字幕等）"""
+
+    def __init__(self, attrs, base_url):
+        self.attrs = attrs
+        self.type = attrs.get('TYPE')
+        self.group_id = attrs.get('GROUP-ID')
+        self.name = attrs.get('NAME')
+        self.language = attrs.get('LANGUAGE')
+        self.default = attrs.get('DEFAULT') == 'YES'
+        self.uri = urljoin(base_url, attrs['URI']) if attrs.get('URI') else None
+
+    def __repr__(self):
+        return f"Media(type={self.type}, group={self.group_id}, name={self.name!r}, uri={self.uri!r})"
+
+
+class MasterPlaylist:
+    def __init__(self, variants, media):
+        self.variants = variants
+        self.media = media
+
+
+def is_master_playlist(content):
+    return '#EXT-X-STREAM-INF' in content
+
+
+def parse_master_playlist(content, base_url):
+    """
+    解析主播放列表
+
+    Args:
+        content: m3u8文本
+        base_url: 用于拼接相对路径的URL
+    Returns:
+        MasterPlaylist
+    """
+    variants = []
+    media = []
+    pending = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending = parse_attributes(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MEDIA:'):
+            media.append(Media(parse_attributes(line.split(':', 1)[1]), base_url))
+        elif line.startswith('#'):
+            continue
+        elif pending is not None:
+            variants.append(Variant(urljoin(base_url, line), pending))
+            pending = None
+    return MasterPlaylist(variants, media)
+
+
+class Key:
+    """#EXT-X-KEY 描述的加密方式"""
+
+    def __init__(self, attrs, base_url):
+        self.attrs = attrs
+        self.method = attrs.get('METHOD', 'NONE').upper()
+        self.uri = urljoin(base_url, attrs['URI']) if attrs.get('URI') else None
+        self.iv = None
+        if attrs.get('IV'):
+            self.iv = bytes.fromhex(attrs['IV'][2:] if attrs['IV'].lower().startswith('0x') else attrs['IV'])
+            self.iv = self.iv.rjust(16, b'\0')
+
+    def iv_for(self, sequence):
+        """没有显式IV时，以片段的媒体序列号（128位大端）作为IV"""
+        return self.iv if self.iv is not None else sequence.to_bytes(16, 'big')
+
+    def __repr__(self):
+        return f"Key(method={self.method}, uri={self.uri!r}, iv={self.iv.hex() if self.iv else None})"
+
+
+class Segment:
+    """媒体播放列表中的一个片段"""
+
+    def __init__(self, uri, duration, sequence, key=None):
+        self.uri = uri
+        self.duration = duration
+        self.sequence = sequence
+        # 未加密（没有EXT-X-KEY或METHOD=NONE）时为None
+        self.key = key
+
+    @property
+    def iv(self):
+        return self.key.iv_for(self.sequence) if self.key else None
+
+    def __repr__(self):
+        return f"Segment(sequence={self.sequence}, uri={self.uri!r}, key={self.key!r})"
+
+
+class MediaPlaylist:
+    def __init__(self, segments, media_sequence=0, target_duration=None, endlist=False):
+        self.segments = segments
+        self.media_sequence = media_sequence
+        self.target_duration = target_duration
+        self.endlist = endlist
+
+    @property
+    def encrypted(self):
+        return any(segment.key for segment in self.segments)
+
+
+def parse_media_playlist(content, base_url):
+    """
+    解析媒体播放列表
+
+    EXT-X-KEY 对其后的所有片段生效，直到下一个 EXT-X-KEY；
+    片段序列号从 EXT-X-MEDIA-SEQUENCE 开始递增。
+
+    Args:
+        content: m3u8文本
+        base_url: 用于拼接相对路径的URL
+    Returns:
+        MediaPlaylist
+    """
+    segments = []
+    media_sequence = 0
+    target_duration = None
+    endlist = False
+    key = None
+    duration = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            media_sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-KEY:'):
+            key = Key(parse_attributes(line.split(':', 1)[1]), base_url)
+            if key.method == 'NONE':
+                key = None
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0] or 0)
+        elif line.startswith('#EXT-X-ENDLIST'):
+            endlist = True
+        elif line.startswith('#'):
+            continue
+        else:
+            segments.append(Segment(urljoin(base_url, line), duration, media_sequence + len(segments), key))
+            duration = None
+    return MediaPlaylist(segments, media_sequence, target_duration, endlist)
+
+
+def select_variant(playlist, policy="lowest"):
+    """
+    按策略选择要下载的播放列表URL
+
+    Args:
+        playlist: MasterPlaylist
+        policy: "lowest" 最低码率，"highest" 最高码率，"audio" 纯音频，
+                或目标分辨率如 "720"、"1280x720"（选最接近且不超过的档位）
+    Returns:
+        str: 媒体播放列表URL；没有可选档位时返回None
+    """
+    variants = sorted(playlist.variants, key=lambda v: v.bandwidth)
+    if policy == "audio":
+        audio_media = [m for m in playlist.media if m.type == 'AUDIO' and m.uri]
+        if audio_media:
+            chosen = next((m for m in audio_media if m.default), audio_media[0])
+            return chosen.uri
+        audio_variants = [v for v in variants if v.audio_only]
+        if audio_variants:
+            return audio_variants[0].uri
+        print("未找到纯音频档位，改用最低码率")
+        policy = "lowest"
+
+    # 视频策略只在含视频的档位中选择
+    variants = [v for v in variants if not v.audio_only] or variants
+    if not variants:
+        return None
+    if policy == "lowest":
+        return variants[0].uri
+    if policy == "highest":
+        return variants[-1].uri
+
+    target_height = _parse_target_height(policy)
+    sized = [v for v in variants if v.resolution]
+    if not sized:
+        return variants[0].uri
+    fitting = [v for v in sized if v.resolution[1] <= target_height]
+    if fitting:
+        best_height = max(v.resolution[1] for v in fitting)
+        return min((v for v in fitting if v.resolution[1] == best_height), key=lambda v: v.bandwidth).uri
+    return min(sized, key=lambda v: (v.resolution[1], v.bandwidth)).uri
+
+
+def _parse_target_height(policy):
+    text = str(policy).lower().rstrip('p')
+    if 'x' in text:
+        text = text.split('x', 1)[1]
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"不支持的档位选择策略: {policy}")
@@ -0,0 +1,282 @@
+import time
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Histogram
+
+
+class HedgeCancelled(Exception):
+    """同一片段的另一个请求已经先完成，本请求被放弃"""
+
+
+class HedgeRace:
+    """同一片段的主请求与对冲请求之间的竞争：第一个成功的请求获胜，其余请求尽快停止"""
+
+    def __init__(self):
+        self.cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._won = False
+
+    def claim(self):
+        with self._lock:
+            if self._won:
+                return False
+            self._won = True
+        self.cancel.set()
+        return True
+
+
+class HostStats:
+    def __init__(self, host):
+        self.host = host
+        self.rtt = None
+        self.throughput = None
+        # 每个片段耗时的指数加权平均，初始值来自探测
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+
+    def summary(self):
+        return {
+            'host': self.host,
+            'rtt': self.rtt,
+            'throughput_bps': self.throughput,
+            'segment_seconds': self.latency,
+            'requests': self.requests,
+            'errors': self.errors
+        }
+
+
+class HostSelector:
+    """
+    CDN镜像主机的选择、故障切换与对冲请求
+
+    - probe(): 并发请求各候选主机上的同一个片段，测量首字节时间(RTT)与吞吐，
+      估算每个主机下载一个完整片段的耗时并据此排序
+    - pick(attempt): 第attempt次尝试使用排名第attempt的主机，片段出错时下一次重试自动换主机
+    - record(): 用实际片段耗时（指数加权平均）更新排名；连续出错 max_errors 次的主机排到最后
+    - hedge_delay(): 片段耗时超过已观测耗时的 hedge_quantile 分位数时，向 hedge_host() 选出的另一个主机
+      发对冲请求，先完成者获胜；对冲请求数不超过总请求数的 hedge_budget，避免放大源站负载。
+      只有一个主机，或其他主机都连续出错时不对冲，不会把同一个请求重复发给正在变慢的主机
+
+    主机写作 "host[:port]"（沿用片段URL的协议）或 "scheme://host[:port]"。
+    """
+
+    def __init__(self, hosts=(), hedge=True, hedge_quantile=0.95, hedge_budget=0.1, min_samples=10,
+                 min_hedge_delay=0.05, max_errors=3, probe_bytes=256 * 1024, probe_timeout=5, alpha=0.3):
+        """
+        Args:
+            hosts: 备选镜像主机列表（播放列表所在主机在 prepare() 时自动加入并排在最前）
+            hedge: 是否发送对冲请求
+            hedge_quantile: 触发对冲的片段耗时分位数
+            hedge_budget: 对冲请求占总请求数的上限
+            min_samples: 观测到多少个片段耗时后改用分位数作为对冲阈值
+            min_hedge_delay: 对冲等待时间的下限（秒）
+            max_errors: 主机连续出错多少次后降到最低优先级
+            probe_bytes: 探测时每个主机最多读取的字节数
+            probe_timeout: 探测请求的超时（秒）
+            alpha: 片段耗时指数加权平均的系数
+        """
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.max_errors = max_errors
+        self.probe_bytes = probe_bytes
+        self.probe_timeout = probe_timeout
+        self.alpha = alpha
+        self.hosts = []
+        self.stats = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._requests = 0
+        self._latencies = Histogram(max_samples=2000)
+        self._hedge_delay = None
+        self._lock = threading.Lock()
+        for host in hosts:
+            self.add(host)
+
+    def add(self, host, first=False):
+        host = host.strip().rstrip('/')
+        if not host:
+            return
+        with self._lock:
+            if host in self.stats:
+                return
+            self.stats[host] = HostStats(host)
+            if first:
+                self.hosts.insert(0, host)
+            else:
+                self.hosts.append(host)
+
+    def prepare(self, playlist_url, probe_url, session):
+        """
+        开始一个下载任务：加入播放列表所在主机，有多个候选时探测并排序
+
+        Args:
+            playlist_url: 媒体播放列表URL，其主机作为默认主机
+            probe_url: 用于探测的片段URL
+            session: requests会话
+        """
+        self.add(urlparse(playlist_url).netloc, first=True)
+        if len(self.hosts) > 1:
+            self.probe(probe_url, session)
+        print("镜像主机排名: " + ", ".join(
+            f"{host} ({self.stats[host].latency:.2f}s)" if self.stats[host].latency is not None else host
+            for host in self.ranked()))
+
+    def probe(self, url, session):
+        """并发探测所有候选主机，失败的主机排到最后"""
+        with ThreadPoolExecutor(max_workers=len(self.hosts)) as executor:
+            list(executor.map(lambda host: self._probe_host(host, url, session), list(self.hosts)))
+
+    def _probe_host(self, host, url, session):
+        stats = self.stats[host]
+        started = time.monotonic()
+        try:
+            with session.get(self.route(url, host), timeout=self.probe_timeout, stream=True) as response:
+                response.raise_for_status()
+                first_byte = time.monotonic()
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received >= self.probe_bytes:
+                        break
+                finished = time.monotonic()
+                total = int(response.headers.get('Content-Length') or received)
+        except Exception as e:
+            print(f"探测主机失败 {host}: {e}")
+            self.record(host, time.monotonic() - started, 0, error=True)
+            with self._lock:
+                stats.consecutive_errors = self.max_errors
+            return
+        with self._lock:
+            stats.rtt = first_byte - started
+            stats.throughput = received / max(finished - first_byte, 1e-6)
+            stats.latency = stats.rtt + total / stats.throughput
+
+    def ranked(self):
+        """按优先级排序的主机列表"""
+        with self._lock:
+            return sorted(self.hosts, key=lambda host: (
+                self.stats[host].consecutive_errors >= self.max_errors,
+                self.stats[host].latency if self.stats[host].latency is not None else float('inf'),
+                self.hosts.index(host)
+            ))
+
+    def pick(self, attempt=0):
+        """第attempt次尝试使用的主机；选中的不是排名第一的主机时计为一次换主机"""
+        ranked = self.ranked()
+        host = ranked[attempt % len(ranked)]
+        if host != ranked[0]:
+            with self._lock:
+                self.failovers += 1
+        return host
+
+    def can_failover(self, attempt):
+        """
+        第attempt次尝试失败后，下一次尝试能否换到另一个没有连续出错的主机
+
+        所有备用主机都已连续出错（整体故障）时返回False，此时重试前应照常等待
+        """
+        ranked = self.ranked()
+        if len(ranked) < 2:
+            return False
+        host = ranked[(attempt + 1) % len(ranked)]
+        return self.stats[host].consecutive_errors < self.max_errors
+
+    def hedge_host(self, primary):
+        """
+        对冲请求使用的主机：除主请求所用主机外、没有连续出错的排名最前的主机
+
+        Returns:
+            str: 主机；没有这样的主机时返回None，此时不应对冲
+        """
+        for host in self.ranked():
+            if host != primary and self.stats[host].consecutive_errors < self.max_errors:
+                return host
+        return None
+
+    def route(self, url, host):
+        """把片段URL改写到指定主机；不属于任何候选主机的URL原样返回"""
+        parsed = urlparse(url)
+        if not any(self._netloc(candidate) == parsed.netloc for candidate in self.hosts):
+            return url
+        if '://' in host:
+            target = urlparse(host)
+            return parsed._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+        return parsed._replace(netloc=host).geturl()
+
+    @staticmethod
+    def _netloc(host):
+        return urlparse(host).netloc if '://' in host else host
+
+    def record(self, host, seconds, size, error=False):
+        """记录一次片段请求的结果"""
+        with self._lock:
+            stats = self.stats.get(host)
+            if stats is None:
+                return
+            stats.requests += 1
+            self._requests += 1
+            if error:
+                stats.errors += 1
+                stats.consecutive_errors += 1
+                if stats.latency is not None:
+                    stats.latency *= 2
+                return
+            stats.consecutive_errors = 0
+            if stats.latency is None:
+                stats.latency = seconds
+            else:
+                # 单个长尾请求最多按两倍计入，避免一次慢请求就把最快的主机排到后面
+                stats.latency = self.alpha * min(seconds, 2 * stats.latency) + (1 - self.alpha) * stats.latency
+            self._latencies.observe(seconds)
+            if self._latencies.count % 10 == 0:
+                self._hedge_delay = None
+
+    def hedge_delay(self):
+        """
+        对冲前等待的秒数；关闭对冲或少于两个主机时返回None
+
+        样本不足时用探测估算的最优主机片段耗时的4倍，也没有探测结果时返回None
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self.hosts) < 2:
+                return None
+            if self._latencies.count < self.min_samples:
+                probed = [stats.latency for stats in self.stats.values() if stats.latency is not None]
+                return max(self.min_hedge_delay, 4 * min(probed)) if probed else None
+            if self._hedge_delay is None:
+                # 分位数每10个样本重新计算一次
+                self._hedge_delay = max(self.min_hedge_delay, self._latencies.percentile(self.hedge_quantile))
+            return self._hedge_delay
+
+    def try_hedge(self):
+        """对冲预算内时计入一次对冲并返回True"""
+        with self._lock:
+            if self.hedged + 1 > self.hedge_budget * max(self._requests, self.min_samples):
+                return False
+            self.hedged += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def summary(self):
+        with self._lock:
+            hosts = [self.stats[host].summary() for host in self.hosts]
+            return {
+                'hosts': hosts,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'failovers': self.failovers,
+                'hedge_delay': self._hedge_delay
+            }
@@ -1,15 +1,270 @@
 import requests
+import asyncio
 import os
 import re
 import time
 import threading
-from urllib.parse import urljoin, urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import argparse
+import shutil
 import sys
+import hashlib
+from segment_journal import SegmentJournal, file_sha256
+from concurrency import AdaptiveLimiter, TokenBucket
+from hls_parser import is_master_playlist, parse_master_playlist, parse_media_playlist, select_variant
+from hls_crypto import KeyCache, SegmentDecryptor, crypto_available
+from host_selector import HostSelector, HedgeRace, HedgeCancelled
+from ffmpeg_utils import find_ffmpeg, remux_to_mp4, RemuxPipe
+from retry_policy import RetryPolicy, RetryError
+from metrics import METRICS
+from ts_validator import TSValidator, InvalidSegmentError
+
+CHUNK_SIZE = 64 * 1024
+# 异步引擎攒够这么多数据后交给线程写入（以及解密、校验、哈希），不阻塞事件循环
+ASYNC_WRITE_BATCH = 512 * 1024
+
+
+class SegmentBuffer:
+    """单个ts片段的接收缓冲区，超出内存配额时溢出到磁盘"""
+
+    def __init__(self, assembler, index):
+        self.assembler = assembler
+        self.index = index
+        self.size = 0
+        self.sha256 = None
+        self._chunks = []
+        self._reserved = 0
+        self._spill = None
+        self._spill_path = None
+
+    def write(self, chunk):
+        if self._spill is None and self.assembler._reserve(len(chunk)):
+            self._chunks.append(chunk)
+            self._reserved += len(chunk)
+        else:
+            if self._spill is None:
+                self._open_spill()
+            self._spill.write(chunk)
+        self.size += len(chunk)
+
+    def _open_spill(self):
+        """内存配额不足，把已缓冲的数据转存到临时文件"""
+        self._spill_path = os.path.join(self.assembler.spill_dir, f"segment_{self.index:06d}.ts.part")
+        self._spill = open(self._spill_path, 'wb')
+        for chunk in self._chunks:
+            self._spill.write(chunk)
+        self._chunks = []
+        self.assembler._release(self._reserved)
+        self._reserved = 0
+
+    def write_to(self, outfile):
+        """按顺序写入最终文件，并释放占用的内存/临时文件"""
+        if self._spill is not None:
+            self._spill.close()
+            with open(self._spill_path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, CHUNK_SIZE)
+        else:
+            for chunk in self._chunks:
+                outfile.write(chunk)
+        self.discard()
+
+    def discard(self):
+        """丢弃缓冲内容（下载失败重试或任务中止时）"""
+        self._chunks = []
+        self.assembler._release(self._reserved)
+        self._reserved = 0
+        if self._spill is not None:
+            self._spill.close()
+            try:
+                os.remove(self._spill_path)
+            except OSError:
+                pass
+            self._spill = None
+
+
+class SegmentAssembler:
+    """有界重排缓冲区：并发下载的片段由单个写线程按播放列表顺序追加到输出文件"""
+
+    def __init__(self, outfile, total, buffer_bytes, spill_dir, start=0, offset=0, on_written=None):
+        """
+        Args:
+            outfile: 已打开的输出文件对象
+            total: 片段总数
+            buffer_bytes: 内存中缓冲的最大字节数，超出部分溢出到磁盘
+            spill_dir: 溢出文件目录
+            start: 从第几个片段开始写（续传时跳过已写入的前缀）
+            offset: 输出文件当前的写入位置
+            on_written: 片段写入后的回调 on_written(buffer, offset)
+        """
+        self.outfile = outfile
+        self.total = total
+        self.buffer_bytes = buffer_bytes
+        self.spill_dir = spill_dir
+        self.offset = offset
+        self.on_written = on_written
+        self._cond = threading.Condition()
+        self._ready = {}
+        self._failed = set()
+        self._buffered = 0
+        self._next = start
+        self._aborted = False
+        self._error = None
+        self._writer = threading.Thread(target=self._run, daemon=True)
+
+    def _reserve(self, size):
+        with self._cond:
+            if self._buffered + size > self.buffer_bytes:
+                return False
+            self._buffered += size
+            return True
+
+    def _release(self, size):
+        if size:
+            with self._cond:
+                self._buffered -= size
+
+    def open_segment(self, index):
+        return SegmentBuffer(self, index)
+
+    def commit(self, buffer):
+        """片段下载完成，交给写线程"""
+        with self._cond:
+            if self._aborted or buffer.index < self._next:
+                buffer.discard()
+                return
+            self._ready[buffer.index] = buffer
+            self._cond.notify_all()
+
+    def fail(self, index):
+        """片段最终下载失败，写线程写到此处时中止"""
+        with self._cond:
+            self._failed.add(index)
+            self._cond.notify_all()
+
+    def start(self):
+        self._writer.start()
+
+    def finish(self):
+        """等待写线程结束，返回是否所有片段都已按顺序写入"""
+        self._writer.join()
+        return self._error is None and self._next == self.total
+
+    @property
+    def written(self):
+        return self._next
+
+    @property
+    def aborted(self):
+        return self._aborted
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (self._next < self.total and self._next not in self._ready
+                       and self._next not in self._failed):
+                    self._cond.wait()
+                if self._next >= self.total:
+                    return
+                if self._next in self._failed:
+                    self._abort()
+                    return
+                buffer = self._ready.pop(self._next)
+            try:
+                buffer.write_to(self.outfile)
+                if self.on_written:
+                    self.on_written(buffer, self.offset)
+            except Exception as e:
+                self._error = e
+                print(f"写入片段 {buffer.index} 失败: {e}")
+                with self._cond:
+                    self._abort()
+                return
+            with self._cond:
+                self.offset += buffer.size
+                self._next += 1
+
+    def _abort(self):
+        """调用方须持有锁：丢弃所有待写片段"""
+        self._aborted = True
+        for buffer in self._ready.values():
+            buffer.discard()
+        self._ready.clear()
+
+
+class _TeeWriter:
+    """写入输出文件的同时，把同样的有序字节交给下游（segment_sink、ffmpeg封装管道）"""
+
+    def __init__(self, outfile, *sinks):
+        self.outfile = outfile
+        self.sinks = sinks
+
+    def write(self, data):
+        self.outfile.write(data)
+        for sink in self.sinks:
+            sink.write(data)
+
+
+class _FileTarget:
+    """片段保存为 segment_XXXXXX.ts 文件，完成后记入下载日志"""
+
+    cancelled = False
+
+    def __init__(self, output_dir, journal):
+        self.output_dir = output_dir
+        self.journal = journal
+
+    def open(self, index, hedge=False):
+        # 对冲请求与主请求同时进行，写入单独的文件，获胜后再改名
+        path = os.path.join(self.output_dir, f"segment_{index:06d}.ts")
+        return open(f"{path}.hedge" if hedge else path, 'wb')
+
+    def complete(self, index, sink, size, sha256):
+        sink.close()
+        if sink.name.endswith('.hedge'):
+            os.replace(sink.name, sink.name[:-len('.hedge')])
+        self.journal.record(index, size, sha256, 'file')
+
+    def discard(self, sink):
+        sink.close()
+        if sink.name.endswith('.hedge'):
+            try:
+                os.remove(sink.name)
+            except OSError:
+                pass
+
+    def fail(self, index):
+        pass
+
+
+class _StreamTarget:
+    """片段写入重排缓冲区，由 SegmentAssembler 按顺序落盘"""
+
+    def __init__(self, assembler):
+        self.assembler = assembler
+
+    @property
+    def cancelled(self):
+        return self.assembler.aborted
+
+    def open(self, index, hedge=False):
+        return self.assembler.open_segment(index)
+
+    def complete(self, index, sink, size, sha256):
+        sink.sha256 = sha256
+        self.assembler.commit(sink)
+
+    def discard(self, sink):
+        sink.discard()
+
+    def fail(self, index):
+        self.assembler.fail(index)
+
 
 class M3U8Downloader:
-    def __init__(self, max_workers=10, timeout=30, retry_times=3):
+    def __init__(self, max_workers=10, timeout=30, retry_times=3, stream=False, buffer_mb=64, engine="thread",
+                 adaptive=False, max_bytes_per_sec=None, variant_policy="lowest", container="mp4",
+                 retry_policy=None, metrics=None, validate=True, hosts=None, hedge=True):
         """
         初始化M3U8下载器
         
@@ -17,10 +272,53 @@ class M3U8Downloader:
             max_workers: 最大并发下载线程数
             timeout: 请求超时时间（秒）
             retry_times: 重试次数
+            stream: 流式组装模式，片段按顺序直接写入最终文件，不落地临时ts文件
+            buffer_mb: 流式模式下重排缓冲区的内存上限（MB），超出部分溢出到磁盘
+            engine: 下载引擎，"thread" 为线程池，"async" 为 asyncio + aiohttp（aiohttp为可选依赖，未安装时警告并改用线程引擎）
+            adaptive: 自适应并发，按延迟/吞吐/错误率以AIMD方式调整在途请求数，max_workers为上限
+            max_bytes_per_sec: 下载总带宽上限（字节/秒），None为不限速
+            variant_policy: 传入主播放列表时的档位选择策略，见 hls_parser.select_variant
+            container: 输出封装，"mp4" 为moov前置的MP4，"fmp4" 为分片MP4（均需ffmpeg，无损封装），
+                       "ts" 为直接拼接的MPEG-TS
+            retry_policy: 获取m3u8的重试策略，默认按retry_times指数退避
+            metrics: 指标汇总，默认写入进程共享的 metrics.METRICS
+            validate: 边下载边校验.ts片段（包对齐、同步字节、连续计数器），
+                      不合格的片段立即重新下载
+            hosts: 备选CDN镜像主机列表；不为None时启用主机选择（见 host_selector.HostSelector）：
+                   探测并排序播放列表所在主机与这些主机，片段出错时换主机重试
+            hedge: 启用主机选择时，片段耗时超过p95后向次优主机发对冲请求
+        播放列表含 EXT-X-KEY (METHOD=AES-128) 时自动解密（需安装 cryptography），
+        输出、校验和续传日志都基于解密后的明文。
         """
+        if engine not in ("thread", "async"):
+            raise ValueError(f"不支持的下载引擎: {engine}")
+        if container not in ("mp4", "fmp4", "ts"):
+            raise ValueError(f"不支持的输出封装: {container}")
         self.max_workers = max_workers
         self.timeout = timeout
         self.retry_times = retry_times
+        self.stream = stream
+        self.buffer_bytes = int(buffer_mb * 1024 * 1024)
+        self.engine = engine
+        self.adaptive = adaptive
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.variant_policy = variant_policy
+        self.container = container
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=retry_times, base_delay=1, max_delay=10,
+                                                        name="playlist")
+        self.metrics = metrics or METRICS
+        self.validate = validate
+        self.output_path = None
+        # 流式模式下按播放列表顺序接收ts字节的对象（需有write方法），用于边下载边处理
+        self.segment_sink = None
+        self.concurrency_report = None
+        self._limiter = None
+        self._bucket = None
+        self._segment_keys = {}
+        self._key_cache = None
+        self.host_selector = HostSelector(hosts, hedge=hedge) if hosts is not None else None
+        self.host_report = None
+        self._hedge_pool = None
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -34,7 +332,12 @@ class M3U8Downloader:
             m3u8_url: m3u8文件URL
             output_dir: 输出目录
             filename: 输出文件名（不含扩展名）
+        成功后输出文件路径保存在 self.output_path
         """
+        with self.metrics.stage('download'):
+            return self._download_m3u8(m3u8_url, output_dir, filename)
+
+    def _download_m3u8(self, m3u8_url, output_dir, filename):
         print(f"开始下载: {m3u8_url}")
         
         # 创建输出目录
@@ -46,64 +349,151 @@ class M3U8Downloader:
         if not m3u8_content:
             print("无法获取m3u8内容")
             return False
+
+        # 主播放列表：按策略选择档位
+        if is_master_playlist(m3u8_content):
+            variant_url = select_variant(parse_master_playlist(m3u8_content, m3u8_url), self.variant_policy)
+            if not variant_url:
+                print("主播放列表中没有可用档位")
+                return False
+            print(f"选择档位: {variant_url}")
+            if not filename:
+                filename = self._generate_filename(m3u8_url)
+            m3u8_url = variant_url
+            m3u8_content = self._fetch_m3u8_content(m3u8_url)
+            if not m3u8_content:
+                print("无法获取m3u8内容")
+                return False
             
         # 解析m3u8文件
-        ts_urls = self._parse_m3u8(m3u8_url, m3u8_content)
+        playlist = parse_media_playlist(m3u8_content, m3u8_url)
+        ts_urls = [segment.uri for segment in playlist.segments]
         if not ts_urls:
             print("未找到ts片段")
             return False
             
         print(f"找到 {len(ts_urls)} 个ts片段")
+        if not self._prepare_keys(playlist):
+            return False
+        if self.host_selector:
+            self.host_selector.prepare(m3u8_url, ts_urls[0], self.session)
         
         # 设置输出文件名
         if not filename:
             filename = self._generate_filename(m3u8_url)
             
+        output_path = os.path.join(output_dir, f"{filename}.{'ts' if self.container == 'ts' else 'mp4'}")
+        ts_path = os.path.join(output_dir, f"{filename}.ts")
+
+        # 读取下载日志，断点续传
+        journal = SegmentJournal(os.path.join(output_dir, f"{filename}.journal"), m3u8_url, ts_urls)
+        journal.load()
+
+        if self.stream:
+            # 流式组装得到可续传的ts文件；需要MP4且有ffmpeg时，同样的有序字节同时送入ffmpeg边下载边封装，
+            # 下载结束时封装也随即完成，不必再读一遍ts；没有ffmpeg时ts直接作为输出
+            pipe = None
+            ffmpeg = find_ffmpeg() if self.container != 'ts' else None
+            if ffmpeg:
+                pipe = RemuxPipe(output_path, fragmented=self.container == 'fmp4', ffmpeg=ffmpeg)
+                if not pipe.start():
+                    pipe = None
+            if not self._download_ts_stream(ts_urls, output_dir, ts_path, journal, pipe):
+                if pipe is not None:
+                    pipe.abort()
+                journal.close()
+                print("下载ts片段失败，重新运行将从断点继续")
+                return False
+            if pipe is not None:
+                with self.metrics.stage('remux'):
+                    remuxed = pipe.finish()
+            else:
+                remuxed = ts_path == output_path or self._remux([ts_path], output_path)
+            if not remuxed:
+                journal.close()
+                print("封装MP4失败，重新运行将从已下载的ts重新封装")
+                return False
+            if os.path.exists(ts_path) and ts_path != output_path:
+                os.remove(ts_path)
+            journal.remove()
+            self.output_path = output_path
+            print(f"下载完成: {output_path}")
+            return True
+
         # 下载所有ts片段
-        ts_files = self._download_ts_segments(ts_urls, output_dir)
-        if not ts_files:
-            print("下载ts片段失败")
+        ts_files = self._download_ts_segments(ts_urls, output_dir, journal)
+        missing = journal.missing()
+        if missing:
+            journal.close()
+            print(f"仍有 {len(missing)} 个ts片段缺失 (序号: {missing[:10]})，拒绝合并；重新运行将只下载缺失片段")
             return False
             
         # 合并ts文件
-        output_path = os.path.join(output_dir, f"{filename}.mp4")
-        if self._merge_ts_files(ts_files, output_path):
+        if self.container == 'ts':
+            merged = self._merge_ts_files(ts_files, output_path)
+        else:
+            merged = self._remux(ts_files, output_path)
+        if merged:
             print(f"下载完成: {output_path}")
             
             # 清理临时ts文件
             self._cleanup_ts_files(ts_files)
+            journal.remove()
+            self.output_path = output_path
             return True
         else:
+            journal.close()
             print("合并文件失败")
             return False
     
     def _fetch_m3u8_content(self, url):
-        """获取m3u8文件内容"""
-        for i in range(self.retry_times):
-            try:
-                response = self.session.get(url, timeout=self.timeout)
-                response.raise_for_status()
-                return response.text
-            except Exception as e:
-                print(f"获取m3u8内容失败 (尝试 {i+1}/{self.retry_times}): {e}")
-                if i < self.retry_times - 1:
-                    time.sleep(1)
+        """获取m3u8文件内容，按 self.retry_policy 退避重试"""
+        try:
+            response = self.retry_policy.call(self.session.get, url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.text
+        except (requests.RequestException, RetryError) as e:
+            print(f"获取m3u8内容失败: {e}")
         return None
     
-    def _parse_m3u8(self, base_url, content):
-        """解析m3u8文件，提取ts片段URL"""
-        ts_urls = []
-        lines = content.strip().split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # 处理相对URL
-                if not line.startswith('http'):
-                    line = urljoin(base_url, line)
-                ts_urls.append(line)
-                
-        return ts_urls
+    def _prepare_keys(self, playlist):
+        """
+        记录每个加密片段的密钥URI与IV
+
+        密钥在工作线程第一次需要时下载，之后由 KeyCache 在本次任务内复用。
+        Returns:
+            bool: 播放列表未加密或可以解密时为True
+        """
+        self._segment_keys = {}
+        self._key_cache = None
+        if not playlist.encrypted:
+            return True
+        methods = {segment.key.method for segment in playlist.segments if segment.key}
+        if methods != {'AES-128'}:
+            print(f"不支持的加密方式: {', '.join(sorted(methods - {'AES-128'}))}")
+            return False
+        if not crypto_available():
+            print("播放列表已加密 (AES-128)，解密需要安装 cryptography (pip install cryptography)")
+            return False
+        for index, segment in enumerate(playlist.segments):
+            if segment.key:
+                self._segment_keys[index] = (segment.key.uri, segment.iv)
+        self._key_cache = KeyCache(self._fetch_key)
+        print(f"播放列表已加密 (AES-128)，{len(self._segment_keys)} 个片段需要解密")
+        return True
+
+    def _fetch_key(self, uri):
+        response = self.retry_policy.call(self.session.get, uri, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def _decryptor(self, index):
+        """第index个片段的解密器，未加密时返回None"""
+        entry = self._segment_keys.get(index)
+        if entry is None:
+            return None
+        uri, iv = entry
+        return SegmentDecryptor(self._key_cache.get(uri), iv)
     
     def _generate_filename(self, url):
         """根据URL生成文件名"""
@@ -115,71 +505,511 @@ class M3U8Downloader:
             filename = f"video_{int(time.time())}"
         return filename
     
-    def _download_ts_segments(self, ts_urls, output_dir):
-        """并发下载ts片段"""
-        ts_files = []
-        total = len(ts_urls)
-        
-        print(f"开始下载 {total} 个ts片段...")
+    def _download_ts_segments(self, ts_urls, output_dir, journal):
+        """并发下载ts片段，跳过下载日志中已完成且校验通过的片段"""
+        pending = []
+        for i in range(len(ts_urls)):
+            ts_path = os.path.join(output_dir, f"segment_{i:06d}.ts")
+            if not self._segment_file_valid(journal.entries.get(i), ts_path):
+                journal.forget(i)
+                pending.append(i)
+        restored = len(ts_urls) - len(pending)
+        if restored:
+            print(f"从下载日志恢复 {restored} 个ts片段")
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有下载任务
-            future_to_url = {
-                executor.submit(self._download_single_ts, url, output_dir, i): url 
-                for i, url in enumerate(ts_urls)
-            }
-            
-            # 处理完成的任务
-            completed = 0
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    ts_file = future.result()
-                    if ts_file:
-                        ts_files.append(ts_file)
-                    completed += 1
-                    print(f"进度: {completed}/{total} ({completed/total*100:.1f}%)")
-                except Exception as e:
-                    print(f"下载失败 {url}: {e}")
-                    completed += 1
-                    
-        return sorted(ts_files, key=lambda x: int(x.split('_')[-1].split('.')[0]))
+        print(f"开始下载 {len(pending)} 个ts片段...")
+        self._run_segment_jobs([(i, ts_urls[i]) for i in pending], _FileTarget(output_dir, journal))
+
+        return [os.path.join(output_dir, f"segment_{i:06d}.ts") for i in sorted(journal.entries)]
+
+    def _segment_file_valid(self, entry, ts_path):
+        """检查下载日志中记录的片段文件是否完整"""
+        if not entry or entry.get('location') != 'file' or not os.path.exists(ts_path):
+            return False
+        if os.path.getsize(ts_path) != entry['size']:
+            return False
+        return file_sha256(ts_path) == entry['sha256']
+
+    def _verify_output_prefix(self, journal, output_path):
+        """
+        校验流式输出文件中已按顺序写入的片段前缀
+
+        Returns:
+            (start, offset): 第一个需要下载的片段序号，以及输出文件的有效长度
+        """
+        start, offset = 0, 0
+        if os.path.exists(output_path):
+            file_size = os.path.getsize(output_path)
+            while True:
+                entry = journal.entries.get(start)
+                if (not entry or entry.get('location') != 'output' or entry.get('offset') != offset
+                        or offset + entry['size'] > file_size
+                        or file_sha256(output_path, offset, entry['size']) != entry['sha256']):
+                    break
+                offset += entry['size']
+                start += 1
+        for index in list(journal.entries):
+            if index >= start:
+                journal.forget(index)
+        return start, offset
     
-    def _download_single_ts(self, url, output_dir, index):
-        """下载单个ts片段"""
+    def _download_ts_stream(self, ts_urls, output_dir, output_path, journal, remux=None):
+        """
+        并发下载ts片段，按顺序流式写入output_path
+
+        Args:
+            remux: RemuxPipe，同时接收写入的有序字节；续传时先补送已写入的前缀
+        """
+        start, offset = self._verify_output_prefix(journal, output_path)
+        if start:
+            print(f"从下载日志恢复 {start} 个已写入的ts片段 ({offset / 1024 / 1024:.1f} MB)")
+        print(f"开始流式下载 {len(ts_urls) - start} 个ts片段 (缓冲上限 {self.buffer_bytes / 1024 / 1024:.0f} MB)...")
+
+        def on_written(buffer, written_offset):
+            journal.record(buffer.index, buffer.size, buffer.sha256, 'output', written_offset)
+
+        with open(output_path, 'r+b' if start else 'wb') as outfile:
+            outfile.truncate(offset)
+            writer = outfile
+            sinks = [sink for sink in (remux, self.segment_sink) if sink is not None]
+            if sinks:
+                if offset:
+                    # 续传时先把已写入的前缀补发给下游
+                    outfile.seek(0)
+                    for chunk in iter(lambda: outfile.read(CHUNK_SIZE), b''):
+                        for sink in sinks:
+                            sink.write(chunk)
+                writer = _TeeWriter(outfile, *sinks)
+            outfile.seek(offset)
+            assembler = SegmentAssembler(writer, len(ts_urls), self.buffer_bytes, output_dir,
+                                         start=start, offset=offset, on_written=on_written)
+            assembler.start()
+            self._run_segment_jobs([(i, ts_urls[i]) for i in range(start, len(ts_urls))], _StreamTarget(assembler))
+            success = assembler.finish()
+
+        if not success:
+            print(f"片段 {assembler.written} 下载失败，已写入 {assembler.written} 个片段")
+        return success
+
+    def _run_segment_jobs(self, jobs, target):
+        """按所选引擎并发执行片段下载任务"""
+        self._limiter = AdaptiveLimiter(initial=min(4, self.max_workers), max_limit=self.max_workers) \
+            if self.adaptive else None
+        self._bucket = TokenBucket(self.max_bytes_per_sec) if self.max_bytes_per_sec else None
+        if self.host_selector and self.engine == 'thread':
+            # 主请求与对冲请求在单独的线程池中进行，工作线程只等待先完成的那个
+            self._hedge_pool = ThreadPoolExecutor(max_workers=self.max_workers * 2)
+        try:
+            self._run_segment_jobs_with_engine(jobs, target)
+        finally:
+            if self._hedge_pool:
+                # 落败的请求在下一个数据块时自行停止并清理，不必等待
+                self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+                self._hedge_pool = None
+            if self.host_selector:
+                self.host_report = self.host_selector.summary()
+                print(f"镜像主机: 对冲 {self.host_report['hedged']} 次 (胜出 {self.host_report['hedge_wins']}), "
+                      f"换主机重试 {self.host_report['failovers']} 次")
+            if self._limiter:
+                self.concurrency_report = self._limiter.summary()
+                print(f"自适应并发稳定在 {self.concurrency_report['concurrency']} "
+                      f"(峰值吞吐 {self.concurrency_report['peak_throughput_bps'] / 1024 / 1024:.2f} MB/s, "
+                      f"限流/错误 {self.concurrency_report['throttled']}/{self.concurrency_report['errors']})")
+
+    def _run_segment_jobs_with_engine(self, jobs, target):
+        if self.engine == 'async':
+            try:
+                import aiohttp  # noqa: F401
+            except ImportError:
+                print("警告: 未安装 aiohttp，改用线程引擎 (pip install aiohttp)")
+            else:
+                asyncio.run(self._run_segment_jobs_async(jobs, target))
+                return
+
+        progress = self.metrics.progress("进度", len(jobs))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download_segment, url, index, target) for index, url in jobs]
+            for future in as_completed(futures):
+                progress.update(size=future.result() or 0)
+
+    def _download_segment(self, url, index, target):
+        """
+        下载单个ts片段（线程引擎）
+
+        Returns:
+            int: 成功时为片段字节数，失败为0
+        """
         for i in range(self.retry_times):
+            if target.cancelled:
+                return 0
+            if self._limiter:
+                self._limiter.acquire()
+            started = time.monotonic()
+            sink = None
             try:
-                response = self.session.get(url, timeout=self.timeout)
-                response.raise_for_status()
-                
-                # 保存ts文件
-                ts_filename = f"segment_{index:06d}.ts"
-                ts_path = os.path.join(output_dir, ts_filename)
-                
-                with open(ts_path, 'wb') as f:
-                    f.write(response.content)
-                    
-                return ts_path
-                
+                if self.host_selector:
+                    size, sha256, sink = self._fetch_routed(url, index, target, i, strict=i < self.retry_times - 1)
+                else:
+                    sink = target.open(index)
+                    size, sha256 = self._fetch_to(url, sink, strict=i < self.retry_times - 1,
+                                                  decryptor=self._decryptor(index))
             except Exception as e:
+                self._release_slot(started, 0, e)
+                if sink is not None:
+                    target.discard(sink)
                 if i < self.retry_times - 1:
-                    time.sleep(1)
+                    self.metrics.incr('segment_retries')
+                    # 内容校验失败说明连接正常，立即重新下载；下一次能换到健康的镜像主机时立即重试
+                    if not isinstance(e, InvalidSegmentError) and not self._can_failover(i):
+                        time.sleep(1)
                     continue
-                else:
-                    print(f"下载失败 {url}: {e}")
-                    return None
+                print(f"下载失败 {url}: {e}")
+            else:
+                self._release_slot(started, size)
+                self._record_segment(started, size)
+                target.complete(index, sink, size, sha256)
+                return size
+        self.metrics.incr('segment_failures')
+        target.fail(index)
+        return 0
+
+    def _record_segment(self, started, size):
+        self.metrics.observe('segment_latency_seconds', time.monotonic() - started)
+        self.metrics.add_bytes('download', size)
+
+    def _release_slot(self, started, size, error=None):
+        """向自适应并发控制器报告本次请求结果并释放名额"""
+        if not self._limiter:
+            return
+        status = None
+        if error is not None:
+            response = getattr(error, 'response', None)
+            status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+        self._limiter.record(time.monotonic() - started, size, status=status,
+                             error=error is not None and status is None)
+        self._limiter.release()
+
+    def _can_failover(self, attempt):
+        return self.host_selector is not None and self.host_selector.can_failover(attempt)
+
+    def _fetch_routed(self, url, index, target, attempt, strict):
+        """
+        经主机选择下载一个片段：第attempt次尝试使用排名第attempt的主机，
+        耗时超过对冲阈值时向另一个主机发对冲请求，先完成者获胜
+
+        Returns:
+            (size, sha256, sink): 获胜请求的结果与其sink；失败时各请求已自行清理sink
+        """
+        selector = self.host_selector
+        host = selector.pick(attempt)
+        race = HedgeRace()
+        delay = selector.hedge_delay()
+        if delay is None:
+            return self._fetch_attempt(url, index, target, host, strict, race)
+        primary = self._hedge_pool.submit(self._fetch_attempt, url, index, target, host, strict, race)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+        hedge_host = selector.hedge_host(host)
+        if hedge_host is None or not selector.try_hedge():
+            return primary.result()
+
+        self.metrics.incr('segment_hedged')
+        hedge = self._hedge_pool.submit(self._fetch_attempt, url, index, target, hedge_host, strict, race, True)
+        error = None
+        for future in as_completed((primary, hedge)):
+            try:
+                result = future.result()
+            except HedgeCancelled:
+                continue
+            except Exception as e:
+                error = error or e
+                continue
+            if future is hedge:
+                selector.record_hedge_win()
+                self.metrics.incr('segment_hedge_wins')
+            return result
+        raise error
+
+    def _fetch_attempt(self, url, index, target, host, strict, race, hedge=False):
+        """在指定主机上下载一次片段；失败或落败时清理自己的sink"""
+        sink = target.open(index, hedge)
+        started = time.monotonic()
+        try:
+            size, sha256 = self._fetch_to(self.host_selector.route(url, host), sink, strict,
+                                          decryptor=self._decryptor(index), cancel=race.cancel)
+        except Exception as e:
+            target.discard(sink)
+            if not isinstance(e, HedgeCancelled):
+                self.host_selector.record(host, time.monotonic() - started, 0, error=True)
+            raise
+        self.host_selector.record(host, time.monotonic() - started, size)
+        if not race.claim():
+            target.discard(sink)
+            raise HedgeCancelled()
+        return size, sha256, sink
+
+    def _fetch_to(self, url, sink, strict=True, decryptor=None, cancel=None):
+        """
+        以分块方式下载url，写入sink
+
+        Args:
+            strict: 连续计数器不连续也视为无效；最后一次尝试时为False，只警告
+            decryptor: 加密片段的 SegmentDecryptor，收到的每个块先解密再写入；按64KB网络块解密，
+                更大的块超出malloc的mmap阈值反而更慢（见 benchmarks/aes_overhead.py）
+            cancel: threading.Event，被设置时（对冲请求已先完成）停止下载
+        Returns:
+            (size, sha256): 写入的（明文）字节数与校验和
+        Raises:
+            InvalidSegmentError: 片段解密或校验失败
+        """
+        digest = hashlib.sha256()
+        size = 0
+        validator = self._validator(url)
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if cancel is not None and cancel.is_set():
+                    raise HedgeCancelled()
+                if self._bucket:
+                    delay = self._bucket.reserve(len(chunk))
+                    if delay:
+                        time.sleep(delay)
+                if decryptor:
+                    chunk = decryptor.update(chunk)
+                size += self._write_chunk(chunk, sink, digest, validator)
+        if decryptor:
+            size += self._write_chunk(self._finalize_decryptor(url, decryptor), sink, digest, validator)
+        self._check_segment(url, validator, strict)
+        return size, digest.hexdigest()
+
+    def _write_chunk(self, chunk, sink, digest, validator):
+        if chunk:
+            sink.write(chunk)
+            digest.update(chunk)
+            if validator:
+                validator.feed(chunk)
+        return len(chunk)
+
+    def _finalize_decryptor(self, url, decryptor):
+        try:
+            return decryptor.finalize()
+        except ValueError:
+            self.metrics.incr('segment_invalid')
+            print(f"片段解密失败，重新下载 {url}")
+            raise InvalidSegmentError("解密失败（填充错误，密钥/IV不匹配或数据被截断）")
+
+    def _validator(self, url):
+        if self.validate and urlparse(url).path.lower().endswith('.ts'):
+            return TSValidator()
         return None
-    
+
+    def _check_segment(self, url, validator, strict):
+        if validator is None:
+            return
+        error = validator.finish()
+        if error is None:
+            return
+        self.metrics.incr('segment_invalid')
+        if error.fatal or strict:
+            print(f"片段校验失败，重新下载 {url}: {error}")
+            raise error
+        print(f"警告: 片段 {url} {error}，保留源站数据")
+
+    async def _run_segment_jobs_async(self, jobs, target):
+        """在asyncio事件循环上并发下载，按主机复用keep-alive连接池"""
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_workers,
+            limit_per_host=self.max_workers,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+        # 与requests的timeout语义一致：连接超时与读超时分别为self.timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        progress = self.metrics.progress("进度", len(jobs))
+
+        async def run(index, url):
+            async with semaphore:
+                size = await self._download_segment_async(client, url, index, target)
+            progress.update(size=size)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=dict(self.session.headers)) as client:
+            await asyncio.gather(*(run(index, url) for index, url in jobs))
+
+    async def _download_segment_async(self, client, url, index, target):
+        """下载单个ts片段（异步引擎），重试语义与返回值与线程引擎相同"""
+        for i in range(self.retry_times):
+            if target.cancelled:
+                return 0
+            if self._limiter:
+                await self._limiter.acquire_async()
+            started = time.monotonic()
+            sink = None
+            try:
+                if self.host_selector:
+                    size, sha256, sink = await self._fetch_routed_async(client, url, index, target, i,
+                                                                        strict=i < self.retry_times - 1)
+                else:
+                    sink = await asyncio.to_thread(target.open, index)
+                    size, sha256 = await self._fetch_to_async(client, url, sink, strict=i < self.retry_times - 1,
+                                                              decryptor=await self._decryptor_async(index))
+            except Exception as e:
+                self._release_slot(started, 0, e)
+                if sink is not None:
+                    await asyncio.to_thread(target.discard, sink)
+                if i < self.retry_times - 1:
+                    self.metrics.incr('segment_retries')
+                    if not isinstance(e, InvalidSegmentError) and not self._can_failover(i):
+                        await asyncio.sleep(1)
+                    continue
+                print(f"下载失败 {url}: {e}")
+            else:
+                self._release_slot(started, size)
+                self._record_segment(started, size)
+                await asyncio.to_thread(target.complete, index, sink, size, sha256)
+                return size
+        self.metrics.incr('segment_failures')
+        target.fail(index)
+        return 0
+
+    async def _decryptor_async(self, index):
+        # 密钥在任务内只下载一次，之后直接命中缓存
+        if index not in self._segment_keys:
+            return None
+        return await asyncio.to_thread(self._decryptor, index)
+
+    async def _fetch_routed_async(self, client, url, index, target, attempt, strict):
+        """_fetch_routed 的异步版本：落败的请求直接取消"""
+        selector = self.host_selector
+        host = selector.pick(attempt)
+        delay = selector.hedge_delay()
+        primary = asyncio.ensure_future(self._fetch_attempt_async(client, url, index, target, host, strict))
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return await primary
+        hedge_host = selector.hedge_host(host)
+        if hedge_host is None or not selector.try_hedge():
+            return await primary
+
+        self.metrics.incr('segment_hedged')
+        hedge = asyncio.ensure_future(self._fetch_attempt_async(client, url, index, target, hedge_host, strict, True))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                for loser in done - {task}:
+                    # 两个请求同时完成：丢弃另一个的数据
+                    if loser.exception() is None:
+                        await asyncio.to_thread(target.discard, loser.result()[2])
+                if task is hedge:
+                    selector.record_hedge_win()
+                    self.metrics.incr('segment_hedge_wins')
+                return task.result()
+        raise error
+
+    async def _fetch_attempt_async(self, client, url, index, target, host, strict, hedge=False):
+        sink = await asyncio.to_thread(target.open, index, hedge)
+        started = time.monotonic()
+        try:
+            size, sha256 = await self._fetch_to_async(client, self.host_selector.route(url, host), sink, strict,
+                                                      decryptor=await self._decryptor_async(index))
+        except asyncio.CancelledError:
+            await asyncio.to_thread(target.discard, sink)
+            raise
+        except Exception:
+            await asyncio.to_thread(target.discard, sink)
+            self.host_selector.record(host, time.monotonic() - started, 0, error=True)
+            raise
+        self.host_selector.record(host, time.monotonic() - started, size)
+        return size, sha256, sink
+
+    async def _fetch_to_async(self, client, url, sink, strict=True, decryptor=None):
+        """
+        _fetch_to 的异步版本
+
+        收到的块攒够 ASYNC_WRITE_BATCH 后整批交给线程解密、写入（文件或溢出文件）、校验与哈希，
+        事件循环只负责网络读取。
+        """
+        digest = hashlib.sha256()
+        size = 0
+        validator = self._validator(url)
+        batch = []
+        batch_bytes = 0
+        async with client.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                if self._bucket:
+                    delay = self._bucket.reserve(len(chunk))
+                    if delay:
+                        await asyncio.sleep(delay)
+                batch.append(chunk)
+                batch_bytes += len(chunk)
+                if batch_bytes >= ASYNC_WRITE_BATCH:
+                    size += await self._write_batch_async(url, batch, sink, digest, validator, decryptor)
+                    batch = []
+                    batch_bytes = 0
+        size += await self._write_batch_async(url, batch, sink, digest, validator, decryptor, final=True)
+        self._check_segment(url, validator, strict)
+        return size, digest.hexdigest()
+
+    async def _write_batch_async(self, url, batch, sink, digest, validator, decryptor, final=False):
+        """
+        在线程中处理一批数据块，返回写入的（明文）字节数
+
+        任务被取消（对冲落败）时等这一批处理完再退出，避免与随后丢弃sink并发
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(
+            self._write_batch, url, batch, sink, digest, validator, decryptor, final))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await future
+            raise
+
+    def _write_batch(self, url, batch, sink, digest, validator, decryptor, final):
+        size = 0
+        for chunk in batch:
+            if decryptor:
+                chunk = decryptor.update(chunk)
+            size += self._write_chunk(chunk, sink, digest, validator)
+        if final and decryptor:
+            size += self._write_chunk(self._finalize_decryptor(url, decryptor), sink, digest, validator)
+        return size
+
+    def _remux(self, ts_files, output_path):
+        """将按顺序排列的ts文件无损封装为MP4；没有ffmpeg时退回直接拼接"""
+        ffmpeg = find_ffmpeg()
+        if not ffmpeg:
+            print("警告: 未找到ffmpeg，直接拼接ts数据（输出并非真正的MP4）")
+            if len(ts_files) == 1:
+                os.replace(ts_files[0], output_path)
+                return True
+            return self._merge_ts_files(ts_files, output_path)
+        print("正在封装MP4...")
+        with self.metrics.stage('remux'):
+            return remux_to_mp4(ts_files, output_path, fragmented=self.container == 'fmp4', ffmpeg=ffmpeg)
+
     def _merge_ts_files(self, ts_files, output_path):
-        """合并ts文件为mp4"""
+        """直接拼接ts文件"""
         try:
             print("正在合并ts文件...")
             
-            with open(output_path, 'wb') as outfile:
+            with self.metrics.stage('merge'), open(output_path, 'wb') as outfile:
                 for ts_file in ts_files:
                     if os.path.exists(ts_file):
                         with open(ts_file, 'rb') as infile:
-                            outfile.write(infile.read())
+                            shutil.copyfileobj(infile, outfile, CHUNK_SIZE)
                             
             return True
         except Exception as e:
@@ -205,6 +1035,16 @@ def main():
     parser.add_argument('-w', '--workers', type=int, default=10, help='并发下载线程数 (默认: 10)')
     parser.add_argument('-t', '--timeout', type=int, default=30, help='请求超时时间 (默认: 30秒)')
     parser.add_argument('-r', '--retry', type=int, default=3, help='重试次数 (默认: 3)')
+    parser.add_argument('--stream', action='store_true', help='流式组装，不生成临时ts文件')
+    parser.add_argument('--buffer-mb', type=float, default=64, help='流式组装的内存缓冲上限 (默认: 64MB)')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread', help='下载引擎 (默认: thread；async 需要另行安装 aiohttp)')
+    parser.add_argument('--adaptive', action='store_true', help='自适应并发 (-w 作为并发上限)')
+    parser.add_argument('--max-rate', type=float, help='带宽上限 (MB/s)')
+    parser.add_argument('--variant', default='lowest', help='主播放列表档位: lowest/highest/audio/720 (默认: lowest)')
+    parser.add_argument('--container', choices=['mp4', 'fmp4', 'ts'], default='mp4', help='输出封装 (默认: mp4)')
+    parser.add_argument('--no-validate', action='store_true', help='不校验ts片段的包结构')
+    parser.add_argument('--hosts', help='备选CDN镜像主机，逗号分隔；启用探测排序、故障切换与对冲请求')
+    parser.add_argument('--no-hedge', action='store_true', help='启用镜像主机时不发对冲请求')
     
     args = parser.parse_args()
     
@@ -212,7 +1052,17 @@ def main():
     downloader = M3U8Downloader(
         max_workers=args.workers,
         timeout=args.timeout,
-        retry_times=args.retry
+        retry_times=args.retry,
+        stream=args.stream,
+        buffer_mb=args.buffer_mb,
+        engine=args.engine,
+        adaptive=args.adaptive,
+        max_bytes_per_sec=args.max_rate * 1024 * 1024 if args.max_rate else None,
+        variant_policy=args.variant,
+        container=args.container,
+        validate=not args.no_validate,
+        hosts=args.hosts.split(',') if args.hosts is not None else None,
+        hedge=not args.no_hedge
     )
     
     # 开始下载
@@ -1,219 +1,582 @@
-import requests
 import json
-import re
 from datetime import datetime, timezone, timedelta
 import time
-import hashlib
-from m3u8_downloader import M3U8Downloader
 import os
-from audio_extractor import extract_audio_from_video
-import base64
-from moviepy.config import change_settings
 import os.path as path
-change_settings({"FFMPEG_BINARY": "/usr/bin/ffmpeg"}) 
+from cntv_client import CntvClient
+# 下载、解析、音频处理等模块只在对应阶段按需导入，
+# 保证"已获取过，跳过"的空跑路径不加载任何重量级依赖（见 benchmarks/startup.py）
 
-def get_cctv_news_weekly():
+# 栏目列表与视频信息共用一个客户端：keep-alive会话、条件请求缓存、按GUID记忆
+cntv = CntvClient()
+
+# 字幕全文索引，查询: python subtitle_index.py search 关键词
+SUBTITLE_INDEX = path.join(path.dirname(__file__), 'subtitle_index.db')
+
+# 额外的CDN镜像主机（逗号分隔），与视频信息中的清单主机一起参与探测排序
+MIRROR_HOSTS = [host for host in (os.getenv("HLS_MIRROR_HOSTS") or "").split(",") if host.strip()]
+
+# 上传转写前的音频编码：opus / flac（16kHz单声道、切除静音）；off 为上传原音频
+ASR_AUDIO_CODEC = os.getenv("ASR_AUDIO_CODEC") or "opus"
+
+def get_cctv_news_weekly(page=1, page_size=20):
     """
     请求CCTV新闻周刊API并解析响应
+
+    Args:
+        page: 页码，从1开始
+        page_size: 每页条数
     """
-    url = "https://api.cntv.cn/NewVideo/getVideoListByColumn"
-    params = {
-        'id': 'TOPC1451559180488841',
-        'n': '20',
-        'sort': 'desc',
-        'p': '1',
-        'd': '',
-        'mode': '0',
-        'serviceId': 'tvcctv',
-        'callback': 'lanmu_0'
-    }
-    
-    try:
-        # 发送请求
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        # 获取响应文本
-        response_text = response.text
-        
-        # 解析JSONP响应 - 提取JSON部分
-        # 响应格式: lanmu_0({...})
-        json_match = re.search(r'lanmu_0\((.*)\)', response_text)
-        if not json_match:
-            raise ValueError("无法解析JSONP响应")
-        
-        json_str = json_match.group(1)
-        data = json.loads(json_str)
-        
-        return data
-        
-    except requests.RequestException as e:
-        print(f"请求错误: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-        return None
-    except Exception as e:
-        print(f"其他错误: {e}")
-        return None
-def generate_vtoken(fingerprint: str) -> dict:
+    return cntv.column_page(page, page_size)
+
+def list_column_episodes(max_pages, page_size=20):
     """
-    根据JavaScript代码逻辑生成vtoken。
+    逐页抓取栏目列表（p=1..max_pages），遇到空页或已取完全部条目时停止
+
+    Returns:
+        list: 按发布时间倒序的视频条目
+    """
+    episodes = []
+    seen = set()
+    for page in range(1, max_pages + 1):
+        data = get_cctv_news_weekly(page, page_size)
+        if not data or 'data' not in data:
+            print(f"第 {page} 页获取失败，停止翻页")
+            break
+        video_list = data['data'].get('list', [])
+        for video in video_list:
+            if video['guid'] not in seen:
+                seen.add(video['guid'])
+                episodes.append(video)
+        total = int(data['data'].get('total', 0) or 0)
+        print(f"第 {page} 页: {len(video_list)} 条，累计 {len(episodes)}/{total}")
+        if not video_list or len(episodes) >= total:
+            break
+    return episodes
+
+def get_video_info(video_guid, variant_policy="lowest"):
+    """
+    获取视频信息
 
     Args:
-        fingerprint (str): 从浏览器cookie中获取的设备指纹 (Fingerprint)。
-                           通常是一个32位的十六进制字符串。
+        video_guid: 视频GUID
+        variant_policy: 码率档位选择策略，见 hls_parser.select_variant
+    """
+    return cntv.resolve(video_guid, variant_policy)
+
+def read_passed_file():
+    with open(passed_file, 'r', encoding='utf-8') as fp:
+        return json.load(fp)
+
+def write_status(status):
+    with open("status.txt", "w", encoding="utf-8") as f:
+        f.write("true" if status else "false")
+
+def process_episode(video_guid, output_dir="downloads", variant_policy="lowest", write_release_info=True,
+                    pipelined=False, ledger=None):
+    """
+    处理一期节目：下载 → 分离音频 → 生成字幕
 
+    Args:
+        video_guid: 视频GUID
+        output_dir: 下载目录（并行处理多期时每期使用独立目录）
+        variant_policy: 码率档位选择策略
+        write_release_info: 是否写入 release_info.txt / time.txt（供workflow创建release）
+        pipelined: 流水线模式，下载的同时提取音频窗口并转写；
+                   不可用或失败时回退为顺序处理
+        ledger: StateLedger，记录各阶段结果，并跳过产物仍然有效的阶段
     Returns:
-        dict: 包含时间戳、源字符串和最终生成的vtoken的字典。
+        dict: guid、title、tag、segments、ok、failed_stage 以及各阶段耗时 timings
+    成功后字幕加入全文索引（见 index_subtitles）
     """
-    timestamp_str = str(int(time.time()))
+    result = _process_episode(video_guid, output_dir, variant_policy, write_release_info, pipelined, ledger)
+    if result['ok']:
+        started = time.monotonic()
+        index_subtitles(video_guid, result['title'])
+        result['timings']['index'] = time.monotonic() - started
+    return result
+
+def _process_episode(video_guid, output_dir, variant_policy, write_release_info, pipelined, ledger):
+    result = {'guid': video_guid, 'title': None, 'ok': False, 'failed_stage': None, 'timings': {}}
+    timings = result['timings']
+
+    started = time.monotonic()
+    video_url, title,segments, tag = get_video_info(video_guid, variant_policy)
+    timings['info'] = time.monotonic() - started
+    result.update(title=title, tag=tag, segments=[segment.get('title') for segment in segments])
+    print(f"视频URL: {video_url}")
+    print(f"视频标题: {title}")
 
-    salt = "2049"
-    static_key = "47899B86370B879139C08EA3B5E88267"
+    if write_release_info:
+        # 写入提交信息
+        with open("release_info.txt", "w", encoding="utf-8") as f:
+            f.write(f"---\n\n")
+            f.write(f"视频标题: {title}\n\n")
+            f.write(f"视频标签: {tag}\n\n")
+            f.write(f"---\n\n")
+            f.write(f"视频内容如下：\n\n")
+            for segment in segments:
+                f.write(f"- {segment["title"]}\n\n")
+            f.write(f"---\n\n")
 
-    source_string = timestamp_str + salt + static_key + fingerprint
-    md5_hash = hashlib.md5(source_string.encode('utf-8')).hexdigest()
+        time_tag = title.split(' ')[1]
+        with open("time.txt", "w", encoding="utf-8") as f:
+            f.write(time_tag)
 
-    vtoken = md5_hash.upper()
+        # 发布后由workflow追加到静态发布目录: python release_catalog.py add release_info.json sub_output
+        with open("release_info.json", "w", encoding="utf-8") as f:
+            json.dump({'release': time_tag, 'guid': video_guid, 'title': title, 'tag': tag,
+                       'segments': [segment.get('title') for segment in segments]}, f, ensure_ascii=False)
 
-    return {
-        "timestamp": timestamp_str,
-        "source_string_for_md5": source_string,
-        "vtoken": vtoken
-    }
+    if ledger is not None:
+        ledger.record(video_guid, 'listed', title=title)
+    srt_path = os.path.join("sub_output", title.split('.')[0] + ".srt")
+    if ledger is not None and ledger.stage_valid(video_guid, 'transcribed') is not None and os.path.exists(srt_path):
+        print("字幕已生成过，跳过")
+        result['ok'] = True
+        return result
+
+    # 已下载/已分离音频且产物仍然有效时跳过对应阶段
+    video_path = ledger.stage_valid(video_guid, 'downloaded') if ledger is not None else None
+    audio_path = ledger.stage_valid(video_guid, 'extracted') if ledger is not None else None
+    if audio_path:
+        print(f"音频已分离过，跳过下载与分离: {audio_path}")
+    elif video_path:
+        print(f"视频已下载过，跳过下载: {video_path}")
+    else:
+        # 创建下载器实例
+        from m3u8_downloader import M3U8Downloader
+        downloader = M3U8Downloader(
+            max_workers = 48,      # 并发上限
+            timeout = 30,         # 30秒超时
+            retry_times = 3,      # 重试3次
+            stream = True,        # 流式组装，不落地临时ts文件
+            buffer_mb = 64,       # 重排缓冲区内存上限
+            adaptive = True,      # 按CDN实际表现自适应调整并发
+            container = "mp4",    # ffmpeg无损封装为真正的MP4
+            hosts = cntv.mirror_hosts(video_guid, MIRROR_HOSTS)  # 镜像主机排序、故障切换与对冲请求
+        )
+
+        print("=" * 50)
 
-def get_video_info(video_guid):
+        pipeline = _start_pipeline(downloader, output_dir, title) if pipelined else None
+
+        started = time.monotonic()
+        success = downloader.download_m3u8(
+            m3u8_url=video_url,
+            output_dir=output_dir,
+            filename=title
+        )
+        timings['download'] = time.monotonic() - started
+        if ledger is not None:
+            ledger.record(video_guid, 'downloaded', 'done' if success else 'failed',
+                          artifact=downloader.output_path if success else None, duration=timings['download'])
+
+        if pipeline is not None:
+            if success and _finish_pipeline(pipeline, title):
+                timings['pipeline_tail'] = time.monotonic() - started - timings['download']
+                print("字幕生成完成！")
+                if ledger is not None:
+                    ledger.record(video_guid, 'transcribed', artifact=srt_path,
+                                  duration=timings['download'] + timings['pipeline_tail'])
+                result['ok'] = True
+                return result
+            pipeline[0].abort()
+            pipeline[1].abort()
+            import shutil
+            shutil.rmtree(pipeline[0].output_dir, ignore_errors=True)
+            if success:
+                print("流水线处理失败，改为顺序分离音频并生成字幕")
+        if not success:
+            result['failed_stage'] = 'download'
+            return result
+        print("下载成功！")
+        video_path = downloader.output_path
+
+    if not audio_path:
+        # 分离音频
+        print("=" * 50)
+        print("开始分离音频...")
+
+        started = time.monotonic()
+        try:
+            from audio_extractor import extract_audio_from_video
+
+            if os.path.exists(video_path):
+                # AAC音轨直接复制为m4a，语音识别预处理时只做一次有损编码
+                audio_success = extract_audio_from_video(video_path, f"{output_dir}/{title}.m4a", 'm4a')
+                if audio_success:
+                    audio_path = f"{output_dir}/{title}.m4a"
+                    print("🎉 音频分离完成！")
+                else:
+                    print("💥 音频分离失败！")
+            else:
+                print(f"错误: 视频文件 '{video_path}' 不存在")
+
+        except ImportError:
+            print("警告: 无法导入 audio_extractor 模块")
+            print("请确保已安装ffmpeg，或安装 moviepy: pip install moviepy")
+        except Exception as e:
+            print(f"音频分离过程中出现错误: {e}")
+        timings['extract'] = time.monotonic() - started
+        if ledger is not None:
+            ledger.record(video_guid, 'extracted', 'done' if audio_path else 'failed',
+                          artifact=audio_path, duration=timings['extract'])
+
+    if not audio_path:
+        print("没有可用的音频，跳过字幕生成")
+        result['failed_stage'] = 'extract'
+        return result
+
+    # 生成字幕
+    # audio_path = "downloads/《新闻周刊》 20250802.m4a"
+    print("=" * 50)
+    print("开始生成字幕...")
+    from transcriber import get_sub_from_ai
+    from transcription_cache import TranscriptionCache
+    from audio_prep import prepare_for_asr
+
+    # 16kHz单声道语音编码并切除静音，字幕时间戳按对应表换算回节目时间
+    started = time.monotonic()
+    asr_path = prepare_for_asr(audio_path, ASR_AUDIO_CODEC)
+    timings['prepare'] = time.monotonic() - started
+    # 在静音处切成约3分钟的分段并发转写，失败时只重试失败的分段；
+    # 重试次数、总时长与熔断由 WhisperClient 的 RetryPolicy 控制；
+    # 相同音频命中 asr_cache/ 时不再上传
+    started = time.monotonic()
+    status = get_sub_from_ai(asr_path, chunk_seconds=180, max_workers=4,
+                             cache=TranscriptionCache("asr_cache"))
+    timings['transcribe'] = time.monotonic() - started
+    if ledger is not None:
+        ledger.record(video_guid, 'transcribed', 'done' if status else 'failed',
+                      artifact=srt_path if status else None, duration=timings['transcribe'])
+    if status:
+        print("字幕生成完成！")
+    else:
+        print("字幕生成失败！")
+        result['failed_stage'] = 'transcribe'
+        return result
+
+    result['ok'] = True
+    return result
+
+def index_subtitles(video_guid, title):
     """
-    获取视频信息
+    把一期节目的字幕加入全文索引 subtitle_index.db（已索引过的跳过）
+
+    索引失败只打印警告，不影响本期的处理结果
     """
-    fingerprint = os.getenv("FINGERPRINT")
-    if not fingerprint:
-        fingerprint = "ABCD"
-    vtoken = generate_vtoken(fingerprint)
-    # https://vdn.apps.cntv.cn/api/getHttpVideoInfo.do?pid=98818820526f4fad8eb896022ad4b6b7&client=flash&im=0&tsp=1754358909&vn=2049&vc=7BA8ACCDA118481B230086E6730A49A6&uid=AB2BCC96F1DA979C99C5C4212F93172C&wlan=
-    url = f"https://vdn.apps.cntv.cn/api/getHttpVideoInfo.do"
-    params = {
-        'pid': video_guid,
-        'client': 'flash',
-        'im': '0',
-        'tsp': vtoken['timestamp'],
-        'vn': '2049',
-        'vc': vtoken['vtoken'],
-        'uid': fingerprint,
-        'wlan': ''
-    }
-    response = requests.get(url, params=params)
-    with open("response.json", "w", encoding="utf-8") as f:
-        f.write(response.text)
-    title = response.json()['title']
-    segments = response.json().get('segments', [])
-    tag = response.json()['tag']
-    target_url = response.json()['manifest']['hls_enc_url']
-    target_url_response = requests.get(target_url)
-    # print(target_url_response.text)
+    srt_path = os.path.join("sub_output", title.split('.')[0] + ".srt")
+    if not os.path.exists(srt_path):
+        return False
+    from subtitle_index import SubtitleIndex
+
+    try:
+        index = SubtitleIndex(SUBTITLE_INDEX)
+        try:
+            if index.has_episode(video_guid):
+                return True
+            count = index.add_srt(srt_path, video_guid, title=title)
+        finally:
+            index.close()
+    except Exception as e:
+        print(f"警告: 字幕索引失败: {e}")
+        return False
+    print(f"字幕已加入全文索引: {count} 条")
+    return True
+
+def _start_pipeline(downloader, output_dir, title):
     """
-    #EXTM3U
-    #EXT-X-STREAM-INF:PROGRAM-ID=1, BANDWIDTH=460800, RESOLUTION=480x270
-    /asp/hlsaudio/hls/450/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/450.m3u8
-    #EXT-X-STREAM-INF:PROGRAM-ID=1, BANDWIDTH=870400, RESOLUTION=640x360
-    /asp/hlsaudio/hls/850/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/850.m3u8
-    #EXT-X-STREAM-INF:PROGRAM-ID=1, BANDWIDTH=1228800, RESOLUTION=1280x720
-    /asp/hlsaudio/hls/1200/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/1200.m3u8
-    #EXT-X-STREAM-INF:PROGRAM-ID=1, BANDWIDTH=2048000, RESOLUTION=1280x720
-    /asp/hlsaudio/hls/2000/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/2000.m3u8
-
-    """    
-    # target_host = target_url.split('/')[2]
-    target_host = "hls.cntv.lxdns.com"
-    # print(target_host)
-    # https://hls.cntv.lxdns.com/asp/hls/450/0303000a/3/default/32209ab71a794674ab965ae7b6ff1d7e/450.m3u8
-    url = "https://" + target_host + target_url_response.text.split('\n')[2].replace("/enc","")
-    return url, title, segments, tag
-
-def get_sub_from_ai(path: str) -> bool:
-    """从AI获取字幕
-    
-    Args:
-        path: 音频文件路径
+    为下载器接上增量音频提取与转写：按顺序到达的ts数据送入ffmpeg，
+    每完成一个约3分钟的音频窗口就立即提交转写
+
     Returns:
-        text: 文本
+        tuple: (extractor, transcriber)；没有ffmpeg时返回None
     """
-    os.makedirs("sub_output", exist_ok=True)
-    user_id = os.getenv("CLOUDFLARE_USER_ID")
-    api_key = os.getenv("CLOUDFLARE_API_KEY")
-    url = f'https://api.cloudflare.com/client/v4/accounts/{user_id}/ai/run/@cf/openai/whisper-large-v3-turbo'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
-        'Content-Type': 'application/octet-stream',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-        'Authorization': f'Bearer {api_key}'
-    }
-    audio_data = open(path, 'rb').read()
-    base64_audio_data = base64.b64encode(audio_data).decode('utf-8')
-    json_data = {
-        'audio': base64_audio_data
-    }
-    response = requests.post(url, headers=headers, json=json_data)
-    if response.status_code == 200:
-        # print(response.text)
-        segments = response.json()['result']['segments']
-        srt = convert_words_to_srt(segments)
-        with open(os.path.join("sub_output", path.split('/')[-1].split('.')[0] + ".srt"), 'w', encoding='utf-8') as f:
-            f.write(srt)
-        return True
-    else:
-        print(f'从AI获取字幕失败: {path}, 错误信息: {response.text}')
-        return False
+    from audio_extractor import IncrementalAudioExtractor
+    from transcriber import PipelinedTranscriber
+    from transcription_cache import TranscriptionCache
+    from audio_prep import prepare_for_asr, require_numpy
+
+    if ASR_AUDIO_CODEC != 'off':
+        # 窗口在线程中预处理，出错只会退回原音频；缺少依赖要在下载前就报错
+        require_numpy()
+    # 每个窗口转写前转为16kHz单声道语音编码并切除静音
+    transcriber = PipelinedTranscriber(max_workers=4, cache=TranscriptionCache("asr_cache"),
+                                       prepare=lambda path: prepare_for_asr(path, ASR_AUDIO_CODEC))
+    window_dir = os.path.join(output_dir, f"{title}.windows")
+    # 窗口要经过预处理时先存为无损的16kHz单声道flac，整个流程只有一次有损编码；不预处理时直接上传mp3窗口
+    extractor = IncrementalAudioExtractor(window_dir, window_seconds=180, on_window=transcriber.submit,
+                                          audio_format='flac' if ASR_AUDIO_CODEC != 'off' else 'mp3')
+    if not extractor.start():
+        print("未找到ffmpeg，流水线模式不可用，改为顺序处理")
+        transcriber.abort()
+        return None
+    downloader.segment_sink = extractor
+    print("流水线模式：边下载边提取音频并转写")
+    return extractor, transcriber
 
-def format_srt_time(seconds: float) -> str:
+def _finish_pipeline(pipeline, title):
+    """下载完成后收尾：等待最后的音频窗口与全部转写，写出字幕"""
+    import shutil
+    extractor, transcriber = pipeline
+    try:
+        if not extractor.finish():
+            return False
+        return transcriber.finish(title.split('.')[0])
+    finally:
+        shutil.rmtree(extractor.output_dir, ignore_errors=True)
+
+def run_backfill(ledger, max_pages, page_size, parallel, budget, variant_policy, pipelined=False):
     """
-    将秒数转换为 SRT 时间格式 (HH:MM:SS,mmm)
+    补全模式：翻页抓取栏目列表，找出尚未处理的所有期数并行处理
+
+    Args:
+        ledger: StateLedger，已生成字幕的期数不再处理
+        max_pages: 最多翻页数
+        page_size: 每页条数
+        parallel: 同时处理的期数
+        budget: 总时间预算（秒）；预计无法在预算内完成时不再开始新的一期
+        variant_policy: 码率档位选择策略
+        pipelined: 是否使用流水线模式
+    Returns:
+        list: 每期的处理结果
     """
-    ms = int((seconds % 1) * 1000)
-    total_seconds = int(seconds)
-    s = total_seconds % 60
-    m = (total_seconds // 60) % 60
-    h = total_seconds // 3600
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-    return f"{pad(h)}:{pad(m)}:{pad(s)},{pad(ms, 3)}"
+    done = ledger.guids('transcribed')
+    episodes = list_column_episodes(max_pages, page_size)
+    # 从最早的一期开始补
+    queue = [video for video in reversed(episodes) if video['guid'] not in done]
+    print(f"栏目共 {len(episodes)} 期，已处理 {len(episodes) - len(queue)} 期，待补全 {len(queue)} 期")
 
-def pad(num: int, size: int = 2) -> str:
+    started = time.monotonic()
+    results = []
+    durations = []
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        running = {}
+        while queue or running:
+            while queue and len(running) < parallel:
+                elapsed = time.monotonic() - started
+                expected = sum(durations) / len(durations) if durations else 0
+                if elapsed + expected > budget:
+                    print(f"时间预算不足（已用 {elapsed:.0f}s，每期约 {expected:.0f}s），剩余 {len(queue)} 期留待下次")
+                    queue = []
+                    break
+                video = queue.pop(0)
+                print(f"开始处理: {video.get('title')} ({video['guid']})")
+                future = executor.submit(process_episode, video['guid'], os.path.join("downloads", video['guid']),
+                                         variant_policy, False, pipelined, ledger)
+                running[future] = (video, time.monotonic())
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                video, episode_started = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"处理 {video['guid']} 出错: {e}")
+                    result = {'guid': video['guid'], 'title': video.get('title'), 'ok': False,
+                              'failed_stage': 'error', 'timings': {}}
+                result['timings']['total'] = time.monotonic() - episode_started
+                durations.append(result['timings']['total'])
+                results.append(result)
+
+    print("=" * 50)
+    print("补全结果:")
+    for result in results:
+        stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in result['timings'].items())
+        print(f"{'✅' if result['ok'] else '❌'} {result['title']}: {stages}"
+              + ("" if result['ok'] else f" (失败阶段: {result['failed_stage']})"))
+    print(f"总耗时: {time.monotonic() - started:.1f}s")
+    with open("backfill_report.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+class PollSchedule:
     """
-    数字补零，默认宽度为 2。如果需要毫秒则传入 size=3。
+    监听模式的轮询间隔
+
+    发布窗口内每 interval 秒查询一次，窗口外每 sparse_interval 秒查询一次（不会越过下一个窗口的开始时间）；
+    连续出错时按 2^n 退避，最长 max_backoff 秒。间隔带 ±10% 抖动。
     """
-    return str(num).zfill(size)
 
-def convert_words_to_srt(segments: list) -> str:
+    def __init__(self, window="16:00-21:00", interval=60, sparse_interval=900, max_backoff=1800):
+        """
+        Args:
+            window: 预计的发布窗口（UTC，"HH:MM-HH:MM"，可跨零点），默认与原cron的五个时间点一致
+            interval: 窗口内的轮询间隔（秒）
+            sparse_interval: 窗口外的轮询间隔（秒）
+            max_backoff: 出错退避的上限（秒）
+        """
+        start, end = window.split('-')
+        self.start = self._minutes(start)
+        self.end = self._minutes(end)
+        self.interval = interval
+        self.sparse_interval = sparse_interval
+        self.max_backoff = max_backoff
+
+    @staticmethod
+    def _minutes(text):
+        hours, minutes = text.strip().split(':')
+        return int(hours) * 60 + int(minutes)
+
+    def in_window(self, now):
+        minute = now.hour * 60 + now.minute
+        if self.start <= self.end:
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+    def until_window(self, now):
+        """距离下一个窗口开始的秒数"""
+        start = now.replace(hour=self.start // 60, minute=self.start % 60, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+        return (start - now).total_seconds()
+
+    def next_delay(self, failures=0, now=None):
+        import random
+
+        now = now or datetime.now(timezone.utc)
+        if self.in_window(now):
+            delay = self.interval
+        else:
+            delay = min(self.sparse_interval, max(self.until_window(now), self.interval))
+        if failures:
+            delay = min(self.max_backoff, max(delay, self.interval * 2 ** min(failures, 10)))
+        return delay * random.uniform(0.9, 1.1)
+
+def run_watch(ledger, variant_policy, pipelined, schedule, on_release=None, max_polls=0, process=None, stop=None):
     """
-    将包含 start/end/text 字段的 segments 列表转换为 SRT 格式字符串。
+    常驻监听：按 schedule 轮询栏目列表，出现未发布的新一期时在进程内立即处理
+
+    栏目列表每次都发条件请求（ETag/Last-Modified），没有更新时只有一个304；
+    API会话、账本与已导入的处理模块在各次轮询之间复用。
+
+    Args:
+        ledger: StateLedger
+        variant_policy: 码率档位选择策略
+        pipelined: 是否使用流水线模式
+        schedule: PollSchedule
+        on_release: 每期处理成功后执行的shell命令（如创建release），
+                    环境变量 RELEASE_GUID / RELEASE_TAG 为本期的GUID与tag；命令成功后才记录 released。
+                    不配置时只处理到 transcribed，由外部创建release后运行 main.py --mark-released
+        max_polls: 轮询次数上限，0为不限（用于测试）
+        process: 处理一期的函数，默认 process_episode
+        stop: threading.Event，置位后退出；默认在收到SIGINT/SIGTERM时退出
+    Returns:
+        int: 成功处理的期数
     """
-    if not segments:
-        return "No transcription data."
+    import signal
+    import threading
+    from metrics import METRICS
 
-    lines = []
-    for idx, segment in enumerate(segments, start=1):
-        start_ts = format_srt_time(segment["start"])
-        end_ts = format_srt_time(segment["end"])
-        text = segment["text"]
-        lines.append(f"{idx}")
-        lines.append(f"{start_ts} --> {end_ts}")
-        lines.append(text)
-        lines.append("")  # 空行分隔
+    process = process or process_episode
+    if stop is None:
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
 
-    return "\n".join(lines)
+    # 每次轮询都向接口确认，由条件请求保证开销
+    cntv.list_ttl = 0
+    if process is process_episode:
+        # 预先导入处理模块，新一期出现时不再付导入开销
+        import m3u8_downloader, audio_extractor, transcriber, audio_prep  # noqa: F401
 
+    print(f"监听模式：发布窗口 {schedule.start // 60:02d}:{schedule.start % 60:02d}-"
+          f"{schedule.end // 60:02d}:{schedule.end % 60:02d} UTC，"
+          f"窗口内每 {schedule.interval}s、窗口外每 {schedule.sparse_interval}s 查询一次")
+    polls = 0
+    failures = 0
+    released = 0
+    # 已处理完、等待外部创建release的期数，本进程内不再重复处理
+    handled = set()
+    while not stop.is_set():
+        polls += 1
+        METRICS.incr('watch_polls')
+        data = get_cctv_news_weekly()
+        video_list = (data or {}).get('data', {}).get('list') or []
+        if not video_list:
+            failures += 1
+            METRICS.incr('watch_errors')
+            print(f"栏目列表获取失败（连续 {failures} 次）")
+        else:
+            failures = 0
+            latest_video_guid = video_list[0]['guid']
+            if not ledger.is_done(latest_video_guid, 'released') and latest_video_guid not in handled:
+                print(f"发现新一期: {video_list[0].get('title')} ({latest_video_guid})")
+                started = time.monotonic()
+                result = process(latest_video_guid, "downloads", variant_policy, pipelined=pipelined, ledger=ledger)
+                METRICS.observe('watch_process_seconds', time.monotonic() - started)
+                if result['ok'] and not on_release:
+                    handled.add(latest_video_guid)
+                    print("已处理完成，等待创建release后运行 main.py --mark-released")
+                elif result['ok'] and _release(result, on_release):
+                    mark_released(ledger, latest_video_guid)
+                    released += 1
+                else:
+                    # 下次轮询按账本从失败的阶段继续
+                    failures += 1
+                    print(f"处理失败（连续 {failures} 次），稍后重试")
+        if max_polls and polls >= max_polls:
+            break
+        delay = schedule.next_delay(failures)
+        print(f"{delay:.0f}s 后再次查询")
+        stop.wait(delay)
+    print(f"监听结束：共查询 {polls} 次，处理 {released} 期")
+    return released
 
-def read_passed_file():
-    with open(passed_file, 'r', encoding='utf-8') as fp:
-        return json.load(fp)
+def mark_released(ledger, video_guid):
+    """release已创建并上传素材后记录 released，之后的运行不再处理这一期"""
+    ledger.record(video_guid, 'released', artifact="release_info.txt")
+    ledger.set_meta('latest_video_guid', video_guid)
 
-def write_passed_file(data):
-    with open(passed_file, 'w', encoding='utf-8') as fp:
-        json.dump(data, fp)
+def _release(result, on_release):
+    """执行发布命令，返回release是否已确认创建；没有配置发布命令时只写出 status.txt 并返回False"""
+    import subprocess
+
+    write_status(True)
+    if not on_release:
+        return False
+    env = dict(os.environ, RELEASE_GUID=result['guid'], RELEASE_TAG=result['title'].split(' ')[1])
+    completed = subprocess.run(on_release, shell=True, env=env)
+    if completed.returncode != 0:
+        print(f"发布命令失败，退出码 {completed.returncode}")
+        write_status(False)
+        return False
+    return True
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='新闻周刊字幕生成')
+    parser.add_argument('--backfill', action='store_true', help='补全模式：处理栏目中所有尚未处理的期数')
+    parser.add_argument('--pages', type=int, default=5, help='补全模式最多翻页数 (默认: 5)')
+    parser.add_argument('--page-size', type=int, default=20, help='每页条数 (默认: 20)')
+    parser.add_argument('--parallel', type=int, default=2, help='补全模式同时处理的期数 (默认: 2)')
+    parser.add_argument('--budget', type=float, default=5 * 3600, help='补全模式总时间预算，秒 (默认: 18000)')
+    parser.add_argument('--pipeline', action='store_true', help='流水线模式：边下载边提取音频并转写')
+    parser.add_argument('--metrics-dir', default='metrics', help='运行结束时写出 metrics.json / metrics.prom 的目录')
+    parser.add_argument('--watch', action='store_true', help='监听模式：常驻进程，轮询栏目列表，出现新一期立即处理')
+    parser.add_argument('--window', default='16:00-21:00', help='监听模式预计的发布窗口，UTC (默认: 16:00-21:00)')
+    parser.add_argument('--poll', type=float, default=60, help='监听模式发布窗口内的轮询间隔，秒 (默认: 60)')
+    parser.add_argument('--sparse-poll', type=float, default=900, help='监听模式发布窗口外的轮询间隔，秒 (默认: 900)')
+    parser.add_argument('--on-release', help='监听模式每期处理成功后执行的命令（环境变量 RELEASE_GUID / RELEASE_TAG）')
+    parser.add_argument('--max-polls', type=int, default=0, help='监听模式轮询次数上限，0为不限 (默认: 0)')
+    parser.add_argument('--mark-released', action='store_true',
+                        help='release创建成功后运行：把 release_info.json 中的一期记为已发布')
+    parser.add_argument('--list-url', help='栏目列表接口地址（可指向本地测试服务）')
+    parser.add_argument('--state-db', default=path.join(path.dirname(__file__), 'state.db'),
+                        help='状态账本路径 (默认: 脚本目录下的 state.db)')
+    args = parser.parse_args()
+    if args.list_url:
+        cntv.list_url = args.list_url
+
+    # 无论从哪个分支退出，都写出本次运行的指标报告
+    import atexit
+    from metrics import METRICS
+    atexit.register(METRICS.write_report, args.metrics_dir)
+
     if os.getenv("FORCE_RUN") == "true":
         force_run = True
     else:
@@ -221,105 +584,58 @@ if __name__ == "__main__":
     print("强制运行： ", force_run)
     # 判断是否已获取过
     
+    # 各期各阶段的处理状态记录在 state.db；旧的 passed.json 只在首次运行时导入
+    from state_ledger import StateLedger
+    ledger = StateLedger(args.state_db)
     passed_file = path.join(path.dirname(__file__), 'passed.json')
+    if path.exists(passed_file) and ledger.get_meta('latest_video_guid') is None:
+        print(f"从 passed.json 导入 {ledger.migrate_passed(read_passed_file())} 期处理记录")
 
-    passed = {'latest_video_guid': ''}
-    if not path.exists(passed_file):
-        write_passed_file(passed)
-    else:
-        passed = read_passed_file()
+    if args.mark_released:
+        with open("release_info.json", "r", encoding="utf-8") as f:
+            release_guid = json.load(f)['guid']
+        mark_released(ledger, release_guid)
+        print(f"已记录发布: {release_guid}")
+        ledger.close()
+        exit(0)
 
-    print('passed: ', passed)
+    print('最新已发布: ', ledger.get_meta('latest_video_guid'))
 
+    # 码率档位：lowest / highest / 720 / audio（仅需字幕时可用audio跳过视频数据）
+    variant_policy = os.getenv("HLS_VARIANT") or "lowest"
+
+    if args.backfill:
+        # 补全模式不创建单期release
+        write_status(False)
+        results = run_backfill(ledger, args.pages, args.page_size, args.parallel, args.budget, variant_policy,
+                               args.pipeline)
+        ledger.close()
+        exit(0 if all(result['ok'] for result in results) else 1)
+
+    if args.watch:
+        schedule = PollSchedule(args.window, args.poll, args.sparse_poll)
+        run_watch(ledger, variant_policy, args.pipeline, schedule, args.on_release, args.max_polls)
+        ledger.close()
+        exit(0)
     
     print("正在请求CCTV的API...")
     data = get_cctv_news_weekly()
     latest_video_guid = data['data']['list'][0]['guid']
     print(f"最新视频ID: {latest_video_guid}")
 
-    if latest_video_guid == passed['latest_video_guid'] and not force_run:
+    if ledger.is_done(latest_video_guid, 'released') and not force_run:
         print("已获取过，跳过")
-        with open("status.txt", "w", encoding="utf-8") as f:
-            f.write("false")
+        write_status(False)
+        ledger.close()
         exit(0)
 
-    video_url, title,segments, tag = get_video_info(latest_video_guid)
-    print(f"视频URL: {video_url}")
-    print(f"视频标题: {title}")
-
-    # 写入提交信息
-    with open("release_info.txt", "w", encoding="utf-8") as f:
-        f.write(f"---\n\n")
-        f.write(f"视频标题: {title}\n\n")
-        f.write(f"视频标签: {tag}\n\n")
-        f.write(f"---\n\n")
-        f.write(f"视频内容如下：\n\n")
-        for segment in segments:
-            f.write(f"- {segment["title"]}\n\n")
-        f.write(f"---\n\n")
-
-    time_tag = title.split(' ')[1]
-    with open("time.txt", "w", encoding="utf-8") as f:
-        f.write(time_tag)
-
-    # 创建下载器实例
-    downloader = M3U8Downloader(
-        max_workers = 20,      # 20个并发线程
-        timeout = 30,         # 30秒超时
-        retry_times = 3       # 重试3次
-    )
-        
-    print("=" * 50)
-    
-    success = downloader.download_m3u8(
-        m3u8_url=video_url,
-        output_dir="downloads",
-        filename=title
-    )
-    # success = True
-    if success:
-        print("下载成功！")
-        
-        # 分离音频
-        print("=" * 50)
-        print("开始分离音频...")
-        
-        try: 
-            video_path = f"downloads/{title}.mp4"
-            audio_path = f"downloads/{title}.mp3"
-            
-            if os.path.exists(video_path):
-                audio_success = extract_audio_from_video(video_path, audio_path)
-                if audio_success:
-                    print("🎉 音频分离完成！")
-                else:
-                    print("💥 音频分离失败！")
-            else:
-                print(f"错误: 视频文件 '{video_path}' 不存在")
-                
-        except ImportError:
-            print("警告: 无法导入 audio_extractor 模块")
-            print("请确保已安装 moviepy: pip install moviepy")
-        except Exception as e:
-            print(f"音频分离过程中出现错误: {e}")
-
-    # 生成字幕
-    # audio_path = "downloads/《新闻周刊》 20250802.mp3"
-    print("=" * 50)
-    print("开始生成字幕...")
-    status = False
-    while not status:
-        status = get_sub_from_ai(audio_path)
-        if status:
-            print("字幕生成完成！")
-        else:
-            print("字幕生成失败！")
-
-    # 保存到passed.json
-    passed['latest_video_guid'] = latest_video_guid
-    write_passed_file(passed)
-    with open("status.txt", "w", encoding="utf-8") as f:
-        f.write("true")
+    result = process_episode(latest_video_guid, "downloads", variant_policy, pipelined=args.pipeline, ledger=ledger)
+    if not result['ok']:
+        write_status(False)
+        ledger.close()
+        exit(1)
 
-    
-    
\ No newline at end of file
+    # 发布素材已就绪，由workflow创建release；上传成功后 main.py --mark-released 才记录 released，
+    # 发布步骤失败时下次运行会重新处理这一期
+    ledger.close()
+    write_status(True)
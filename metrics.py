@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+# Prometheus指标名前缀
+PREFIX = "cctv_news"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    记录观测值并计算分位数
+
+    超过 max_samples 后用水库抽样保留均匀样本，内存占用有上限；count/sum 始终精确。
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self.samples[slot] = value
+
+    def percentile(self, q):
+        """q取0~1，没有样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        result = {'count': self.count, 'sum': self.sum}
+        for q in QUANTILES:
+            result[f"p{int(q * 100)}"] = self.percentile(q)
+        return result
+
+
+class ProgressRenderer:
+    """
+    限频的进度输出：最多每 interval 秒打印一行，完成时再打印一行
+
+    替代逐片段打印，大量片段并发完成时不会刷屏，也不会让工作线程争抢stdout。
+    """
+
+    def __init__(self, label, total, interval=2.0, stream=None):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.completed = 0
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, count=1, size=0):
+        with self._lock:
+            self.completed += count
+            self.bytes += size
+            now = time.monotonic()
+            if self.completed < self.total and now - self._last < self.interval:
+                return
+            self._last = now
+            elapsed = max(now - self._started, 1e-6)
+            percent = self.completed / self.total * 100 if self.total else 100.0
+            line = (f"{self.label}: {self.completed}/{self.total} ({percent:.1f}%) "
+                    f"{self.bytes / 1024 / 1024 / elapsed:.2f} MB/s")
+        print(line, file=self.stream, flush=True)
+
+
+class Metrics:
+    """
+    一次运行的指标汇总
+
+    - stage(name): 上下文管理器，累计各阶段墙钟时间
+    - add_bytes(stage, n): 各阶段传输/处理的字节数
+    - observe(name, value): 延迟等分布，报告中给出 p50/p95/p99
+    - incr(name, n): 重试、失败等计数
+    运行结束时 write_report() 输出JSON与Prometheus textfile两种格式。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {}
+            self.histograms = {}
+            self.counters = {}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0, 'bytes': 0, 'runs': 0})
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                entry = self._stage(name)
+                entry['seconds'] += elapsed
+                entry['runs'] += 1
+
+    def add_bytes(self, stage, size):
+        with self._lock:
+            self._stage(stage)['bytes'] += size
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def progress(self, label, total, interval=2.0):
+        return ProgressRenderer(label, total, interval)
+
+    def report(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'wall_seconds': time.time() - self.started_at,
+                'stages': {name: dict(entry) for name, entry in self.stages.items()},
+                'histograms': {name: hist.summary() for name, hist in self.histograms.items()},
+                'counters': dict(self.counters)
+            }
+
+    def prometheus(self):
+        """Prometheus textfile collector 格式"""
+        report = self.report()
+        lines = [f"# TYPE {PREFIX}_run_seconds gauge",
+                 f"{PREFIX}_run_seconds {report['wall_seconds']:.3f}",
+                 f"# TYPE {PREFIX}_stage_seconds gauge",
+                 f"# TYPE {PREFIX}_stage_bytes gauge"]
+        for name, entry in report['stages'].items():
+            lines.append(f'{PREFIX}_stage_seconds{{stage="{name}"}} {entry["seconds"]:.3f}')
+            lines.append(f'{PREFIX}_stage_bytes{{stage="{name}"}} {entry["bytes"]}')
+        for name, summary in report['histograms'].items():
+            lines.append(f"# TYPE {PREFIX}_{name} summary")
+            for q in QUANTILES:
+                value = summary[f"p{int(q * 100)}"]
+                if value is not None:
+                    lines.append(f'{PREFIX}_{name}{{quantile="{q}"}} {value:.6f}')
+            lines.append(f"{PREFIX}_{name}_sum {summary['sum']:.6f}")
+            lines.append(f"{PREFIX}_{name}_count {summary['count']}")
+        for name, value in report['counters'].items():
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, output_dir="metrics"):
+        """
+        写出 metrics.json 与 metrics.prom，并打印各阶段耗时摘要
+
+        Returns:
+            dict: 报告内容
+        """
+        report = self.report()
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        # textfile collector 会读到写了一半的文件，先写临时文件再替换
+        prom_path = os.path.join(output_dir, "metrics.prom")
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(prom_path + ".tmp", prom_path)
+
+        if report['stages']:
+            print("各阶段耗时: " + ", ".join(
+                f"{name} {entry['seconds']:.1f}s/{entry['bytes'] / 1024 / 1024:.1f}MB"
+                for name, entry in report['stages'].items()
+            ))
+        return report
+
+
+# 进程内共享的指标汇总，各模块默认写入这里
+METRICS = Metrics()
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import argparse
+
+from segment_journal import file_sha256
+
+REPO = "thun888/News_Weekly"
+API_URL = "https://api.github.com"
+# 站点构建时直接读取这个目录，同时作为静态文件发布在 /catalog/ 下
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web', 'public', 'catalog')
+# 站点分页（web/src/catalog.ts）读取index.json中的page_size，两边每页条数一致
+PAGE_SIZE = 30
+VERSION = 1
+
+
+def _api_headers(token=None):
+    headers = {'Accept': 'application/vnd.github+json'}
+    if token:
+        headers['Authorization'] = f"token {token}"
+    return headers
+
+
+def fetch_release(tag, repo=REPO, token=None, session=None, api_url=API_URL):
+    """
+    读取GitHub上指定tag的release（含已上传文件的实际名称与下载地址）
+
+    Returns:
+        dict: GitHub API返回的release
+    """
+    import requests
+
+    session = session or requests.Session()
+    response = session.get(f"{api_url}/repos/{repo}/releases/tags/{tag}", headers=_api_headers(token), timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def collect_assets(paths):
+    """展开文件与目录（递归）为待上传的素材文件列表，按文件名排序"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names)
+        elif os.path.isfile(path):
+            files.append(path)
+    return sorted(files, key=os.path.basename)
+
+
+def match_assets(assets, asset_paths):
+    """
+    把release中的文件与上传前的本地文件对应起来
+
+    GitHub会改写文件名（空格、中文等字符被替换或去掉），先按文件名匹配，
+    其余的按大小匹配（只在大小唯一时）。
+
+    Returns:
+        dict: {release中的文件名: 本地路径}
+    """
+    local = {os.path.basename(path): path for path in asset_paths}
+    matched = {}
+    for asset in assets:
+        if asset['name'] in local:
+            matched[asset['name']] = local.pop(asset['name'])
+    by_size = {}
+    for path in local.values():
+        by_size.setdefault(os.path.getsize(path), []).append(path)
+    for asset in assets:
+        candidates = by_size.get(asset['size'], [])
+        if asset['name'] not in matched and len(candidates) == 1:
+            matched[asset['name']] = candidates[0]
+    return matched
+
+
+def build_entry(release, title=None, guid=None, tag=None, segments=(), asset_paths=()):
+    """
+    由GitHub API返回的release生成一期节目的目录条目
+
+    文件名与下载地址取自API（GitHub可能改写了文件名，不能由本地文件名拼出）；
+    能对应到本地文件的，附上内容哈希。
+
+    Args:
+        release: fetch_release() 返回的release
+        title: 节目标题，默认用release的名称
+        guid: 视频GUID
+        tag: 视频标签
+        segments: 各片段标题
+        asset_paths: 上传到release的本地文件，用于计算sha256
+
+    Returns:
+        dict: 目录条目
+    """
+    assets = release.get('assets', [])
+    local = match_assets(assets, asset_paths)
+    return {
+        'release': release['tag_name'],
+        'guid': guid,
+        'title': title or release.get('name') or release['tag_name'],
+        'tag': tag,
+        'segments': list(segments),
+        'url': release['html_url'],
+        'assets': [{
+            'name': asset['name'],
+            'size': asset['size'],
+            'sha256': file_sha256(local[asset['name']]) if asset['name'] in local else None,
+            'url': asset['browser_download_url']
+        } for asset in assets],
+        'added_at': int(time.time())
+    }
+
+
+class ReleaseCatalog:
+    """
+    预先计算好的静态发布目录，供站点在构建时读取，不再逐次请求GitHub API
+
+    - index.json: 总条数、每页条数、各分页的文件名/条数/首末期，以及 release → 页号 的对应
+    - page-0001.json, page-0002.json ...: 按发布顺序（从旧到新）存放条目，每页 page_size 条
+
+    新的一期只追加到最后一页（满了就开新页），只重写这一页和 index.json；已满的分页不再变化，
+    可以长期缓存。同一个release再次加入时原地替换所在分页中的条目。
+    """
+
+    def __init__(self, root=CATALOG_DIR, page_size=PAGE_SIZE):
+        """
+        Args:
+            root: 目录所在文件夹
+            page_size: 新建目录时每页的条数（已有目录沿用index.json中的值）
+        """
+        self.root = root
+        self.index = self._read('index.json') or {
+            'version': VERSION,
+            'page_size': page_size,
+            'total': 0,
+            'pages': [],
+            'releases': {},
+            'updated_at': None
+        }
+        self.page_size = self.index['page_size']
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.root, name), 'r', encoding='utf-8') as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, name, data):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, ensure_ascii=False, indent=1)
+            fp.write('\n')
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def page_name(number):
+        return f"page-{number:04d}.json"
+
+    def page(self, number):
+        """读取第number页（从1开始）的条目"""
+        return (self._read(self.page_name(number)) or {}).get('items', [])
+
+    def add(self, entry):
+        """
+        加入一期节目
+
+        Returns:
+            int: 条目所在的页号
+        """
+        release = entry['release']
+        number = self.index['releases'].get(release)
+        if number is not None:
+            items = [entry if item['release'] == release else item for item in self.page(number)]
+        else:
+            pages = self.index['pages']
+            if not pages or pages[-1]['count'] >= self.page_size:
+                pages.append({'file': self.page_name(len(pages) + 1), 'count': 0})
+            number = len(pages)
+            items = self.page(number) + [entry]
+            self.index['releases'][release] = number
+            self.index['total'] += 1
+
+        # 先写分页再写索引，读者看到的索引总能在分页中找到对应条目
+        self._write(self.page_name(number), {'page': number, 'items': items})
+        self.index['pages'][number - 1].update(count=len(items), first=items[0]['release'],
+                                               last=items[-1]['release'])
+        self.index['updated_at'] = int(time.time())
+        self._write('index.json', self.index)
+        return number
+
+    def __contains__(self, release):
+        return release in self.index['releases']
+
+    def __len__(self):
+        return self.index['total']
+
+    def latest(self, count=10):
+        """最新的count期，从新到旧"""
+        entries = []
+        for number in range(len(self.index['pages']), 0, -1):
+            entries.extend(reversed(self.page(number)))
+            if len(entries) >= count:
+                break
+        return entries[:count]
+
+
+def import_github(catalog, repo=REPO, token=None, session=None):
+    """
+    从GitHub releases一次性导入历史期数（逐页读取全部release，从旧到新加入），已在目录中的跳过
+
+    只用于初始化目录；之后每期由流水线在发布后追加。导入的条目没有sha256。
+
+    Returns:
+        int: 新加入的条数
+    """
+    import requests
+
+    session = session or requests.Session()
+    headers = _api_headers(token)
+    releases = []
+    url = f"{API_URL}/repos/{repo}/releases?per_page=100"
+    while url:
+        response = session.get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+        releases.extend(response.json())
+        url = response.links.get('next', {}).get('url')
+
+    added = 0
+    for release in sorted(releases, key=lambda item: item.get('published_at') or item.get('created_at') or ''):
+        if release.get('draft') or release['tag_name'] in catalog:
+            continue
+        catalog.add(build_entry(release))
+        added += 1
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='静态发布目录')
+    parser.add_argument('--root', default=CATALOG_DIR, help='目录所在文件夹 (默认: web/public/catalog)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='发布后追加一期')
+    add_parser.add_argument('info', help='main.py写出的 release_info.json')
+    add_parser.add_argument('assets', nargs='*', help='上传到release的本地文件或目录，用于计算sha256')
+    add_parser.add_argument('--repo', default=REPO, help=f'GitHub仓库 (默认: {REPO})')
+    add_parser.add_argument('--token', default=os.getenv('GITHUB_TOKEN'), help='GitHub token (默认: $GITHUB_TOKEN)')
+
+    import_parser = subparsers.add_parser('import', help='从GitHub releases导入历史期数')
+    import_parser.add_argument('--repo', default=REPO, help=f'GitHub仓库 (默认: {REPO})')
+    import_parser.add_argument('--token', default=os.getenv('GITHUB_TOKEN'), help='GitHub token (默认: $GITHUB_TOKEN)')
+
+    show_parser = subparsers.add_parser('show', help='列出最新几期')
+    show_parser.add_argument('-n', '--count', type=int, default=10, help='条数 (默认: 10)')
+    args = parser.parse_args()
+
+    catalog = ReleaseCatalog(args.root)
+    if args.command == 'add':
+        with open(args.info, 'r', encoding='utf-8') as fp:
+            info = json.load(fp)
+        release = fetch_release(info['release'], args.repo, args.token)
+        asset_paths = collect_assets(args.assets)
+        entry = build_entry(release, info['title'], guid=info.get('guid'), tag=info.get('tag'),
+                            segments=info.get('segments', ()), asset_paths=asset_paths)
+        missing = len(asset_paths) - sum(asset['sha256'] is not None for asset in entry['assets'])
+        if missing:
+            print(f"警告: {missing} 个本地文件没有在release中找到对应的文件")
+        number = catalog.add(entry)
+        print(f"已加入 {entry['release']}（第 {number} 页，{len(entry['assets'])} 个文件），共 {len(catalog)} 期")
+    elif args.command == 'import':
+        print(f"导入 {import_github(catalog, args.repo, args.token)} 期，共 {len(catalog)} 期")
+    else:
+        for entry in catalog.latest(args.count):
+            print(f"{entry['release']} {entry['title']} ({len(entry['assets'])} 个文件)")
+        print(f"共 {len(catalog)} 期，{len(catalog.index['pages'])} 页")
+
+
+if __name__ == "__main__":
+    main()
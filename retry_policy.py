@@ -0,0 +1,164 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from metrics import METRICS
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryError(Exception):
+    """重试次数或时间预算耗尽"""
+
+    def __init__(self, message, response=None, error=None):
+        super().__init__(message)
+        self.response = response
+        self.error = error
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败 failure_threshold 次后打开，打开期间直接拒绝请求；
+    reset_timeout 秒后进入半开状态放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self.clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """是否允许发出请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self.clock() - self._opened_at >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+
+
+class RetryPolicy:
+    """
+    带指数退避、随机抖动、Retry-After 与总时间预算的重试策略
+
+    用法:
+        policy = RetryPolicy(max_attempts=5, deadline=300)
+        response = policy.call(session.get, url, timeout=30)
+
+    func 应返回 requests.Response 或抛出 requests.RequestException。
+    状态码在 retry_statuses 中、或抛出网络异常时重试；其他响应原样返回。
+    次数/时间预算耗尽时抛出 RetryError，熔断器打开时抛出 CircuitOpenError。
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=30.0, deadline=None,
+                 retry_statuses=RETRY_STATUSES, breaker=None, sleep=time.sleep, clock=time.monotonic,
+                 name="http"):
+        """
+        Args:
+            max_attempts: 最大尝试次数（含第一次）
+            base_delay: 第一次重试前的退避基数（秒）
+            max_delay: 单次退避上限（秒）
+            deadline: 从第一次请求起的总时间预算（秒），None为不限
+            retry_statuses: 需要重试的HTTP状态码
+            breaker: 共享的 CircuitBreaker，None为不熔断
+            name: 指标名前缀，重试与最终失败分别计入 <name>_retries / <name>_failures
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+        self.breaker = breaker
+        self.sleep = sleep
+        self.clock = clock
+        self.name = name
+
+    def backoff(self, attempt):
+        """第attempt次失败后的退避时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, func, *args, **kwargs):
+        started = self.clock()
+        response = None
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            if self.breaker and not self.breaker.allow():
+                raise CircuitOpenError("连续失败过多，熔断器已打开")
+            response, error = None, None
+            try:
+                response = func(*args, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            if error is None and response.status_code not in self.retry_statuses:
+                if self.breaker:
+                    self.breaker.record_success()
+                return response
+            if self.breaker:
+                self.breaker.record_failure()
+
+            if attempt == self.max_attempts:
+                break
+            delay = self.backoff(attempt)
+            retry_after = parse_retry_after(response) if response is not None else None
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if self.deadline is not None and self.clock() + delay - started > self.deadline:
+                break
+            reason = error if error is not None else f"HTTP {response.status_code}"
+            print(f"请求失败 ({reason})，{delay:.1f} 秒后重试 ({attempt}/{self.max_attempts})")
+            METRICS.incr(f"{self.name}_retries")
+            self.sleep(delay)
+
+        reason = error if error is not None else f"HTTP {response.status_code}"
+        METRICS.incr(f"{self.name}_failures")
+        raise RetryError(f"重试 {attempt} 次后仍失败: {reason}", response=response, error=error)
+
+
+def parse_retry_after(response):
+    """解析 Retry-After 头（秒数或HTTP日期），没有时返回None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
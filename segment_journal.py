@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class SegmentJournal:
+    """
+    片段下载日志，用于断点续传
+
+    日志为 JSON Lines 格式，第一行记录任务信息，之后每完成一个片段追加一行：
+    {"index": 0, "url": "...", "size": 1024, "sha256": "...", "location": "file"}
+    location 为 "file" 表示片段保存在 segment_XXXXXX.ts 中，
+    为 "output" 表示片段已按顺序写入最终文件的 offset 处。
+    进程中途被杀时最多丢失最后一行，加载时会忽略不完整的行。
+    """
+
+    def __init__(self, path, m3u8_url, ts_urls):
+        """
+        Args:
+            path: 日志文件路径
+            m3u8_url: m3u8文件URL
+            ts_urls: 本次任务的全部ts片段URL
+        """
+        self.path = path
+        self.m3u8_url = m3u8_url
+        self.ts_urls = ts_urls
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._fp = None
+        self._job = {
+            'type': 'job',
+            'm3u8_url': m3u8_url,
+            'count': len(ts_urls),
+            'urls_sha256': hashlib.sha256('\n'.join(ts_urls).encode('utf-8')).hexdigest()
+        }
+
+    def load(self):
+        """读取已有日志，任务不一致时丢弃旧记录。返回已记录的片段数"""
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                lines = fp.read().split('\n')
+            try:
+                job = json.loads(lines[0])
+            except (json.JSONDecodeError, IndexError):
+                job = None
+            if job == self._job:
+                for line in lines[1:]:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    index = entry.get('index')
+                    if isinstance(index, int) and 0 <= index < len(self.ts_urls) \
+                            and entry.get('url') == self.ts_urls[index]:
+                        self.entries[index] = entry
+            else:
+                print("下载日志与当前任务不一致，重新开始")
+        self._rewrite()
+        return len(self.entries)
+
+    def record(self, index, size, sha256, location, offset=None):
+        """记录一个已完成的片段"""
+        entry = {
+            'index': index,
+            'url': self.ts_urls[index],
+            'size': size,
+            'sha256': sha256,
+            'location': location
+        }
+        if offset is not None:
+            entry['offset'] = offset
+        with self._lock:
+            self.entries[index] = entry
+            self._fp.write(json.dumps(entry) + '\n')
+            self._fp.flush()
+
+    def forget(self, index):
+        """片段校验失败，从内存记录中移除（日志文件在下次 load 时压缩）"""
+        with self._lock:
+            self.entries.pop(index, None)
+
+    def missing(self):
+        """返回尚未完成的片段序号"""
+        return [i for i in range(len(self.ts_urls)) if i not in self.entries]
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def remove(self):
+        """任务完成后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _rewrite(self):
+        """用当前有效记录重写日志，去掉重复与损坏的行"""
+        self.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            fp.write(json.dumps(self._job) + '\n')
+            for index in sorted(self.entries):
+                fp.write(json.dumps(self.entries[index]) + '\n')
+        os.replace(tmp_path, self.path)
+        self._fp = open(self.path, 'a', encoding='utf-8')
+
+
+def file_sha256(path, offset=0, size=None):
+    """计算文件（或其中一段）的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        remaining = size
+        while remaining is None or remaining > 0:
+            chunk = fp.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
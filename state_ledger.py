@@ -0,0 +1,208 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+from segment_journal import file_sha256
+
+# 一期节目依次经过的阶段
+STAGES = ('listed', 'downloaded', 'extracted', 'transcribed', 'released')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    guid TEXT PRIMARY KEY,
+    title TEXT,
+    updated_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stages (
+    guid TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    artifact TEXT,
+    sha256 TEXT,
+    bytes INTEGER,
+    duration REAL,
+    updated_at REAL,
+    PRIMARY KEY (guid, stage)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+class StateLedger:
+    """
+    按GUID记录每期节目各阶段状态的SQLite账本（WAL模式）
+
+    每个阶段记录状态（done/failed）、产物路径、内容哈希、字节数与耗时，
+    主键为 (guid, stage)，查询都走主键索引，跟踪上千期节目也是O(1)查找。
+    stage_valid() 在产物仍存在且大小一致时才认为阶段有效，main.py 据此跳过已完成的阶段。
+    数据库只保存元数据，体积很小，可由 gist.py 同步。
+    """
+
+    def __init__(self, path="state.db"):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def record(self, guid, stage, status="done", artifact=None, size=None, sha256=None, duration=None,
+               title=None):
+        """
+        记录一个阶段的结果
+
+        Args:
+            guid: 视频GUID
+            stage: STAGES 之一
+            status: "done" 或 "failed"
+            artifact: 产物路径；给出且文件存在时自动补全字节数与哈希
+            size: 产物字节数
+            sha256: 产物内容哈希
+            duration: 阶段耗时（秒）
+            title: 节目标题
+        """
+        if stage not in STAGES:
+            raise ValueError(f"未知阶段: {stage}")
+        if artifact and status == "done" and os.path.isfile(artifact):
+            if size is None:
+                size = os.path.getsize(artifact)
+            if sha256 is None:
+                sha256 = file_sha256(artifact)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO episodes (guid, title, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(guid) DO UPDATE SET title = COALESCE(excluded.title, title), "
+                "updated_at = excluded.updated_at",
+                (guid, title, now)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (guid, stage, status, artifact, sha256, bytes, duration, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (guid, stage, status, artifact, sha256, size, duration, now)
+            )
+            self._conn.execute("COMMIT")
+
+    def stage(self, guid, stage):
+        """返回某阶段的记录（dict），没有时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM stages WHERE guid = ? AND stage = ?", (guid, stage)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def stages(self, guid):
+        """返回一期节目所有阶段的记录 {stage: dict}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM stages WHERE guid = ?", (guid,)).fetchall()
+        return {row['stage']: dict(row) for row in rows}
+
+    def is_done(self, guid, stage):
+        entry = self.stage(guid, stage)
+        return entry is not None and entry['status'] == "done"
+
+    def stage_valid(self, guid, stage, verify_hash=False):
+        """
+        阶段已完成且产物仍然可用
+
+        Args:
+            verify_hash: 同时校验内容哈希（需要完整读一遍文件）
+        Returns:
+            str: 有效时返回产物路径（没有产物的阶段返回空字符串）；无效返回None
+        """
+        entry = self.stage(guid, stage)
+        if entry is None or entry['status'] != "done":
+            return None
+        artifact = entry['artifact']
+        if not artifact:
+            return ""
+        if not os.path.isfile(artifact):
+            return None
+        if entry['bytes'] is not None and os.path.getsize(artifact) != entry['bytes']:
+            return None
+        if verify_hash and entry['sha256'] and file_sha256(artifact) != entry['sha256']:
+            return None
+        return artifact
+
+    def guids(self, stage, status="done"):
+        """返回处于某阶段某状态的所有GUID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT guid FROM stages WHERE stage = ? AND status = ?", (stage, status)
+            ).fetchall()
+        return {row['guid'] for row in rows}
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate_passed(self, passed):
+        """
+        导入旧的 passed.json 内容：latest_video_guid 与 processed_guids 视为已发布
+
+        Returns:
+            int: 导入的期数
+        """
+        guids = list(passed.get('processed_guids', []))
+        latest = passed.get('latest_video_guid')
+        if latest and latest not in guids:
+            guids.append(latest)
+        for guid in guids:
+            if not self.is_done(guid, 'released'):
+                self.record(guid, 'transcribed')
+                self.record(guid, 'released')
+        if latest and not self.get_meta('latest_video_guid'):
+            self.set_meta('latest_video_guid', latest)
+        return len(guids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看节目处理状态')
+    parser.add_argument('guid', nargs='?', help='视频GUID，不填时列出汇总')
+    parser.add_argument('--db', default='state.db', help='数据库路径 (默认: state.db)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"错误: 数据库 '{args.db}' 不存在")
+        return
+    ledger = StateLedger(args.db)
+    try:
+        if args.guid:
+            stages = ledger.stages(args.guid)
+            if not stages:
+                print(f"没有 {args.guid} 的记录")
+            for stage in STAGES:
+                if stage in stages:
+                    entry = stages[stage]
+                    print(f"{stage:12} {entry['status']:7} {entry['artifact'] or '-'} "
+                          f"{entry['bytes'] or '-'} bytes {entry['duration'] or 0:.1f}s")
+        else:
+            for stage in STAGES:
+                print(f"{stage:12} {len(ledger.guids(stage))} 期")
+            print(f"最新一期: {ledger.get_meta('latest_video_guid', '-')}")
+    finally:
+        ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+import os
+import re
+import math
+import time
+import heapq
+import sqlite3
+import argparse
+import threading
+import unicodedata
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    guid TEXT PRIMARY KEY,
+    title TEXT,
+    source TEXT,
+    cues INTEGER,
+    indexed_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cues (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    text TEXT,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS cues_guid ON cues (guid);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    cue_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (term, cue_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+) WITHOUT ROWID;
+"""
+
+# 汉字连续段与字母数字词
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+# 汉字之间的空白（转写结果中常见）
+_CJK_SPACE_RE = re.compile(r'(?<=[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])\s+(?=[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])')
+_SRT_TIME_RE = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)')
+# BM25参数
+K1 = 1.2
+B = 0.75
+# 最少见词项的文档频率不超过这个数时，以它为候选集，其余词项按 (term, cue_id) 主键逐个查找；
+# 否则在SQLite中合并倒排链并计算得分
+POINT_LOOKUP_LIMIT = 2000
+
+
+def normalize(text):
+    """全角转半角、大写转小写，去掉汉字之间的空白"""
+    return _CJK_SPACE_RE.sub('', unicodedata.normalize('NFKC', text).lower())
+
+
+def tokenize(text, for_query=False):
+    """
+    中文按相邻两字切分（bigram），字母数字按词切分
+
+    建索引时每个汉字段的最后一个字另外作为单字词项，单字查询按前缀扫描bigram时不会漏掉段尾的字；
+    查询时只有单独的一个汉字才是单字词项。
+
+    Returns:
+        list: 词项列表（含重复）
+    """
+    terms = []
+    for run in _TOKEN_RE.findall(normalize(text)):
+        if run[0].isascii() or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if not for_query:
+                terms.append(run[-1])
+    return terms
+
+
+def parse_srt(content):
+    """
+    解析SRT文本
+
+    Returns:
+        list: [{'start': 秒, 'end': 秒, 'text': 文本}, ...]
+    """
+    segments = []
+    for block in re.split(r'\n\s*\n', content.replace('\r\n', '\n').strip()):
+        lines = block.strip().split('\n')
+        for i, line in enumerate(lines):
+            match = _SRT_TIME_RE.search(line)
+            if match:
+                values = [int(value) for value in match.groups()]
+                segments.append({
+                    'start': values[0] * 3600 + values[1] * 60 + values[2] + values[3] / 1000,
+                    'end': values[4] * 3600 + values[5] * 60 + values[6] + values[7] / 1000,
+                    'text': " ".join(text.strip() for text in lines[i + 1:] if text.strip())
+                })
+                break
+    return segments
+
+
+def format_timestamp(seconds):
+    total = int(seconds)
+    return f"{total // 3600:02d}:{total // 60 % 60:02d}:{total % 60:02d}"
+
+
+class SubtitleIndex:
+    """
+    字幕全文索引（SQLite倒排索引）
+
+    每条字幕（cue）是一个文档，倒排链 postings 以 (term, cue_id) 为主键聚簇存储，
+    查询一个词项就是一次主键范围扫描。每期节目在一个事务内增量加入，重新加入同一期时
+    先按原文重新切词删除旧的倒排项，不需要重建索引。查询按BM25排序，包含完整查询串的字幕加权。
+    """
+
+    def __init__(self, path="subtitle_index.db"):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def has_episode(self, guid):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM episodes WHERE guid = ?", (guid,)).fetchone() is not None
+
+    def add_episode(self, guid, segments, title=None, source=None):
+        """
+        加入（或替换）一期节目的字幕
+
+        Args:
+            guid: 视频GUID
+            segments: [{'start', 'end', 'text'}, ...]，与 convert_words_to_srt 的输入相同
+            title: 节目标题
+            source: 字幕文件路径
+        Returns:
+            int: 加入的字幕条数
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove_locked(guid)
+                df = {}
+                total_length = 0
+                count = 0
+                for segment in segments:
+                    text = (segment.get('text') or '').strip()
+                    terms = tokenize(text)
+                    if not terms:
+                        continue
+                    cursor = conn.execute(
+                        "INSERT INTO cues (guid, start_time, end_time, text, length) VALUES (?, ?, ?, ?, ?)",
+                        (guid, segment['start'], segment['end'], text, len(terms))
+                    )
+                    counts = {}
+                    for term in terms:
+                        counts[term] = counts.get(term, 0) + 1
+                    conn.executemany("INSERT INTO postings (term, cue_id, tf, length) VALUES (?, ?, ?, ?)",
+                                     [(term, cursor.lastrowid, tf, len(terms)) for term, tf in counts.items()])
+                    for term in counts:
+                        df[term] = df.get(term, 0) + 1
+                    total_length += len(terms)
+                    count += 1
+                conn.executemany("INSERT INTO terms (term, df) VALUES (?, ?) "
+                                 "ON CONFLICT(term) DO UPDATE SET df = df + excluded.df", df.items())
+                self._add_meta_locked('cues', count)
+                self._add_meta_locked('length', total_length)
+                conn.execute("INSERT INTO episodes (guid, title, source, cues, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                             (guid, title, source, count, time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def add_srt(self, path, guid, title=None):
+        """解析SRT文件并加入索引，返回字幕条数"""
+        with open(path, 'r', encoding='utf-8') as f:
+            segments = parse_srt(f.read())
+        return self.add_episode(guid, segments, title=title, source=path)
+
+    def remove_episode(self, guid):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove_locked(guid)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _remove_locked(self, guid):
+        conn = self._conn
+        rows = conn.execute("SELECT id, text, length FROM cues WHERE guid = ?", (guid,)).fetchall()
+        if not rows:
+            conn.execute("DELETE FROM episodes WHERE guid = ?", (guid,))
+            return
+        df = {}
+        for row in rows:
+            # 倒排项没有按cue_id的索引：按原文重新切词，逐个主键删除
+            terms = set(tokenize(row['text']))
+            conn.executemany("DELETE FROM postings WHERE term = ? AND cue_id = ?",
+                             [(term, row['id']) for term in terms])
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+        conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in df.items()])
+        conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0", [(term,) for term in df])
+        conn.execute("DELETE FROM cues WHERE guid = ?", (guid,))
+        conn.execute("DELETE FROM episodes WHERE guid = ?", (guid,))
+        self._add_meta_locked('cues', -len(rows))
+        self._add_meta_locked('length', -sum(row['length'] for row in rows))
+
+    def _add_meta_locked(self, key, delta):
+        self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) "
+                           "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value", (key, delta))
+
+    def _meta_locked(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else 0
+
+    def search(self, query, limit=20, match_all=True):
+        """
+        查询字幕
+
+        Args:
+            query: 查询文本，中文按bigram切分；单个汉字按前缀匹配
+            limit: 最多返回的条数
+            match_all: True时要求包含全部词项，False时包含任一词项即可
+        Returns:
+            list: [{'guid', 'title', 'start', 'end', 'text', 'score'}, ...]，按相关度降序
+        """
+        terms = list(dict.fromkeys(tokenize(query, for_query=True)))
+        if not terms:
+            return []
+        with self._lock:
+            total = self._meta_locked('cues')
+            if not total:
+                return []
+            avg_length = self._meta_locked('length') / total
+
+            # 先查最少见的词项，AND查询时候选集最小
+            weighted = sorted((self._df_locked(term), term) for term in terms)
+            if match_all and weighted[0][0] == 0:
+                return []
+            weighted = [(math.log(1 + (total - df + 0.5) / (df + 0.5)), df, term) for df, term in weighted if df]
+            if not weighted:
+                return []
+            if match_all and weighted[0][1] <= POINT_LOOKUP_LIMIT:
+                scores = self._score_candidates_locked(weighted, avg_length)
+                top = heapq.nlargest(limit * 3, scores.items(), key=lambda item: item[1])
+            else:
+                top = self._score_sql_locked(weighted, avg_length, limit * 3, match_all)
+            if not top:
+                return []
+            # 先取 limit*3 条，再按是否包含完整查询串重排
+            rows = self._cues_locked([cue_id for cue_id, _ in top])
+        phrase = "".join(_TOKEN_RE.findall(normalize(query)))
+        hits = []
+        for cue_id, score in top:
+            row = rows[cue_id]
+            if phrase and phrase in "".join(_TOKEN_RE.findall(normalize(row['text']))):
+                score *= 1.5
+            hits.append({
+                'guid': row['guid'],
+                'title': row['title'],
+                'start': row['start_time'],
+                'end': row['end_time'],
+                'text': row['text'],
+                'score': round(score, 4)
+            })
+        hits.sort(key=lambda hit: (-hit['score'], hit['guid'], hit['start']))
+        return hits[:limit]
+
+    def _score_candidates_locked(self, weighted, avg_length):
+        """最少见的词项倒排链较短：以它为候选集，其余词项按主键逐个查找，在Python中计算BM25"""
+        candidates = None
+        postings = []
+        for idf, _, term in weighted:
+            entries = self._postings_locked(term) if candidates is None else self._postings_for_locked(term, candidates)
+            candidates = set(entries) if candidates is None else candidates & entries.keys()
+            if not candidates:
+                return {}
+            postings.append((idf, entries))
+
+        lengths = self._lengths_locked(candidates)
+        scores = {}
+        for cue_id in candidates:
+            norm = K1 * (1 - B + B * lengths[cue_id] / avg_length)
+            scores[cue_id] = sum(idf * entries[cue_id] * (K1 + 1) / (entries[cue_id] + norm)
+                                 for idf, entries in postings)
+        return scores
+
+    def _score_sql_locked(self, weighted, avg_length, limit, match_all):
+        """
+        词项都很常见（或OR查询）时，在SQLite中合并倒排链、计算BM25并取前limit条，
+        避免把数万条倒排项逐条读进Python。倒排项中冗余存储了字幕长度，不需要再关联cues表
+
+        Returns:
+            list: [(cue_id, score), ...]
+        """
+        score = f"{K1 + 1} * tf / (tf + {K1} * (1 - {B} + {B} * length / ?))"
+        if len(weighted) == 1 and not _is_prefix(weighted[0][2]):
+            # 单个词项不需要合并：沿主键扫描一条倒排链，排序取前limit条
+            idf, _, term = weighted[0]
+            return [(row[0], idf * row[1]) for row in self._conn.execute(
+                f"SELECT cue_id, {score} AS score FROM postings WHERE term = ? ORDER BY score DESC LIMIT ?",
+                (avg_length, term, limit))]
+        parts = []
+        params = []
+        for position, (idf, _, term) in enumerate(weighted):
+            if _is_prefix(term):
+                parts.append("SELECT cue_id, tf, length, ? AS k, ? AS idf FROM postings WHERE term >= ? AND term < ?")
+                params += [position, idf, term, term + '\uffff']
+            else:
+                parts.append("SELECT cue_id, tf, length, ? AS k, ? AS idf FROM postings WHERE term = ?")
+                params += [position, idf, term]
+        sql = (f"SELECT m.cue_id, SUM(m.idf * {score}) AS score FROM ({' UNION ALL '.join(parts)}) AS m "
+               f"GROUP BY m.cue_id {'HAVING COUNT(DISTINCT m.k) = ?' if match_all else ''} "
+               f"ORDER BY score DESC LIMIT ?")
+        params = [avg_length] + params + ([len(weighted)] if match_all else []) + [limit]
+        return [(row[0], row[1]) for row in self._conn.execute(sql, params)]
+
+    def _df_locked(self, term):
+        if _is_prefix(term):
+            row = self._conn.execute("SELECT SUM(df) AS df FROM terms WHERE term >= ? AND term < ?",
+                                     (term, term + '\uffff')).fetchone()
+        else:
+            row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+        return (row['df'] or 0) if row else 0
+
+    def _postings_locked(self, term):
+        if _is_prefix(term):
+            # 单字：扫描以该字开头的所有bigram
+            rows = self._conn.execute("SELECT cue_id, tf FROM postings WHERE term >= ? AND term < ?",
+                                      (term, term + '\uffff'))
+            entries = {}
+            for cue_id, tf in rows:
+                entries[cue_id] = entries.get(cue_id, 0) + tf
+            return entries
+        return dict(self._conn.execute("SELECT cue_id, tf FROM postings WHERE term = ?", (term,)).fetchall())
+
+    def _postings_for_locked(self, term, cue_ids):
+        if _is_prefix(term):
+            entries = self._postings_locked(term)
+            return {cue_id: entries[cue_id] for cue_id in cue_ids if cue_id in entries}
+        entries = {}
+        for chunk in _chunks(list(cue_ids), 500):
+            entries.update(self._conn.execute(
+                f"SELECT cue_id, tf FROM postings WHERE term = ? AND cue_id IN ({','.join('?' * len(chunk))})",
+                (term, *chunk)).fetchall())
+        return entries
+
+    def _lengths_locked(self, cue_ids):
+        lengths = {}
+        for chunk in _chunks(list(cue_ids), 500):
+            lengths.update(self._conn.execute(
+                f"SELECT id, length FROM cues WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+        return lengths
+
+    def _cues_locked(self, cue_ids):
+        rows = {}
+        for chunk in _chunks(cue_ids, 500):
+            for row in self._conn.execute(
+                    "SELECT cues.id, cues.guid, start_time, end_time, text, episodes.title FROM cues "
+                    f"LEFT JOIN episodes ON episodes.guid = cues.guid WHERE cues.id IN ({','.join('?' * len(chunk))})",
+                    chunk):
+                rows[row['id']] = row
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                'episodes': self._conn.execute("SELECT COUNT(*) FROM episodes").fetchone()[0],
+                'cues': self._meta_locked('cues'),
+                'terms': self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _is_prefix(term):
+    """查询中的单个汉字按前缀匹配所有以它开头的bigram"""
+    return len(term) == 1 and not term.isascii()
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def search(query, db_path="subtitle_index.db", limit=20, match_all=True):
+    """
+    查询字幕索引
+
+    Returns:
+        list: 按相关度排序的命中，含 guid、title、start/end（秒）、text、score；索引不存在时返回空列表
+    """
+    if not os.path.exists(db_path):
+        return []
+    index = SubtitleIndex(db_path)
+    try:
+        return index.search(query, limit=limit, match_all=match_all)
+    finally:
+        index.close()
+
+
+def build(index, srt_dir="sub_output", ledger_path=None, force=False):
+    """
+    把目录中尚未索引的SRT加入索引
+
+    有状态账本时按 transcribed 阶段记录的产物路径对应GUID，其余文件以文件名作为GUID。
+
+    Returns:
+        int: 新加入的节目数
+    """
+    guid_by_path = {}
+    if ledger_path and os.path.exists(ledger_path):
+        from state_ledger import StateLedger
+
+        ledger = StateLedger(ledger_path)
+        try:
+            for guid in ledger.guids('transcribed'):
+                artifact = (ledger.stage(guid, 'transcribed') or {}).get('artifact')
+                if artifact:
+                    guid_by_path[os.path.normpath(artifact)] = guid
+        finally:
+            ledger.close()
+
+    added = 0
+    for name in sorted(os.listdir(srt_dir)):
+        if not name.endswith('.srt'):
+            continue
+        srt_path = os.path.join(srt_dir, name)
+        guid = guid_by_path.get(os.path.normpath(srt_path), name[:-4])
+        if not force and index.has_episode(guid):
+            continue
+        count = index.add_srt(srt_path, guid, title=name[:-4])
+        print(f"已索引 {name}: {count} 条字幕")
+        added += 1
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='字幕全文索引')
+    parser.add_argument('--db', default='subtitle_index.db', help='索引数据库路径 (默认: subtitle_index.db)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = subparsers.add_parser('search', help='查询')
+    search_parser.add_argument('query', help='查询文本')
+    search_parser.add_argument('-n', '--limit', type=int, default=20, help='最多返回条数 (默认: 20)')
+    search_parser.add_argument('--any', action='store_true', help='包含任一词项即命中')
+
+    add_parser = subparsers.add_parser('add', help='加入一个SRT文件')
+    add_parser.add_argument('srt', help='SRT文件路径')
+    add_parser.add_argument('--guid', help='视频GUID (默认: 文件名)')
+    add_parser.add_argument('--title', help='节目标题 (默认: 文件名)')
+
+    build_parser = subparsers.add_parser('build', help='索引目录中尚未索引的SRT')
+    build_parser.add_argument('dir', nargs='?', default='sub_output', help='SRT目录 (默认: sub_output)')
+    build_parser.add_argument('--ledger', default='state.db', help='用于对应GUID的状态账本 (默认: state.db)')
+    build_parser.add_argument('--force', action='store_true', help='重新索引已索引的节目')
+
+    subparsers.add_parser('stats', help='索引统计')
+    args = parser.parse_args()
+
+    if args.command == 'search' and not os.path.exists(args.db):
+        print(f"错误: 索引 '{args.db}' 不存在")
+        return
+    index = SubtitleIndex(args.db)
+    try:
+        if args.command == 'search':
+            started = time.perf_counter()
+            hits = index.search(args.query, limit=args.limit, match_all=not args.any)
+            elapsed = (time.perf_counter() - started) * 1000
+            for hit in hits:
+                print(f"{hit['title'] or hit['guid']} {format_timestamp(hit['start'])} "
+                      f"[{hit['score']:.2f}] {hit['text']}")
+            print(f"{len(hits)} 条结果，耗时 {elapsed:.1f} ms")
+        elif args.command == 'add':
+            name = os.path.splitext(os.path.basename(args.srt))[0]
+            count = index.add_srt(args.srt, args.guid or name, title=args.title or name)
+            print(f"已索引 {count} 条字幕")
+        elif args.command == 'build':
+            print(f"新索引 {build(index, args.dir, args.ledger, args.force)} 期节目")
+        else:
+            stats = index.stats()
+            print(f"{stats['episodes']} 期节目，{stats['cues']} 条字幕，{stats['terms']} 个词项")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
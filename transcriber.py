@@ -0,0 +1,363 @@
+import os
+import time
+import threading
+import base64
+import tempfile
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ffmpeg_utils import find_ffmpeg, probe_duration, detect_silences, split_audio
+from retry_policy import RetryPolicy, CircuitBreaker, RetryError, CircuitOpenError
+from metrics import METRICS
+from audio_prep import OffsetMap
+
+WHISPER_MODEL = '@cf/openai/whisper-large-v3-turbo'
+
+
+def get_sub_from_ai(path: str, chunk_seconds: float = None, max_workers: int = 4, retry_times: int = 3,
+                    cache=None) -> bool:
+    """从AI获取字幕
+
+    Args:
+        path: 音频文件路径；旁边有 prepare_audio() 写出的时间对应表时，时间戳换算回原节目时间
+        chunk_seconds: 分段转写的目标时长（秒）。设置后在静音处切分音频，
+                       并发转写各段后按偏移拼接时间轴；为None时整段上传
+        max_workers: 分段转写的并发数
+        retry_times: 每段的最大尝试次数，只重试失败的分段
+        cache: TranscriptionCache，整段音频与每个分段都按内容哈希缓存
+    Returns:
+        bool: 是否成功
+    """
+    with METRICS.stage('transcribe'):
+        return _get_sub_from_ai(path, chunk_seconds, max_workers, retry_times, cache)
+
+
+def _get_sub_from_ai(path, chunk_seconds, max_workers, retry_times, cache):
+    os.makedirs("sub_output", exist_ok=True)
+    client = WhisperClient(cache=cache)
+
+    file_key = None
+    segments = None
+    if cache is not None:
+        file_key = cache.key_for_file(path, client.model, f"chunk={chunk_seconds}")
+        segments = cache.get(file_key)
+        if segments is not None:
+            print("命中转写缓存，直接生成字幕")
+
+    if segments is not None:
+        pass
+    elif chunk_seconds and find_ffmpeg():
+        segments = _transcribe_chunked(client, path, chunk_seconds, max_workers, retry_times)
+    else:
+        with open(path, 'rb') as f:
+            segments = client.transcribe(f.read(), path)
+
+    if segments is None:
+        return False
+    if file_key is not None:
+        cache.put(file_key, segments)
+    offset_map = OffsetMap.for_audio(path)
+    if offset_map is not None:
+        segments = offset_map.remap(segments)
+    write_srt(segments, path.split('/')[-1].split('.')[0])
+    return True
+
+
+def write_srt(segments, name):
+    """把segments写入 sub_output/<name>.srt"""
+    os.makedirs("sub_output", exist_ok=True)
+    srt = convert_words_to_srt(segments)
+    with open(os.path.join("sub_output", name + ".srt"), 'w', encoding='utf-8') as f:
+        f.write(srt)
+
+
+class WhisperClient:
+    """Cloudflare Workers AI 的 whisper 接口，复用同一个keep-alive会话"""
+
+    def __init__(self, model=WHISPER_MODEL, retry_policy=None, timeout=(10, 300), cache=None):
+        """
+        Args:
+            model: 模型名
+            retry_policy: 重试策略，默认最多5次、总计15分钟，连续6次失败后熔断
+            timeout: (连接超时, 读超时)
+            cache: TranscriptionCache，相同音频不重复上传
+        """
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=5, base_delay=2, max_delay=60, deadline=900,
+            breaker=CircuitBreaker(failure_threshold=6, reset_timeout=120), name="asr"
+        )
+        self.timeout = timeout
+        user_id = os.getenv("CLOUDFLARE_USER_ID")
+        api_key = os.getenv("CLOUDFLARE_API_KEY")
+        self.model = model
+        self.url = f'https://api.cloudflare.com/client/v4/accounts/{user_id}/ai/run/{model}'
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+            'Content-Type': 'application/octet-stream',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Connection': 'keep-alive',
+            'Authorization': f'Bearer {api_key}'
+        })
+
+    def transcribe(self, audio_data, label=""):
+        """
+        上传一段音频并返回whisper的segments
+
+        Returns:
+            list: segments；失败返回None
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(audio_data, self.model)
+            segments = self.cache.get(key)
+            if segments is not None:
+                METRICS.incr('asr_cache_hits')
+                return segments
+        json_data = {
+            'audio': base64.b64encode(audio_data).decode('utf-8')
+        }
+        started = time.monotonic()
+        try:
+            response = self.retry_policy.call(self.session.post, self.url, json=json_data, timeout=self.timeout)
+        except (RetryError, CircuitOpenError) as e:
+            print(f'从AI获取字幕失败: {label}, 错误信息: {e}')
+            return None
+        finally:
+            METRICS.observe('asr_request_seconds', time.monotonic() - started)
+        METRICS.add_bytes('transcribe', len(audio_data))
+        if response.status_code == 200:
+            # print(response.text)
+            segments = response.json()['result']['segments']
+            if key is not None:
+                self.cache.put(key, segments)
+            return segments
+        print(f'从AI获取字幕失败: {label}, 错误信息: {response.text}')
+        return None
+
+    @property
+    def circuit_open(self):
+        breaker = self.retry_policy.breaker
+        return breaker is not None and breaker.state == "open"
+
+
+def choose_cut_points(duration, silences, chunk_seconds):
+    """
+    选择切分点：每段目标时长chunk_seconds，尽量落在最接近目标的静音区间中点
+
+    Args:
+        duration: 音频总时长
+        silences: [(start, end), ...] 静音区间
+        chunk_seconds: 目标分段时长
+    Returns:
+        list: 升序的切分点（秒）
+    """
+    midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = []
+    last = 0.0
+    while duration - last > chunk_seconds * 1.25:
+        target = last + chunk_seconds
+        candidates = [m for m in midpoints if last + chunk_seconds * 0.5 <= m <= last + chunk_seconds * 1.25]
+        cut = min(candidates, key=lambda m: abs(m - target)) if candidates else target
+        cuts.append(cut)
+        last = cut
+    return cuts
+
+
+def shift_segments(segments, offset):
+    """把分段的时间戳平移到原音频时间轴"""
+    shifted = []
+    for segment in segments:
+        segment = dict(segment)
+        segment['start'] = segment['start'] + offset
+        segment['end'] = segment['end'] + offset
+        if isinstance(segment.get('words'), list):
+            segment['words'] = [
+                dict(word, start=word['start'] + offset, end=word['end'] + offset)
+                if 'start' in word and 'end' in word else word
+                for word in segment['words']
+            ]
+        shifted.append(segment)
+    return shifted
+
+
+def _transcribe_chunked(client, path, chunk_seconds, max_workers, retry_times):
+    """在静音处切分音频，并发转写，拼接时间轴"""
+    duration = probe_duration(path)
+    silences = detect_silences(path) if duration and duration > chunk_seconds else []
+    cuts = choose_cut_points(duration or 0, silences, chunk_seconds)
+
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        chunks = split_audio(path, cuts, chunk_dir)
+        if not chunks:
+            print("音频切分失败，改为整段上传")
+            with open(path, 'rb') as f:
+                return client.transcribe(f.read(), path)
+        print(f"音频切分为 {len(chunks)} 段，并发 {max_workers} 转写")
+        return _transcribe_chunks(client, chunks, max_workers, retry_times)
+
+
+def _transcribe_chunks(client, chunks, max_workers, retry_times, results=None):
+    """
+    并发转写已切分的音频，只重试失败的分段，按偏移拼接时间轴
+
+    Args:
+        chunks: [(chunk_path, start, end), ...]
+        results: 已完成分段的 {index: 平移后的segments}，这些分段不再转写
+    Returns:
+        list: 拼接后的segments；仍有分段失败时返回None
+    """
+    results = dict(results or {})
+    pending = [i for i in range(len(chunks)) if i not in results]
+    for attempt in range(retry_times):
+        if not pending:
+            break
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_transcribe_chunk, client, chunks[i][0]): i
+                for i in pending
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    segments = future.result()
+                except Exception as e:
+                    print(f"分段 {index} 转写出错: {e}")
+                    segments = None
+                if segments is not None:
+                    results[index] = shift_segments(segments, chunks[index][1])
+        pending = [i for i in pending if i not in results]
+        if not pending:
+            break
+        print(f"{len(pending)} 个分段转写失败 (尝试 {attempt + 1}/{retry_times})")
+        if client.circuit_open:
+            print("接口持续出错，熔断器已打开，放弃转写")
+            break
+        if attempt < retry_times - 1:
+            time.sleep(client.retry_policy.backoff(attempt + 1))
+
+    if pending:
+        return None
+    return [segment for i in range(len(chunks)) for segment in results[i]]
+
+
+class PipelinedTranscriber:
+    """
+    边下载边转写
+
+    submit() 接收 IncrementalAudioExtractor 产出的音频窗口并立即提交转写，
+    finish() 等待所有窗口完成、重试失败的窗口，再按窗口偏移拼接出完整字幕。
+    """
+
+    def __init__(self, max_workers=4, retry_times=3, cache=None, prepare=None):
+        """
+        Args:
+            max_workers: 并发转写的窗口数
+            retry_times: 每个窗口的最大尝试次数（含下载期间的第一次）
+            cache: TranscriptionCache
+            prepare: 转写前处理窗口音频的函数，接收路径并返回要上传的音频路径（如 audio_prep.prepare_for_asr）
+        """
+        self.client = WhisperClient(cache=cache)
+        self.prepare = prepare
+        self.max_workers = max_workers
+        self.retry_times = retry_times
+        self.chunks = []
+        self._results = {}
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, path, start, end):
+        """提交一个音频窗口，start/end为窗口在节目中的时间（秒）"""
+        with self._lock:
+            index = len(self.chunks)
+            self.chunks.append((path, start, end))
+        print(f"音频窗口 {index} ({start:.0f}s-{end:.0f}s) 已提取，开始转写")
+        self._futures.append(self._executor.submit(self._run, index, path, start))
+
+    def _run(self, index, path, start):
+        try:
+            if self.prepare is not None:
+                path = self.prepare(path)
+                with self._lock:
+                    self.chunks[index] = (path,) + self.chunks[index][1:]
+            segments = _transcribe_chunk(self.client, path)
+        except Exception as e:
+            print(f"音频窗口 {index} 转写出错: {e}")
+            return
+        if segments is not None:
+            with self._lock:
+                self._results[index] = shift_segments(segments, start)
+
+    def finish(self, name):
+        """
+        等待全部窗口转写完成并写出 sub_output/<name>.srt
+
+        Returns:
+            bool: 是否成功
+        """
+        self._executor.shutdown(wait=True)
+        if not self.chunks:
+            print("没有可转写的音频窗口")
+            return False
+        with self._lock:
+            results = dict(self._results)
+        if len(results) < len(self.chunks):
+            print(f"{len(self.chunks) - len(results)} 个音频窗口转写失败，重试")
+        segments = _transcribe_chunks(self.client, self.chunks, self.max_workers,
+                                      self.retry_times - 1, results=results)
+        if segments is None:
+            return False
+        write_srt(segments, name)
+        return True
+
+    def abort(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _transcribe_chunk(client, chunk_path):
+    with open(chunk_path, 'rb') as f:
+        segments = client.transcribe(f.read(), chunk_path)
+    offset_map = OffsetMap.for_audio(chunk_path)
+    if segments is not None and offset_map is not None:
+        # 窗口在转写前切除过静音，先换算回窗口内时间，再由调用方平移到节目时间
+        segments = offset_map.remap(segments)
+    return segments
+
+
+def format_srt_time(seconds: float) -> str:
+    """
+    将秒数转换为 SRT 时间格式 (HH:MM:SS,mmm)
+    """
+    ms = int((seconds % 1) * 1000)
+    total_seconds = int(seconds)
+    s = total_seconds % 60
+    m = (total_seconds // 60) % 60
+    h = total_seconds // 3600
+
+    return f"{pad(h)}:{pad(m)}:{pad(s)},{pad(ms, 3)}"
+
+def pad(num: int, size: int = 2) -> str:
+    """
+    数字补零，默认宽度为 2。如果需要毫秒则传入 size=3。
+    """
+    return str(num).zfill(size)
+
+def convert_words_to_srt(segments: list) -> str:
+    """
+    将包含 start/end/text 字段的 segments 列表转换为 SRT 格式字符串。
+    """
+    if not segments:
+        return "No transcription data."
+
+    lines = []
+    for idx, segment in enumerate(segments, start=1):
+        start_ts = format_srt_time(segment["start"])
+        end_ts = format_srt_time(segment["end"])
+        text = segment["text"]
+        lines.append(f"{idx}")
+        lines.append(f"{start_ts} --> {end_ts}")
+        lines.append(text)
+        lines.append("")  # 空行分隔
+
+    return "\n".join(lines)
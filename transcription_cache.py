@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class TranscriptionCache:
+    """
+    按音频内容哈希缓存whisper返回的segments
+
+    键为 sha256(模型名 + 参数 + 音频字节)，值为原始segments的JSON，
+    命中时可在本地重新生成SRT，不需要任何网络请求。
+    总大小超过 max_bytes 时按最近使用时间（文件mtime）淘汰最旧的条目。
+    缓存目录可以在两次运行之间保存/恢复（workflow中用actions/cache）。
+    """
+
+    def __init__(self, cache_dir="asr_cache", max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(audio_data, model, variant=""):
+        """音频字节对应的缓存键"""
+        digest = hashlib.sha256(f"{model}\0{variant}\0".encode('utf-8'))
+        digest.update(audio_data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key_for_file(path, model, variant=""):
+        """音频文件对应的缓存键（分块读取，不把整个文件读入内存）"""
+        digest = hashlib.sha256(f"{model}\0{variant}\0".encode('utf-8'))
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """返回缓存的segments，未命中返回None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fp:
+                segments = json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return segments
+
+    def put(self, key, segments):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(segments, fp, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """超过容量上限时删除最久未使用的条目"""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith('.json'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
@@ -0,0 +1,130 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TS_PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+
+
+class InvalidSegmentError(ValueError):
+    """
+    下载到的片段不是完整的MPEG-TS数据
+
+    fatal 为True表示包对齐/同步字节错误（截断、HTML错误页等），数据不可用；
+    False 表示只有连续计数器不连续，数据可能只是源站编码时就有跳变。
+    """
+
+    def __init__(self, message, fatal=True):
+        super().__init__(message)
+        self.fatal = fatal
+
+
+class TSValidator:
+    """
+    流式校验MPEG-TS片段
+
+    feed() 逐块接收下载到的数据（块边界不必与包边界对齐），finish() 返回错误信息。
+    检查 188 字节包对齐、每个包开头的 0x47 同步字节、以及各PID的连续计数器。
+    同步字节用步长切片 data[::188] 一次取出比较；连续计数器在安装了numpy时向量化检查，
+    否则逐包（而非逐字节）检查。
+    """
+
+    def __init__(self, check_continuity=True):
+        self.check_continuity = check_continuity
+        self.packets = 0
+        self.error = None
+        self.continuity_errors = 0
+        self._tail = b''
+        self._last_cc = {}
+
+    def feed(self, chunk):
+        if self.error:
+            return
+        data = self._tail + chunk if self._tail else chunk
+        usable = len(data) - len(data) % TS_PACKET_SIZE
+        self._tail = bytes(data[usable:])
+        if not usable:
+            return
+        view = memoryview(data)[:usable]
+        sync = view[::TS_PACKET_SIZE].tobytes()
+        if sync.count(SYNC_BYTE) != len(sync):
+            bad = next(i for i, b in enumerate(sync) if b != SYNC_BYTE)
+            if self.packets + bad == 0 and bytes(view[:1]) == b'<':
+                self.error = "内容不是TS数据（疑似HTML错误页）"
+            else:
+                self.error = f"第 {self.packets + bad} 个包的同步字节错误"
+            return
+        if self.check_continuity:
+            if np is not None:
+                self._check_continuity_numpy(view)
+            else:
+                self._check_continuity_packets(view)
+        self.packets += len(sync)
+
+    def finish(self):
+        """
+        Returns:
+            InvalidSegmentError: 校验失败时返回异常对象；通过时返回None
+        """
+        if self.error:
+            return InvalidSegmentError(self.error)
+        if not self.packets and self._tail[:1] == b'<':
+            return InvalidSegmentError("内容不是TS数据（疑似HTML错误页）")
+        if self._tail:
+            return InvalidSegmentError(f"长度不是188的整数倍（多出 {len(self._tail)} 字节，疑似截断）")
+        if not self.packets:
+            return InvalidSegmentError("空片段")
+        if self.continuity_errors:
+            return InvalidSegmentError(f"{self.continuity_errors} 处连续计数器不连续", fatal=False)
+        return None
+
+    def _check_continuity_packets(self, view):
+        header = [view[offset::TS_PACKET_SIZE].tobytes() for offset in (1, 2, 3, 4, 5)]
+        last_cc = self._last_cc
+        for b1, b2, b3, af_length, af_flags in zip(*header):
+            pid = ((b1 & 0x1F) << 8) | b2
+            if pid == NULL_PID or not b3 & 0x10:
+                continue
+            cc = b3 & 0x0F
+            previous = last_cc.get(pid)
+            discontinuity = b3 & 0x20 and af_length and af_flags & 0x80
+            if previous is not None and not discontinuity and cc != previous and cc != (previous + 1) & 0x0F:
+                self.continuity_errors += 1
+            last_cc[pid] = cc
+
+    def _check_continuity_numpy(self, view):
+        packets = np.frombuffer(view, dtype=np.uint8).reshape(-1, TS_PACKET_SIZE)
+        b3 = packets[:, 3]
+        pids = ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+        has_payload = (b3 & 0x10) != 0
+        discontinuity = ((b3 & 0x20) != 0) & (packets[:, 4] > 0) & ((packets[:, 5] & 0x80) != 0)
+        cc = (b3 & 0x0F).astype(np.int16)
+        for pid in np.unique(pids[has_payload]):
+            pid = int(pid)
+            if pid == NULL_PID:
+                continue
+            mask = has_payload & (pids == pid)
+            sequence = cc[mask]
+            if pid in self._last_cc:
+                sequence = np.concatenate(([self._last_cc[pid]], sequence))
+                resets = np.concatenate(([False], discontinuity[mask]))
+            else:
+                resets = discontinuity[mask]
+            step = (sequence[1:] - sequence[:-1]) & 0x0F
+            # 连续（+1）或重复包（+0）都合法；带不连续标志的包允许跳变
+            self.continuity_errors += int(np.count_nonzero((step > 1) & ~resets[1:]))
+            self._last_cc[pid] = int(sequence[-1])
+
+
+def validate_segment(data, check_continuity=True):
+    """
+    校验一个完整的片段
+
+    Returns:
+        InvalidSegmentError: 校验失败时返回异常对象；通过时返回None
+    """
+    validator = TSValidator(check_continuity)
+    validator.feed(data)
+    return validator.finish()
@@ -0,0 +1,18 @@
+// 发布目录由流水线（release_catalog.py）在每期发布后追加，构建时读取，不请求GitHub API
+const pages = import.meta.glob('../public/catalog/page-*.json', { eager: true, import: 'default' });
+const indexes = import.meta.glob('../public/catalog/index.json', { eager: true, import: 'default' });
+
+// 每页条数以目录index.json中的page_size为准，与release_catalog.py一致；目录尚未生成时用同样的默认值
+export const PAGE_SIZE: number = (Object.values(indexes)[0] as any)?.page_size ?? 30;
+
+// 从新到旧的全部期数
+export const releases: any[] = Object.keys(pages)
+  .sort()
+  .flatMap((file) => (pages[file] as any).items)
+  .reverse();
+
+export const pageCount = Math.max(1, Math.ceil(releases.length / PAGE_SIZE));
+
+export function releasePage(page: number) {
+  return releases.slice((page - 1) * PAGE_SIZE, page * PAGE_SIZE);
+}